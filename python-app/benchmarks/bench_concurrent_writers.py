@@ -0,0 +1,118 @@
+"""N processi scrivono contemporaneamente sullo stesso DB.
+
+Verifica che nessun esito vada perso e misura il throughput di ogni scrittore.
+Esce con codice 1 se mancano risultati, se uno scrittore fallisce o se lo scrittore piu' lento
+impiega piu' di --max-ratio volte la mediana (uno scrittore lasciato indietro dai lock).
+
+    python benchmarks/bench_concurrent_writers.py --writers 8 --items 200 --journal wal
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import pathlib
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from gestione_collaudo import db  # noqa: E402
+
+
+def _writer(db_path: str, project_id: int, items: list[int], opts: dict, start, results) -> None:
+    con = db.connect(db_path, **opts)
+    start.wait()
+    t0 = time.perf_counter()
+    try:
+        run_id = db.create_run(con, project_id, "bench", "writer")
+        for i, item_id in enumerate(items):
+            db.set_run_item(con, run_id, item_id, ("PASS", "FAIL", "SKIP")[i % 3], f"n{i}")
+        db.close_run(con, run_id)
+        results.put((run_id, time.perf_counter() - t0, None))
+    except Exception as exc:  # noqa: BLE001
+        results.put((0, time.perf_counter() - t0, repr(exc)))
+    finally:
+        con.close()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--writers", type=int, default=8)
+    ap.add_argument("--items", type=int, default=200)
+    ap.add_argument("--journal", choices=db.JOURNAL_MODES, default="wal")
+    ap.add_argument("--synchronous", choices=db.SYNCHRONOUS_LEVELS, default="normal")
+    ap.add_argument("--busy-timeout", type=int, default=db.DEFAULT_BUSY_TIMEOUT_MS)
+    ap.add_argument("--db", default="", help="DB da usare (default: file temporaneo)")
+    ap.add_argument(
+        "--max-ratio",
+        type=float,
+        default=4.0,
+        help="Soglia per il tempo dello scrittore piu' lento rispetto alla mediana (0 = nessuna soglia)",
+    )
+    args = ap.parse_args()
+
+    tmp = None
+    db_path = args.db
+    if not db_path:
+        tmp = tempfile.TemporaryDirectory()
+        db_path = str(pathlib.Path(tmp.name) / "bench.sqlite")
+    opts = {"journal_mode": args.journal, "synchronous": args.synchronous, "busy_timeout_ms": args.busy_timeout}
+
+    con = db.connect(db_path, **opts)
+    pid = db.create_project(con, "bench concorrenza")
+    db.replace_checklist(con, pid, [(f"Voce {i}", "bench", "") for i in range(args.items)])
+    item_ids = [it.id for it in db.list_checklist(con, pid)]
+
+    start = mp.Event()
+    results = mp.Queue()
+    procs = [
+        mp.Process(target=_writer, args=(db_path, pid, item_ids, opts, start, results)) for _ in range(args.writers)
+    ]
+    for p in procs:
+        p.start()
+    t0 = time.perf_counter()
+    start.set()
+    outcomes = [results.get() for _ in procs]
+    elapsed = time.perf_counter() - t0
+    for p in procs:
+        p.join()
+
+    errors = [e for _, _, e in outcomes if e]
+    times = [t for _, t, e in outcomes if not e and t > 0]
+    rates = [args.items / t for t in times]
+    lost = 0
+    for run_id, _, e in outcomes:
+        if e:
+            continue
+        n = con.execute("SELECT count(*) FROM run_items WHERE run_id=?", (run_id,)).fetchone()[0]
+        closed = con.execute("SELECT closed_at FROM runs WHERE id=?", (run_id,)).fetchone()[0]
+        lost += args.items - int(n)
+        if not closed:
+            errors.append(f"run {run_id} non chiuso")
+    con.close()
+
+    total = args.writers * args.items
+    print(f"journal={args.journal} synchronous={args.synchronous} writers={args.writers} items={args.items}")
+    print(f"totale scritture: {total} in {elapsed:.2f}s ({total / elapsed:.0f}/s)")
+    if rates:
+        print(
+            f"per scrittore (scritture/s): min={min(rates):.0f} mediana={statistics.median(rates):.0f} max={max(rates):.0f}"
+        )
+    if times:
+        ratio = max(times) / statistics.median(times)
+        print(f"scrittore piu' lento / mediana: {ratio:.1f}x (soglia {args.max_ratio or '-'})")
+        if args.max_ratio and ratio > args.max_ratio:
+            errors.append(f"scrittore piu' lento {ratio:.1f}x la mediana (soglia {args.max_ratio})")
+    print(f"risultati persi: {lost} | errori: {len(errors)}")
+    for e in errors:
+        print(f"  {e}", file=sys.stderr)
+    if tmp is not None:
+        tmp.cleanup()
+    return 1 if lost or errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,152 @@
+"""Memoria e tempo del livello modelli: righe sqlite3.Row + dizionari contro tuple posizionali,
+classi con __slots__ e esiti compatti (RunProgress) su `run_items` (default 1M righe).
+
+    python benchmarks/bench_models.py --runs 500 --items 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import pathlib
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from gestione_collaudo import db  # noqa: E402
+from gestione_collaudo.models import RunItem  # noqa: E402
+
+
+@dataclass(frozen=True)
+class _OldRunItem:
+    # RunItem com'era prima: senza __slots__, timestamp convertito subito.
+    id: int
+    run_id: int
+    checklist_item_id: int
+    esito: str
+    note: str
+    timestamp: datetime
+
+
+def _old_progress(con: sqlite3.Connection, run_id: int) -> dict[int, dict[str, str]]:
+    cur = con.execute("SELECT checklist_item_id, esito, note, timestamp FROM run_items WHERE run_id=?", (run_id,))
+    out: dict[int, dict[str, str]] = {}
+    for r in cur.fetchall():
+        out[int(r["checklist_item_id"])] = {
+            "esito": str(r["esito"]),
+            "note": str(r["note"]),
+            "timestamp": str(r["timestamp"]),
+        }
+    return out
+
+
+def _old_items(con: sqlite3.Connection) -> list[_OldRunItem]:
+    cur = con.execute("SELECT * FROM run_items")
+    return [
+        _OldRunItem(
+            id=int(r["id"]),
+            run_id=int(r["run_id"]),
+            checklist_item_id=int(r["checklist_item_id"]),
+            esito=str(r["esito"]),
+            note=str(r["note"]),
+            timestamp=datetime.fromisoformat(str(r["timestamp"]).replace("Z", "")),
+        )
+        for r in cur.fetchall()
+    ]
+
+
+def _new_items(con: sqlite3.Connection) -> list[RunItem]:
+    cur = con.execute("SELECT id, run_id, checklist_item_id, esito, note, timestamp FROM run_items")
+    cur.row_factory = None
+    # Esiti e timestamp ripetuti condivisi, come in db.load_run_progress.
+    seen: dict[str, str] = {}
+    return [RunItem(i, r, c, seen.setdefault(e, e), n, seen.setdefault(t, t)) for i, r, c, e, n, t in cur]
+
+
+def _populate(con: sqlite3.Connection, runs: int, items: int) -> list[int]:
+    pid = db.create_project(con, "bench modelli")
+    db.replace_checklist(con, pid, [(f"Voce {i}", f"Cat {i % 20}", "") for i in range(items)])
+    with db.transaction(con):
+        con.executemany(
+            "INSERT INTO runs(project_id, nome, operatore, started_at) VALUES(?,?,?,?)",
+            [(pid, f"Run {i}", "bench", f"2024-01-01T{i % 24:02d}:00:00Z") for i in range(runs)],
+        )
+        # Un esito per ogni voce di ogni run; una nota ogni 10 righe, un timestamp per run.
+        con.execute(
+            """
+            INSERT INTO run_items(run_id, checklist_item_id, esito, note, timestamp)
+            SELECT r.id, ci.id,
+                   CASE (r.id + ci.id) % 7 WHEN 0 THEN 'FAIL' WHEN 1 THEN 'SKIP' ELSE 'PASS' END,
+                   CASE WHEN (r.id * 31 + ci.id) % 10 = 0 THEN 'nota ' || ci.id ELSE '' END,
+                   r.started_at
+            FROM runs r JOIN checklist_items ci ON ci.project_id=r.project_id
+            WHERE r.project_id=?
+            """,
+            (pid,),
+        )
+    return [r.id for r in db.list_runs(con, pid)]
+
+
+def _measure(fn: Callable[[], object]) -> tuple[float, int, object]:
+    # Tempo (senza tracemalloc) e memoria trattenuta dal risultato (con tracemalloc, in un secondo giro).
+    gc.collect()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    del result
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed, held, result
+
+
+def _report(title: str, old: tuple[float, int, object], new: tuple[float, int, object]) -> None:
+    print(title)
+    print(f"  prima: {old[0] * 1000:8.0f} ms  {old[1] / 2**20:8.1f} MiB")
+    print(f"  dopo:  {new[0] * 1000:8.0f} ms  {new[1] / 2**20:8.1f} MiB  ({old[0] / new[0]:.2f}x tempo, {old[1] / max(new[1], 1):.1f}x memoria)")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=500)
+    ap.add_argument("--items", type=int, default=2000)
+    ap.add_argument("--db", default="", help="DB da usare (default: file temporaneo)")
+    args = ap.parse_args()
+
+    tmp = None
+    db_path = args.db
+    if not db_path:
+        tmp = tempfile.TemporaryDirectory()
+        db_path = str(pathlib.Path(tmp.name) / "bench.sqlite")
+    con = db.connect(db_path)
+    run_ids = _populate(con, args.runs, args.items)
+    total = int(con.execute("SELECT count(*) FROM run_items").fetchone()[0])
+    print(f"run_items: {total}")
+
+    old = _measure(lambda: [_old_progress(con, r) for r in run_ids])
+    new = _measure(lambda: [db.load_run_progress(con, r) for r in run_ids])
+    assert sum(len(p) for p in old[2]) == sum(len(p) for p in new[2]) == total  # type: ignore[attr-defined]
+    _report("esiti dei run (dict di dict -> RunProgress)", old, new)
+
+    old = _measure(lambda: _old_items(con))
+    new = _measure(lambda: _new_items(con))
+    _report("righe run_items (Row + datetime -> tuple + __slots__)", old, new)
+
+    con.close()
+    if tmp is not None:
+        tmp.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
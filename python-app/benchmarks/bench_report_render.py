@@ -0,0 +1,82 @@
+"""Confronto tra il rendering a due stadi (Markdown -> re-parse HTML) e il modello unico.
+
+    python benchmarks/bench_report_render.py --items 100000 --repeat 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import pathlib
+import random
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from gestione_collaudo.models import ChecklistItem, Project, Run  # noqa: E402
+from gestione_collaudo.reports import (  # noqa: E402
+    RENDERERS,
+    build_markdown_report,
+    build_report_model,
+    markdown_to_simple_html,
+    render_all,
+)
+
+
+def _dataset(n: int) -> tuple[Project, Run, list[ChecklistItem], dict[int, dict[str, str]]]:
+    rnd = random.Random(42)
+    project = Project(1, "Linea bench", "Cliente", "Sito", "", "2024-01-01T00:00:00Z")
+    run = Run(1, 1, "Run bench", "operatore", "2024-01-02T00:00:00Z", "2024-01-03T00:00:00Z")
+    checklist = [
+        ChecklistItem(i, 1, f"Voce {i}", f"Cat {i % 20}", "Valore atteso" if i % 3 else "", i) for i in range(1, n + 1)
+    ]
+    progress = {
+        it.id: {"esito": rnd.choice(("PASS", "FAIL", "SKIP")), "note": "nota" if it.id % 4 == 0 else "", "timestamp": "2024-01-02T10:00:00Z"}
+        for it in checklist
+        if rnd.random() < 0.8
+    }
+    return project, run, checklist, progress
+
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=100_000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    project, run, checklist, progress = _dataset(args.items)
+
+    def two_stage() -> None:
+        md = build_markdown_report(project, run, checklist, progress, generated_by="bench")
+        markdown_to_simple_html(md, footer="bench")
+
+    def model_md_html() -> None:
+        model = build_report_model(project, run, checklist, progress, "bench", "bench")
+        render_all(model, {"md": io.StringIO(), "html": io.StringIO()})
+
+    def model_all() -> None:
+        model = build_report_model(project, run, checklist, progress, "bench", "bench")
+        render_all(model, {fmt: io.StringIO() for fmt in RENDERERS})
+
+    t_old = _best(two_stage, args.repeat)
+    t_new = _best(model_md_html, args.repeat)
+    t_all = _best(model_all, args.repeat)
+    print(f"voci: {args.items}")
+    print(f"due stadi (MD + re-parse HTML): {t_old * 1000:.0f} ms")
+    print(f"modello (MD + HTML):            {t_new * 1000:.0f} ms  ({t_old / t_new:.2f}x)")
+    print(f"modello (MD + HTML + CSV + JSON): {t_all * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,188 @@
+"""Prova di carico dell'API di `gestione-collaudo serve`.
+
+Avvia il server su un DB sintetico (benchmarks/datagen.py) e lo interroga con `--clients` connessioni
+keep-alive per `--seconds` secondi: ogni client registra esiti singoli (quota `--writes`) e legge run e
+riepiloghi. Stampa richieste/s e latenze (p50, p99) per tipo di richiesta e quanti esiti il writer ha
+accorpato per transazione. Con `--url` misura un server gia' avviato.
+
+    python benchmarks/bench_server.py --clients 32 --seconds 10
+    python benchmarks/bench_server.py --clients 32 --max-batch 1   # senza accorpamento, per confronto
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent))
+
+import datagen  # noqa: E402
+from gestione_collaudo import db  # noqa: E402
+
+
+class Client:
+    # Client HTTP/1.1 minimo su una connessione keep-alive.
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+
+    async def request(self, method: str, path: str, body: object | None = None) -> tuple[int, bytes]:
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        data = json.dumps(body).encode() if body is not None else b""
+        self._writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+        )
+        assert self._reader is not None
+        head = (await self._reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+        status = int(head.split(" ", 2)[1])
+        length = 0
+        for line in head.split("\r\n")[1:]:
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, await self._reader.readexactly(length)
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+async def worker(
+    client: Client, deadline: float, rnd: random.Random, targets: list[tuple[int, int, list[int]]], writes: float, lat: dict
+) -> None:
+    while time.perf_counter() < deadline:
+        pid, run_id, item_ids = rnd.choice(targets)
+        r = rnd.random()
+        if r < writes:
+            kind = "POST results"
+            args = ("POST", f"/api/runs/{run_id}/results", {"checklist_item_id": rnd.choice(item_ids), "esito": rnd.choice(db.ESITI)})
+        elif r < writes + (1 - writes) * 0.6:
+            kind, args = "GET run", ("GET", f"/api/runs/{run_id}")
+        else:
+            kind, args = "GET summaries", ("GET", f"/api/projects/{pid}/summaries")
+        t0 = time.perf_counter()
+        status, _ = await client.request(*args)  # type: ignore[arg-type]
+        elapsed = time.perf_counter() - t0
+        if status >= 400:
+            raise RuntimeError(f"{args[0]} {args[1]}: HTTP {status}")
+        lat.setdefault(kind, []).append(elapsed)
+
+
+async def load(host: str, port: int, targets: list, clients: int, seconds: float, writes: float, seed: int) -> dict:
+    lat: dict[str, list[float]] = {}
+    conns = [Client(host, port) for _ in range(clients)]
+    t0 = time.perf_counter()
+    deadline = t0 + seconds
+    await asyncio.gather(*(worker(c, deadline, random.Random(seed + i), targets, writes, lat) for i, c in enumerate(conns)))
+    elapsed = time.perf_counter() - t0
+    _, health = await conns[0].request("GET", "/api/health")
+    for c in conns:
+        await c.close()
+    return {"elapsed": elapsed, "lat": lat, "health": json.loads(health)}
+
+
+def report(res: dict, clients: int) -> None:
+    lat = res["lat"]
+    total = sum(len(v) for v in lat.values())
+    print(f"{clients} client, {res['elapsed']:.1f} s: {total} richieste, {total / res['elapsed']:.0f} req/s")
+    print(f"{'richiesta':16} {'n':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for kind, values in sorted(lat.items()):
+        print(
+            f"{kind:16} {len(values):>8} {len(values) / res['elapsed']:>8.0f} {percentile(values, 50) * 1000:>8.2f} "
+            f"{percentile(values, 99) * 1000:>8.2f} {max(values) * 1000:>8.2f}"
+        )
+    every = [v for values in lat.values() for v in values]
+    print(f"{'tutte':16} {total:>8} {total / res['elapsed']:>8.0f} {percentile(every, 50) * 1000:>8.2f} {percentile(every, 99) * 1000:>8.2f}")
+    h = res["health"]
+    if h.get("transazioni_esiti"):
+        print(
+            f"writer: {h['esiti']} esiti in {h['transazioni_esiti']} transazioni "
+            f"(media {h['esiti'] / h['transazioni_esiti']:.1f}, massimo {h['lotto_max']} per transazione)"
+        )
+
+
+def start_server(db_path: str, extra: list[str]) -> tuple[subprocess.Popen, str, int]:
+    cmd = [sys.executable, "-m", "gestione_collaudo.cli", "--db", db_path, "serve", "--port", "0", *extra]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (str(ROOT), os.environ.get("PYTHONPATH")))))
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True, env=env)
+    line = proc.stdout.readline()  # type: ignore[union-attr]
+    if "http://" not in line:
+        proc.kill()
+        raise RuntimeError(f"Server non avviato: {line!r}")
+    url = urlsplit(line.split()[3])
+    return proc, url.hostname or "127.0.0.1", url.port or 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--clients", type=int, default=32)
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--writes", type=float, default=0.5, help="Quota di richieste che registrano un esito")
+    ap.add_argument("--scale", choices=tuple(datagen.SCALE), default="small", help="Dimensioni del DB generato")
+    ap.add_argument("--readers", type=int, default=None, help="Passato a serve --readers")
+    ap.add_argument("--max-batch", type=int, default=None, help="Passato a serve --max-batch (1 = nessun accorpamento)")
+    ap.add_argument("--url", default=None, help="Server gia' avviato (es. http://127.0.0.1:8765); il DB va indicato con --db")
+    ap.add_argument("--db", default=None, help="DB del server indicato con --url")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or str(pathlib.Path(tmp) / "server.sqlite")
+        con = db.connect(db_path)
+        if args.db is None:
+            datagen.populate(con, datagen.SCALE[args.scale])
+        targets = []
+        for p in db.list_projects(con):
+            runs = db.list_runs(con, p.id)
+            if runs:
+                targets.append((p.id, runs[0].id, [it.id for it in db.list_checklist(con, p.id)]))
+        con.close()
+        if not targets:
+            print("Nessun run su cui registrare esiti.", file=sys.stderr)
+            return 2
+
+        proc = None
+        if args.url:
+            url = urlsplit(args.url)
+            host, port = url.hostname or "127.0.0.1", url.port or 80
+        else:
+            extra = []
+            if args.readers is not None:
+                extra += ["--readers", str(args.readers)]
+            if args.max_batch is not None:
+                extra += ["--max-batch", str(args.max_batch)]
+            proc, host, port = start_server(db_path, extra)
+        try:
+            res = asyncio.run(load(host, port, targets, args.clients, args.seconds, args.writes, args.seed))
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait(10)
+    report(res, args.clients)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
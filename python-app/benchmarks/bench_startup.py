@@ -0,0 +1,149 @@
+"""Controllo di regressione sull'avvio della CLI.
+
+- `python -X importtime` di `new-run`: tempo totale di import entro il budget e nessun modulo pesante
+  (report, import CSV, export, multiprocessing, ...) caricato per un comando che non lo usa;
+- apertura di un DB gia' aggiornato senza DDL ne' scritture;
+- tempo reale (mediana) di `gestione-collaudo new-run`.
+
+Esce con codice 1 se un controllo fallisce.
+
+    python benchmarks/bench_startup.py --runs 20 --import-budget-ms 150 --wall-budget-ms 400
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from gestione_collaudo import db, profiling  # noqa: E402
+
+# Moduli che `new-run` non deve importare.
+FORBIDDEN = (
+    "gestione_collaudo.analytics",
+    "gestione_collaudo.export",
+    "gestione_collaudo.reports",
+    "gestione_collaudo.importers",
+    "gestione_collaudo.search",
+    "gestione_collaudo.ingest",
+    "gestione_collaudo.server",
+    "asyncio",
+    "gestione_collaudo.gui",
+    "csv",
+    "json",
+    "concurrent.futures",
+    "multiprocessing",
+    "hashlib",
+    "pathlib",
+    "tkinter",
+)
+
+# Istruzioni ammesse all'apertura di un DB gia' aggiornato: solo letture (PRAGMA e lo stato FTS
+# da sqlite_master), niente DDL ne' scritture.
+_OPEN_OK = ("PRAGMA ", "SELECT ")
+
+
+def _cli(db_path: str, *args: str) -> list[str]:
+    return [sys.executable, "-m", "gestione_collaudo.cli", "--db", db_path, *args]
+
+
+def _env() -> dict[str, str]:
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (str(ROOT), os.environ.get("PYTHONPATH")))))
+
+
+def import_times(cmd: list[str]) -> dict[str, tuple[int, int]]:
+    # modulo -> (self us, cumulativo us) dall'output di -X importtime.
+    p = subprocess.run(
+        [cmd[0], "-X", "importtime", *cmd[1:]], env=_env(), capture_output=True, text=True, check=True
+    )
+    out: dict[str, tuple[int, int]] = {}
+    for line in p.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:") :].split("|")
+        try:
+            self_us, cum_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # intestazione
+        out[parts[2].strip()] = (self_us, cum_us)
+    return out
+
+
+def open_statements(db_path: str) -> list[str]:
+    prof = profiling.enable(profiling.Profiler())
+    try:
+        con = db.connect(db_path)
+        con.close()
+    finally:
+        profiling.disable()
+    return list(prof.statements)
+
+
+def wall_times(cmd: list[str], runs: int) -> list[float]:
+    env = _env()
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=20, help="Invocazioni per la misura del tempo reale")
+    ap.add_argument("--import-budget-ms", type=float, default=150.0, help="Tempo massimo di import per new-run")
+    ap.add_argument("--wall-budget-ms", type=float, default=400.0, help="Mediana massima del tempo reale di new-run")
+    args = ap.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(pathlib.Path(tmp) / "startup.sqlite")
+        con = db.connect(db_path)
+        pid = db.create_project(con, "startup")
+        con.close()
+        new_run = _cli(db_path, "new-run", "--project-id", str(pid), "--nome", "bench")
+
+        times = import_times(new_run)
+        total_ms = sum(s for s, _ in times.values()) / 1000
+        ours = sorted(((c, m) for m, (_, c) in times.items() if m.startswith("gestione_collaudo")), reverse=True)
+        print(f"import (new-run): {total_ms:.1f} ms totali, budget {args.import_budget_ms:.0f} ms")
+        for cum, mod in ours:
+            print(f"  {cum / 1000:7.1f} ms  {mod}")
+        if total_ms > args.import_budget_ms:
+            failures.append(f"import {total_ms:.1f} ms oltre il budget")
+        loaded = [m for m in FORBIDDEN if m in times]
+        if loaded:
+            failures.append(f"moduli non necessari importati: {', '.join(loaded)}")
+
+        stmts = open_statements(db_path)
+        extra = [s for s in stmts if not s.upper().startswith(_OPEN_OK)]
+        print(f"apertura DB aggiornato: {len(stmts)} istruzioni ({', '.join(stmts)})")
+        if extra:
+            failures.append(f"apertura con istruzioni non attese: {extra}")
+
+        walls = wall_times(new_run, args.runs)
+        base = wall_times([sys.executable, "-c", "pass"], args.runs)
+        med = statistics.median(walls) * 1000
+        print(
+            f"new-run: mediana {med:.1f} ms (min {min(walls) * 1000:.1f}), "
+            f"python vuoto {statistics.median(base) * 1000:.1f} ms, budget {args.wall_budget_ms:.0f} ms"
+        )
+        if med > args.wall_budget_ms:
+            failures.append(f"new-run {med:.1f} ms oltre il budget")
+
+    for f in failures:
+        print(f"FALLITO: {f}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,308 @@
+"""Suite di benchmark delle funzioni pubbliche (db, import, report, export) e della CLI.
+
+Genera un DB sintetico (benchmarks/datagen.py), misura ogni caso `--repeat` volte (tempo minimo e
+mediano) e una volta sotto tracemalloc per il picco di memoria; per la CLI misura il processo intero
+(tempo e RSS massimo). Il risultato e' JSON, da confrontare con quello di un'altra versione:
+
+    python benchmarks/bench_suite.py --scale medium --out nuovo.json
+    python benchmarks/bench_suite.py --scale medium --out nuovo.json --compare vecchio.json --threshold 1.3
+
+Con --compare esce con codice 1 se un caso e' piu' lento della soglia rispetto al riferimento.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import io
+import json
+import os
+import pathlib
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict
+from typing import Any, Callable
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent))
+
+import datagen  # noqa: E402
+from gestione_collaudo import APP_VERSIONE, analytics, db, export, importers, ingest, reports, search  # noqa: E402
+
+# Versione del formato JSON prodotto.
+FORMAT = 1
+
+# (nome, funzione senza argomenti, unita' elaborate per chiamata)
+Case = tuple[str, Callable[[], object], int]
+
+
+def measure(fn: Callable[[], object], repeat: int, memory: bool) -> dict[str, Any]:
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {"seconds": min(times), "median": statistics.median(times), "repeat": repeat, "peak_bytes": peak}
+
+
+def run_cli(db_path: str, args: list[str], cwd: str) -> tuple[float, int | None]:
+    # Un'invocazione completa di `python -m gestione_collaudo.cli`: tempo e RSS massimo del processo
+    # (solo dove os.wait4 esiste; altrove None).
+    cmd = [sys.executable, "-m", "gestione_collaudo.cli", "--db", db_path, *args]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (str(ROOT), os.environ.get("PYTHONPATH")))))
+    with tempfile.TemporaryFile() as err:
+        t0 = time.perf_counter()
+        p = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=err, env=env, cwd=cwd)
+        rss = None
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(p.pid, 0)
+            p.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss e' in KiB su Linux, in byte su macOS.
+            rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+        else:
+            p.wait()
+        elapsed = time.perf_counter() - t0
+        if p.returncode != 0:
+            err.seek(0)
+            raise RuntimeError(f"{' '.join(args)}: codice {p.returncode}\n{err.read().decode(errors='replace')}")
+    return elapsed, rss
+
+
+def measure_cli(db_path: str, args: list[str], cwd: str, repeat: int) -> dict[str, Any]:
+    runs = [run_cli(db_path, args, cwd) for _ in range(repeat)]
+    times = [t for t, _ in runs]
+    rss = [m for _, m in runs if m is not None]
+    return {
+        "seconds": min(times),
+        "median": statistics.median(times),
+        "repeat": repeat,
+        "peak_bytes": max(rss) if rss else None,
+    }
+
+
+def library_cases(con: sqlite3.Connection, tmp: pathlib.Path, scale: datagen.Scale, pid: int) -> list[Case]:
+    rnd = random.Random(scale.seed + 1)
+    rows = datagen.checklist_rows(rnd, scale.items)
+    csv_path = tmp / "checklist.csv"
+    datagen.write_checklist_csv(csv_path, rows)
+
+    item_ids = [it.id for it in db.list_checklist(con, pid)]
+    results = list(datagen.results_rows(rnd, item_ids, 1.0))
+    results_path = tmp / "esiti.csv"
+    datagen.write_results_file(results_path, iter(results))
+
+    runs = db.list_runs(con, pid)
+    run = runs[0]  # il piu' recente, ancora aperto
+
+    # Flusso per `ingest`: voci indicate per codice, con valore misurato.
+    codici = {it.id: it.codice for it in db.list_checklist(con, pid)}
+    feed_path = tmp / "feed.jsonl"
+    with feed_path.open("w", encoding="utf-8") as f:
+        for item_id, esito, note in results:
+            obj = {"run_id": run.id, "codice": codici[item_id], "esito": esito, "note": note, "valore": item_id % 97}
+            f.write(json.dumps(obj) + "\n")
+    project = db.get_project(con, pid)
+    assert project is not None
+
+    # Progetto a parte per le operazioni che riscrivono la checklist (cancellano gli esiti).
+    scratch = db.create_project(con, "Bench scratch")
+    variants = [rows, [(f"{t} (rev)", c, a, k) if i % 10 == 0 else (t, c, a, k) for i, (t, c, a, k) in enumerate(rows)]]
+    turn = [0]
+
+    def sync() -> object:
+        turn[0] ^= 1
+        return db.sync_checklist(con, scratch, variants[turn[0]])
+
+    singles = item_ids[: min(len(item_ids), 200)]
+
+    def set_singles() -> None:
+        for i, item_id in enumerate(singles):
+            db.set_run_item(con, run.id, item_id, db.ESITI[i % 3], "")
+
+    checklist = db.list_checklist(con, pid)
+    n_results = con.execute(
+        "SELECT COUNT(*) FROM run_items WHERE run_id IN (SELECT id FROM runs WHERE project_id=?)", (pid,)
+    ).fetchone()[0]
+    progress = db.get_run_progress(con, run.id)
+    md = reports.build_markdown_report(project, run, checklist, progress, generated_by="bench")
+    model = reports.build_report_model(project, run, checklist, progress, "bench", "bench")
+    outputs = {fmt: tmp / f"report.{fmt}" for fmt in reports.RENDERERS}
+
+    return [
+        ("importers.import_checklist_csv", lambda: importers.import_checklist_csv(str(csv_path)), len(rows)),
+        ("importers.iter_results_file", lambda: list(importers.iter_results_file(str(results_path))), len(results)),
+        ("db.replace_checklist", lambda: db.replace_checklist(con, scratch, rows), len(rows)),
+        ("db.sync_checklist", sync, len(rows)),
+        ("db.set_run_item", set_singles, len(singles)),
+        ("db.set_run_items_bulk", lambda: db.set_run_items_bulk(con, run.id, results), len(results)),
+        ("ingest.follow_file", lambda: ingest.follow_file(str(feed_path), ingest.Ingestor(con)), len(results)),
+        ("db.list_checklist", lambda: db.list_checklist(con, pid), len(item_ids)),
+        ("db.get_run_progress", lambda: db.get_run_progress(con, run.id), len(item_ids)),
+        ("db.load_run_progress", lambda: db.load_run_progress(con, run.id), len(item_ids)),
+        ("db.get_run_summaries", lambda: db.get_run_summaries(con, pid), len(runs)),
+        ("db.list_runs_page", lambda: db.list_runs_page(con, pid), len(runs)),
+        ("db.list_projects_page", lambda: db.list_projects_page(con), scale.projects),
+        ("analytics.item_stats", lambda: analytics.item_stats(con, project_ids=[pid]), len(item_ids)),
+        ("analytics.diff_runs", lambda: analytics.diff_runs(con, runs[-1].id, run.id), len(item_ids)),
+        ("search.search_checklist", lambda: search.search_checklist(con, "verifica inverter"), 1),
+        ("search.search_notes", lambda: search.search_notes(con, "tolleranza"), 1),
+        (
+            "reports.build_markdown_report",
+            lambda: reports.build_markdown_report(project, run, checklist, progress, generated_by="bench"),
+            len(checklist),
+        ),
+        ("reports.markdown_to_simple_html", lambda: reports.markdown_to_simple_html(md, footer="bench"), len(checklist)),
+        (
+            "reports.render_all",
+            lambda: reports.render_all(model, {fmt: io.StringIO() for fmt in reports.RENDERERS}),
+            len(checklist),
+        ),
+        ("export.export_run_report", lambda: export.export_run_report(con, pid, run.id, outputs, use_cache=False), len(checklist)),
+        ("export.export_data", lambda: export.export_data(con, io.BytesIO(), "csv", project_ids=[pid]), n_results),
+    ]
+
+
+def cli_cases(tmp: pathlib.Path, pid: int, run_id: int, scratch: int) -> list[tuple[str, list[str]]]:
+    out = tmp / "cli"
+    out.mkdir(exist_ok=True)
+    return [
+        ("cli.new-run", ["new-run", "--project-id", str(pid), "--nome", "Run CLI"]),
+        ("cli.status", ["status", "--project-id", str(pid)]),
+        ("cli.record-results", ["record-results", "--run-id", str(run_id), "--file", str(tmp / "esiti.csv")]),
+        (
+            "cli.export-report",
+            [
+                "export-report", "--project-id", str(pid), "--run-id", str(run_id), "--no-cache",
+                "--out-md", str(out / "r.md"), "--out-html", str(out / "r.html"),
+            ],
+        ),
+        ("cli.export-data", ["export-data", "--project-id", str(pid), "--out", str(out / "dati.csv.gz")]),
+        ("cli.ingest", ["ingest", str(tmp / "feed.jsonl"), "--from-start"]),
+        ("cli.import-checklist", ["import-checklist", "--project-id", str(scratch), "--csv", str(tmp / "checklist.csv")]),
+    ]
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], threshold: float) -> list[str]:
+    # Casi piu' lenti del riferimento oltre `threshold` (rapporto dei tempi minimi).
+    slower = []
+    base = baseline.get("results", {})
+    print(f"\n{'caso':36} {'rif. ms':>10} {'ora ms':>10} {'rapporto':>9}", file=sys.stderr)
+    for name, res in current["results"].items():
+        if name not in base:
+            continue
+        ratio = res["seconds"] / max(base[name]["seconds"], 1e-9)
+        flag = "  <-- piu' lento" if ratio > threshold else ""
+        print(f"{name:36} {base[name]['seconds'] * 1000:10.2f} {res['seconds'] * 1000:10.2f} {ratio:8.2f}x{flag}", file=sys.stderr)
+        if ratio > threshold:
+            slower.append(name)
+    return slower
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scale", choices=tuple(datagen.SCALE), default="small", help="Dimensioni predefinite del dataset")
+    ap.add_argument("--projects", type=int, default=None)
+    ap.add_argument("--items", type=int, default=None, help="Voci per progetto")
+    ap.add_argument("--runs", type=int, default=None, help="Run per progetto")
+    ap.add_argument("--fill", type=float, default=None, help="Quota di voci con esito (0-1)")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--repeat", type=int, default=5, help="Ripetizioni per caso (si tiene il tempo minimo)")
+    ap.add_argument("--cli-repeat", type=int, default=3, help="Ripetizioni per i casi CLI")
+    ap.add_argument("--only", default="", help="Solo i casi che contengono uno di questi testi (separati da virgola)")
+    ap.add_argument("--no-memory", action="store_true", help="Salta la misura del picco di memoria")
+    ap.add_argument("--no-cli", action="store_true", help="Salta i casi CLI")
+    ap.add_argument("--label", default="", help="Etichetta del risultato (es. versione o commit)")
+    ap.add_argument("--out", default="", help="File JSON dei risultati (default: stdout)")
+    ap.add_argument("--compare", default="", help="JSON di riferimento da confrontare")
+    ap.add_argument("--threshold", type=float, default=1.25, help="Rapporto di tempo oltre cui un caso e' una regressione")
+    args = ap.parse_args()
+
+    only = [s.strip() for s in args.only.split(",") if s.strip()]
+
+    def wanted(name: str) -> bool:
+        return not only or any(s in name for s in only)
+
+    scale = datagen.scale_from_args(args)
+    results: dict[str, dict[str, Any]] = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp = pathlib.Path(tmp_dir)
+        db_path = str(tmp / "bench.sqlite")
+        con = db.connect(db_path)
+
+        t0 = time.perf_counter()
+        project_ids = datagen.populate(con, scale)
+        run_items = int(con.execute("SELECT count(*) FROM run_items").fetchone()[0])
+        results["datagen.populate"] = {
+            "seconds": time.perf_counter() - t0, "median": None, "repeat": 1, "peak_bytes": None, "n": run_items,
+        }
+        print(f"dataset: {run_items} esiti in {results['datagen.populate']['seconds']:.1f} s", file=sys.stderr)
+
+        pid = project_ids[0]
+        for name, fn, n in library_cases(con, tmp, scale, pid):
+            if wanted(name):
+                results[name] = {**measure(fn, args.repeat, not args.no_memory), "n": n}
+                _print_row(name, results[name])
+        run_id = db.list_runs(con, pid)[0].id
+        cli_scratch = db.create_project(con, "Bench CLI")
+        con.close()
+
+        if not args.no_cli:
+            for name, cli_args in cli_cases(tmp, pid, run_id, cli_scratch):
+                if wanted(name):
+                    results[name] = {**measure_cli(db_path, cli_args, tmp_dir, args.cli_repeat), "n": 1}
+                    _print_row(name, results[name])
+
+    doc = {
+        "format": FORMAT,
+        "label": args.label,
+        "meta": {
+            "app_version": APP_VERSIONE,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "scale": asdict(scale),
+            "run_items": run_items,
+        },
+        "results": results,
+    }
+    text = json.dumps(doc, indent=2)
+    if args.out:
+        pathlib.Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    if args.compare:
+        baseline = json.loads(pathlib.Path(args.compare).read_text(encoding="utf-8"))
+        if baseline.get("meta", {}).get("scale") != doc["meta"]["scale"]:
+            print("Attenzione: il riferimento e' stato misurato con una scala diversa.", file=sys.stderr)
+        slower = compare(doc, baseline, args.threshold)
+        if slower:
+            print(f"\nRegressioni oltre {args.threshold:.2f}x: {', '.join(slower)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+def _print_row(name: str, res: dict[str, Any]) -> None:
+    peak = f"{res['peak_bytes'] / 2**20:8.1f} MiB" if res["peak_bytes"] is not None else " " * 12
+    print(f"{name:36} {res['seconds'] * 1000:10.2f} ms {peak}  n={res['n']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
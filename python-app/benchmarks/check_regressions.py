@@ -0,0 +1,300 @@
+"""Controlli di correttezza per difetti gia' corretti, su DB temporanei costruiti ad hoc.
+
+Ogni controllo riproduce lo scenario del difetto e verifica il risultato atteso; esce con codice 1
+se un controllo fallisce.
+
+    python benchmarks/check_regressions.py
+"""
+
+from __future__ import annotations
+
+import json
+import pathlib
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from gestione_collaudo import analytics, db, search  # noqa: E402
+
+
+def _project(con, nome: str, codici: list[str]) -> tuple[int, dict[str, int]]:
+    pid = db.create_project(con, nome)
+    db.replace_checklist(con, pid, [(f"Voce {c}", "Cat", "", c) for c in codici])
+    return pid, {it.codice: it.id for it in db.list_checklist(con, pid)}
+
+
+def check_item_stats_senza_skip(tmp: pathlib.Path) -> list[str]:
+    # Voci mai saltate (o mai PASS/FAIL) non devono sparire da item_stats.
+    con = db.connect(str(tmp / "analytics.sqlite"))
+    pid, ids = _project(con, "A", ["A1", "A2", "A3", "A4"])
+    esiti = [
+        {"A1": "PASS", "A2": "FAIL", "A3": "SKIP"},
+        {"A1": "FAIL", "A2": "PASS", "A3": "SKIP"},
+        {"A1": "FAIL", "A2": "PASS"},
+    ]
+    for i, run in enumerate(esiti):
+        run_id = db.create_run(con, pid, f"Run {i}")
+        db.set_run_items_bulk(con, run_id, [(ids[c], e, "") for c, e in run.items()])
+    errors = []
+    stats = {s.codice: s for s in analytics.item_stats(con, project_ids=[pid])}
+    attesi = {"A1": (1, 2, 0, 1), "A2": (2, 1, 0, 1), "A3": (0, 0, 2, 0)}
+    for codice, (n_pass, n_fail, n_skip, flip) in attesi.items():
+        s = stats.get(codice)
+        if s is None:
+            errors.append(f"item_stats: voce {codice} mancante")
+        elif (s.n_pass, s.n_fail, s.n_skip, s.flip) != (n_pass, n_fail, n_skip, flip):
+            errors.append(f"item_stats: {codice} = {(s.n_pass, s.n_fail, s.n_skip, s.flip)}, attesi {(n_pass, n_fail, n_skip, flip)}")
+    if "A4" in stats:
+        errors.append("item_stats: voce senza esiti presente con min_runs=1")
+    if len(analytics.item_stats(con, project_ids=[pid], min_runs=0)) != 4:
+        errors.append("item_stats: con min_runs=0 servono tutte le voci")
+
+    # Stessa voce in due progetti senza SKIP: somme e ordinamento sugli aggregati.
+    other, ids_b = _project(con, "B", ["A1", "A2"])
+    run_id = db.create_run(con, other, "Run B")
+    db.set_run_items_bulk(con, run_id, [(ids_b["A2"], "FAIL", ""), (ids_b["A1"], "PASS", "")])
+    shared = analytics.item_stats(con, shared_with=pid, ordine="fail")
+    if [s.codice for s in shared] != ["A1", "A2", "A3"] or shared[1].n_fail != 2 or shared[1].n_progetti != 2:
+        errors.append(f"item_stats --shared: {[(s.codice, s.n_fail, s.n_progetti) for s in shared]}")
+    con.close()
+    return errors
+
+
+def check_db_fts_senza_fts5(tmp: pathlib.Path) -> list[str]:
+    # DB indicizzato con FTS5 e poi aperto da una SQLite senza FTS5 (simulata sostituendo la sonda):
+    # le scritture devono riuscire, la ricerca ripiegare su LIKE e l'indice tornare allineato
+    # quando FTS5 e' di nuovo disponibile.
+    path = str(tmp / "fts.sqlite")
+    con = db.connect(path)
+    pid, ids = _project(con, "F", ["F1"])
+    con.close()
+    errors = []
+    probe = db.fts5_available
+    db.fts5_available = lambda con: False  # type: ignore[assignment]
+    try:
+        con = db.connect(path)
+        if db._fts_state(con) != (True, 0):
+            errors.append(f"senza FTS5 i trigger FTS restano: {db._fts_state(con)}")
+        db.replace_checklist(con, pid, [("Taratura encoder", "Cat", "", "F2")])
+        run_id = db.create_run(con, pid, "Run")
+        item_id = db.list_checklist(con, pid)[0].id
+        db.set_run_item(con, run_id, item_id, "FAIL", "cavo encoder lento")
+        if search.fts_available(con):
+            errors.append("fts_available vero senza il modulo FTS5")
+        if [m.titolo for m in search.search_checklist(con, "encod")] != ["Taratura encoder"]:
+            errors.append("ricerca LIKE sulle voci senza risultati")
+        if [m.note for m in search.search_notes(con, "lento")] != ["cavo encoder lento"]:
+            errors.append("ricerca LIKE sulle note senza risultati")
+        con.close()
+    finally:
+        db.fts5_available = probe  # type: ignore[assignment]
+    mem = db.connect(":memory:")
+    has_fts5 = probe(mem)
+    mem.close()
+    if has_fts5:
+        con = db.connect(path)
+        if db._fts_state(con) != (True, len(db._FTS_TRIGGER_NAMES)) or not search.fts_available(con):
+            errors.append(f"con FTS5 di nuovo disponibile l'indice non e' stato ricreato: {db._fts_state(con)}")
+        found = [m.titolo for m in search.search_checklist(con, "encod")], [m.note for m in search.search_notes(con, "lento")]
+        if found != (["Taratura encoder"], ["cavo encoder lento"]):
+            errors.append(f"indice FTS non ricostruito con le scritture fatte senza FTS5: {found}")
+        con.close()
+    return errors
+
+
+def check_pagine_e_modelli(tmp: pathlib.Path) -> list[str]:
+    # limit < 1 va rifiutato (prima: IndexError con 0, tutte le righe con -1); i modelli
+    # mantengono i nomi dei campi originali, con il datetime in una property a parte.
+    con = db.connect(str(tmp / "pagine.sqlite"))
+    pid, _ = _project(con, "P", ["P1"])
+    run_id = db.create_run(con, pid, "Run")
+    db.close_run(con, run_id)
+    errors = []
+    for page in (lambda n: db.list_projects_page(con, limit=n), lambda n: db.list_runs_page(con, pid, limit=n)):
+        for n in (0, -1):
+            try:
+                page(n)
+            except ValueError:
+                pass
+            else:
+                errors.append(f"pagina con limit={n} accettata")
+        rows, cursor = page(1)
+        if len(rows) != 1 or cursor is None:
+            errors.append(f"pagina con limit=1: {len(rows)} righe, cursore {cursor}")
+    project, run = db.get_project(con, pid), db.get_run(con, run_id)
+    if project.created_dt.isoformat(timespec="seconds") + "Z" != project.created_at:
+        errors.append(f"Project.created_dt {project.created_dt} != {project.created_at}")
+    if run.closed_at is None or run.closed_dt is None or run.started_dt > run.closed_dt:
+        errors.append(f"Run started/closed: {run.started_at} {run.closed_at}")
+    con.close()
+    return errors
+
+
+def check_esiti_altro_progetto(tmp: pathlib.Path) -> list[str]:
+    # Un esito per una voce della checklist di un altro progetto va rifiutato: prima veniva
+    # registrato e falsava l'avanzamento del run.
+    con = db.connect(str(tmp / "progetti.sqlite"))
+    pid, ids = _project(con, "A", ["A1", "A2"])
+    _, ids_b = _project(con, "B", ["B1"])
+    run_id = db.create_run(con, pid, "Run")
+    errors = []
+    for label, write in (
+        ("set_run_items_bulk", lambda: db.set_run_items_bulk(con, run_id, [(ids["A1"], "PASS", ""), (ids_b["B1"], "FAIL", "")])),
+        ("set_run_item", lambda: db.set_run_item(con, run_id, ids_b["B1"], "FAIL")),
+    ):
+        try:
+            write()
+        except ValueError:
+            pass
+        else:
+            errors.append(f"{label}: voce di un altro progetto accettata")
+    if db.get_run_progress(con, run_id):
+        errors.append(f"esiti registrati nonostante l'errore: {db.get_run_progress(con, run_id)}")
+    con.close()
+    return errors
+
+
+def check_export_voce_altro_progetto(tmp: pathlib.Path) -> list[str]:
+    # Esiti gia' registrati per voci di un altro progetto (prima del controllo in set_run_items_bulk):
+    # export-data non deve fermarsi con KeyError, ma esportarli con le colonne della voce vuote.
+    from gestione_collaudo import export
+
+    con = db.connect(str(tmp / "export.sqlite"))
+    pid, ids = _project(con, "A", ["A1"])
+    _, ids_b = _project(con, "B", ["B1"])
+    run_id = db.create_run(con, pid, "Run")
+    with db.transaction(con):
+        con.execute(
+            "INSERT INTO run_items(run_id, checklist_item_id, esito, note, timestamp) VALUES(?,?,?,?,?)",
+            (run_id, ids_b["B1"], "FAIL", "", "2024-01-01T00:00:00Z"),
+        )
+    errors = []
+    for fmt in export.DATA_FORMATS:
+        out = tmp / f"dati.{fmt}"
+        try:
+            res = export.export_data(con, str(out), fmt, project_ids=[pid])
+        except KeyError as exc:
+            errors.append(f"export-data {fmt}: KeyError {exc}")
+            continue
+        if res.righe != 1 or str(ids_b["B1"]) not in out.read_text(encoding="utf-8").splitlines()[-1]:
+            errors.append(f"export-data {fmt}: esito della voce {ids_b['B1']} mancante")
+    con.close()
+    return errors
+
+
+def check_ingest_run_creato_durante_follow(tmp: pathlib.Path) -> list[str]:
+    # ingest --follow: un run creato dopo l'avvio (anche dopo una riga che lo cita quando ancora non
+    # esiste) deve ricevere le righe successive, non restare "sconosciuto" fino al riavvio.
+    from gestione_collaudo import ingest
+
+    path = str(tmp / "follow.sqlite")
+    con = db.connect(path)
+    pid, ids = _project(con, "I", ["I1", "I2"])
+    feed = tmp / "feed.jsonl"
+    feed.write_bytes(b"")
+    stop = threading.Event()
+    scartate: list[str] = []
+
+    def run() -> None:
+        follow_con = db.connect(path)
+        ingestor = ingest.Ingestor(follow_con, "feed", batch_seconds=0, on_error=lambda pos, msg: scartate.append(msg))
+        ingest.follow_file(str(feed), ingestor, follow=True, poll=0.01, stop=stop)
+        follow_con.close()
+
+    def append(obj: dict) -> None:
+        with feed.open("ab") as f:
+            f.write(json.dumps(obj).encode() + b"\n")
+
+    def wait_for(cond: Callable[[], bool]) -> bool:
+        deadline = time.monotonic() + 5
+        while not cond():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    errors = []
+    try:
+        next_run = con.execute("SELECT coalesce(max(id), 0) + 1 FROM runs").fetchone()[0]
+        append({"run_id": next_run, "codice": "I1", "esito": "PASS"})
+        if not wait_for(lambda: len(scartate) == 1):
+            errors.append("riga per un run inesistente non scartata")
+        run_id = db.create_run(con, pid, "Run")
+        append({"run_id": run_id, "codice": "I2", "esito": "FAIL"})
+        if run_id != next_run:
+            errors.append(f"run creato con id {run_id}, atteso {next_run}")
+        elif not wait_for(lambda: ids["I2"] in db.get_run_progress(con, run_id)):
+            errors.append(f"riga per il run {run_id} creato durante --follow non registrata: {scartate}")
+    finally:
+        stop.set()
+        thread.join()
+    con.close()
+    return errors
+
+
+def check_cache_report_stesso_secondo(tmp: pathlib.Path) -> list[str]:
+    # Un esito corretto nello stesso secondo dell'ultima scrittura lascia invariati numero e ultimo
+    # timestamp degli esiti: l'impronta del report deve cambiare comunque.
+    from gestione_collaudo import export
+
+    con = db.connect(str(tmp / "cache.sqlite"))
+    pid, ids = _project(con, "C", ["C1"])
+    run_id = db.create_run(con, pid, "Run")
+    out = {"md": tmp / "cache.md"}
+    errors = []
+    writes = (
+        ("set_run_item", lambda esito: db.set_run_item(con, run_id, ids["C1"], esito)),
+        ("set_run_items_bulk", lambda esito: db.set_run_items_bulk(con, run_id, [(ids["C1"], esito, "")])),
+        ("record_ingest_batch", lambda esito: db.record_ingest_batch(con, [(run_id, ids["C1"], esito, "")])),
+    )
+    for label, write in writes:
+        write("PASS")
+        export.export_run_report(con, pid, run_id, out)
+        con.execute("UPDATE run_items SET timestamp='2024-01-01T00:00:00Z' WHERE run_id=?", (run_id,))
+        before = export.report_fingerprint(con, pid, run_id)
+        write("FAIL")
+        # Stesso secondo della scrittura precedente, simulato riportando il timestamp al valore di prima.
+        con.execute("UPDATE run_items SET timestamp='2024-01-01T00:00:00Z' WHERE run_id=?", (run_id,))
+        if export.report_fingerprint(con, pid, run_id) == before:
+            errors.append(f"{label}: impronta invariata dopo PASS -> FAIL nello stesso secondo")
+            continue
+        res = export.export_run_report(con, pid, run_id, out)
+        if res is None or res.cached or "FAIL" not in out["md"].read_text(encoding="utf-8"):
+            errors.append(f"{label}: servito il report in cache con l'esito vecchio")
+    con.close()
+    return errors
+
+
+CHECKS: list[tuple[str, Callable[[pathlib.Path], list[str]]]] = [
+    ("analytics.item_stats senza SKIP", check_item_stats_senza_skip),
+    ("db/search senza FTS5", check_db_fts_senza_fts5),
+    ("db paginazione e campi dei modelli", check_pagine_e_modelli),
+    ("db esiti di voci di un altro progetto", check_esiti_altro_progetto),
+    ("export-data con voci di un altro progetto", check_export_voce_altro_progetto),
+    ("ingest --follow con run creato dopo l'avvio", check_ingest_run_creato_durante_follow),
+    ("cache dei report con esiti cambiati nello stesso secondo", check_cache_report_stesso_secondo),
+]
+
+
+def main() -> int:
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, check in CHECKS:
+            errors = check(pathlib.Path(tmp))
+            print(f"{'OK' if not errors else 'FALLITO'}: {name}")
+            failures += errors
+        db.close_all()
+    for f in failures:
+        print(f"FALLITO: {f}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
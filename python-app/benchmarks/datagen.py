@@ -0,0 +1,147 @@
+"""Generatore deterministico di dati sintetici per i benchmark: progetti x voci x run x esiti.
+
+A parita' di parametri e `--seed` produce sempre gli stessi contenuti (cambiano solo i timestamp).
+
+    python benchmarks/datagen.py --db bench.sqlite --projects 5 --items 2000 --runs 100
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import pathlib
+import random
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from typing import Iterator
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from gestione_collaudo import db  # noqa: E402
+
+CATEGORIE = ("Sicurezza", "Quadri elettrici", "Motori", "Sensori", "PLC", "HMI", "Pneumatica", "Documentazione")
+OGGETTI = ("pulsante emergenza", "barriera ottica", "inverter", "encoder", "finecorsa", "valvola", "pressostato", "termocoppia")
+AZIONI = ("Verifica", "Prova", "Controllo", "Taratura", "Misura")
+NOTE = ("ok al secondo tentativo", "valore fuori tolleranza", "cablaggio da rifare", "manca etichetta", "rumore anomalo")
+
+# Distribuzione degli esiti generati.
+PESI_ESITI = {"PASS": 80, "FAIL": 12, "SKIP": 8}
+
+
+@dataclass(frozen=True)
+class Scale:
+    projects: int = 2
+    items: int = 200  # voci per progetto
+    runs: int = 10  # run per progetto
+    fill: float = 0.9  # quota di voci con esito in ogni run
+    seed: int = 42
+
+
+SCALE = {
+    "small": Scale(2, 200, 10),
+    "medium": Scale(4, 2000, 25),
+    "large": Scale(5, 2000, 100),
+    "xl": Scale(10, 5000, 100),
+}
+
+
+def checklist_rows(rnd: random.Random, n: int) -> list[tuple[str, str, str, str]]:
+    # (titolo, categoria, atteso, codice) come restituite da importers.import_checklist_csv.
+    rows = []
+    for i in range(1, n + 1):
+        categoria = CATEGORIE[i % len(CATEGORIE)]
+        titolo = f"{rnd.choice(AZIONI)} {rnd.choice(OGGETTI)} {i}"
+        atteso = f"{rnd.randint(1, 400)} {rnd.choice(('V', 'A', 'bar', 'mm', 's'))}" if rnd.random() < 0.7 else ""
+        rows.append((titolo, categoria, atteso, f"C{i:06d}"))
+    return rows
+
+
+def results_rows(rnd: random.Random, item_ids: list[int], fill: float) -> Iterator[tuple[int, str, str]]:
+    # (checklist_item_id, esito, note) per una quota `fill` delle voci, come per db.set_run_items_bulk.
+    esiti = list(PESI_ESITI)
+    pesi = list(PESI_ESITI.values())
+    for item_id in item_ids:
+        if rnd.random() >= fill:
+            continue
+        esito = rnd.choices(esiti, pesi)[0]
+        note = rnd.choice(NOTE) if esito != "PASS" and rnd.random() < 0.6 else ""
+        yield item_id, esito, note
+
+
+def write_checklist_csv(path: pathlib.Path, rows: list[tuple[str, str, str, str]]) -> None:
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, delimiter=";")
+        w.writerow(("titolo", "categoria", "atteso", "codice"))
+        w.writerows(rows)
+
+
+def write_results_file(path: pathlib.Path, rows: Iterator[tuple[int, str, str]]) -> None:
+    # CSV o JSONL (secondo l'estensione) nel formato letto da importers.iter_results_file.
+    with path.open("w", encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".jsonl":
+            for item_id, esito, note in rows:
+                f.write(json.dumps({"checklist_item_id": item_id, "esito": esito, "note": note}) + "\n")
+        else:
+            w = csv.writer(f, delimiter=";")
+            w.writerow(("checklist_item_id", "esito", "note"))
+            w.writerows(rows)
+
+
+def populate(con: sqlite3.Connection, scale: Scale) -> list[int]:
+    # Crea i progetti con checklist, run ed esiti; restituisce gli id dei progetti.
+    rnd = random.Random(scale.seed)
+    project_ids = []
+    for p in range(1, scale.projects + 1):
+        pid = db.create_project(con, f"Linea {p}", f"Cliente {p % 3 + 1}", f"Sito {p % 2 + 1}")
+        db.replace_checklist(con, pid, checklist_rows(rnd, scale.items))
+        item_ids = [it.id for it in db.list_checklist(con, pid)]
+        for r in range(1, scale.runs + 1):
+            run_id = db.create_run(con, pid, f"Run {r}", f"operatore {r % 4 + 1}")
+            db.set_run_items_bulk(con, run_id, results_rows(rnd, item_ids, scale.fill))
+            if r < scale.runs:
+                db.close_run(con, run_id)
+        project_ids.append(pid)
+    return project_ids
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", required=True, help="DB da creare (non deve esistere)")
+    ap.add_argument("--scale", choices=tuple(SCALE), default="small", help="Dimensioni predefinite")
+    ap.add_argument("--projects", type=int, default=None)
+    ap.add_argument("--items", type=int, default=None, help="Voci per progetto")
+    ap.add_argument("--runs", type=int, default=None, help="Run per progetto")
+    ap.add_argument("--fill", type=float, default=None, help="Quota di voci con esito (0-1)")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+
+    if pathlib.Path(args.db).exists():
+        print(f"Il DB esiste gia': {args.db}", file=sys.stderr)
+        return 2
+    scale = scale_from_args(args)
+    t0 = time.perf_counter()
+    con = db.connect(args.db)
+    populate(con, scale)
+    n = int(con.execute("SELECT count(*) FROM run_items").fetchone()[0])
+    con.close()
+    print(f"{n} esiti generati in {time.perf_counter() - t0:.1f} s: {args.db}")
+    return 0
+
+
+def scale_from_args(args: argparse.Namespace) -> Scale:
+    # Scala predefinita `args.scale`, con i singoli valori sovrascritti se indicati.
+    base = SCALE[args.scale]
+    return Scale(
+        projects=args.projects if args.projects is not None else base.projects,
+        items=args.items if args.items is not None else base.items,
+        runs=args.runs if args.runs is not None else base.runs,
+        fill=args.fill if args.fill is not None else base.fill,
+        seed=args.seed if args.seed is not None else base.seed,
+    )
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,4 +1,4 @@
-__all__ = ["db", "models", "importers", "reports"]
+__all__ = ["db", "models", "importers", "reports", "export", "analytics", "worker", "session", "search", "profiling"]
 
 APP_NOME = "Gestione Collaudo"
 APP_VERSIONE = "0.1.0"
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import sqlite3
+from typing import Sequence
+
+from gestione_collaudo import db
+from gestione_collaudo.models import DiffRow, ItemStats, RunDiff
+
+# Chiave di una voce tra run e progetti diversi: il codice se presente, altrimenti categoria+titolo
+# (lower() di SQLite e' solo ASCII: basta per abbinare checklist nate dallo stesso CSV).
+_CHIAVE = "CASE WHEN ci.codice<>'' THEN ci.codice ELSE lower(ci.categoria)||char(31)||lower(ci.titolo) END"
+
+# Tipi di cambio tra due run, nell'ordine in cui vengono mostrati. Le voci con lo stesso esito in
+# entrambi i run (o SKIP -> SKIP) non vengono elencate, solo contate (RunDiff.invariate).
+DIFF_TIPI = ("regressione", "risolta", "cambiata", "nuova", "da_fare")
+_DIFF_TIPO = """CASE
+  WHEN t.esito IS NULL THEN 'da_fare'
+  WHEN b.esito IS NULL THEN 'nuova'
+  WHEN b.esito='PASS' AND t.esito='FAIL' THEN 'regressione'
+  WHEN b.esito='FAIL' AND t.esito='PASS' THEN 'risolta'
+  WHEN b.esito<>t.esito THEN 'cambiata'
+END"""
+
+# Le espressioni usano gli alias aggregati di item_stats: le colonne delle CTE hanno nomi diversi
+# (v_*), altrimenti SQLite risolverebbe i nomi sulle colonne dei LEFT JOIN (NULL se mancano esiti).
+ORDINAMENTI = {
+    "tasso": "(n_fail * 1.0 / max(n_pass + n_fail, 1)) DESC, n_fail DESC",
+    "fail": "n_fail DESC, flip DESC",
+    "flip": "flip DESC, n_fail DESC",
+    "recenti": "ultimo_fail IS NULL, ultimo_fail DESC",
+}
+
+
+def item_stats(
+    con: sqlite3.Connection,
+    project_ids: Sequence[int] | None = None,
+    shared_with: int | None = None,
+    ordine: str = "tasso",
+    min_runs: int = 1,
+    limit: int | None = None,
+) -> list[ItemStats]:
+    # Tasso di FAIL, flip PASS<->FAIL e ultimo FAIL per ogni voce, calcolati tutti in SQL:
+    # - project_ids: limita ai progetti indicati (None = tutti);
+    # - shared_with: solo le voci attive di quel progetto, sommando i run di tutti i progetti
+    #   che hanno la stessa voce (stesso codice o categoria+titolo).
+    # I flip si contano per voce di progetto in ordine di run (gli id crescono con l'avvio), saltando
+    # gli SKIP; la finestra LAG scorre l'indice idx_run_items_item_run senza ordinamenti temporanei.
+    if ordine not in ORDINAMENTI:
+        raise ValueError(f"Ordinamento non valido: {ordine} (usa {', '.join(ORDINAMENTI)})")
+    where: list[str] = []
+    params: list[object] = []
+    if project_ids:
+        where.append(f"ci.project_id IN ({','.join('?' * len(project_ids))})")
+        params.extend(int(p) for p in project_ids)
+    if shared_with is not None:
+        where.append(
+            f"{_CHIAVE} IN (SELECT {_CHIAVE} FROM checklist_items ci WHERE ci.project_id=? AND ci.attivo=1)"
+        )
+        params.append(int(shared_with))
+    filtro = f"WHERE {' AND '.join(where)}" if where else ""
+    params.append(int(min_runs))
+    sql = f"""
+        WITH voci AS (
+          SELECT ci.id, ci.project_id, ci.codice, ci.categoria, ci.titolo, {_CHIAVE} AS chiave
+          FROM checklist_items ci {filtro}
+        ),
+        seq AS (
+          SELECT ri.checklist_item_id AS item_id, ri.esito, ri.timestamp,
+                 lag(ri.esito) OVER (PARTITION BY ri.checklist_item_id ORDER BY ri.run_id) AS prec
+          FROM run_items ri
+          WHERE ri.checklist_item_id IN (SELECT id FROM voci) AND ri.esito<>'SKIP'
+        ),
+        per_voce AS (
+          SELECT item_id,
+                 total(esito='PASS') AS v_pass,
+                 total(esito='FAIL') AS v_fail,
+                 total(esito<>prec) AS v_flip,
+                 max(CASE WHEN esito='FAIL' THEN timestamp END) AS v_ultimo_fail
+          FROM seq GROUP BY item_id
+        ),
+        skip AS (
+          SELECT ri.checklist_item_id AS item_id, count(*) AS v_skip
+          FROM run_items ri
+          WHERE ri.checklist_item_id IN (SELECT id FROM voci) AND ri.esito='SKIP'
+          GROUP BY ri.checklist_item_id
+        )
+        SELECT v.chiave, max(v.codice), min(v.categoria), min(v.titolo),
+               count(DISTINCT v.project_id),
+               sum(coalesce(p.v_pass, 0)) AS n_pass,
+               sum(coalesce(p.v_fail, 0)) AS n_fail,
+               sum(coalesce(s.v_skip, 0)) AS n_skip,
+               sum(coalesce(p.v_flip, 0)) AS flip,
+               max(p.v_ultimo_fail) AS ultimo_fail
+        FROM voci v
+        LEFT JOIN per_voce p ON p.item_id=v.id
+        LEFT JOIN skip s ON s.item_id=v.id
+        GROUP BY v.chiave
+        HAVING n_pass + n_fail + n_skip >= ?
+        ORDER BY {ORDINAMENTI[ordine]}, v.chiave
+    """
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    cur = con.execute(sql, params)
+    cur.row_factory = None
+    return [
+        ItemStats(
+            chiave=r[0],
+            codice=r[1] or "",
+            categoria=r[2] or "",
+            titolo=r[3] or "",
+            n_progetti=int(r[4]),
+            n_run=int(r[5] + r[6] + r[7]),
+            n_pass=int(r[5]),
+            n_fail=int(r[6]),
+            n_skip=int(r[7]),
+            flip=int(r[8]),
+            ultimo_fail=r[9],
+        )
+        for r in cur
+    ]
+
+
+def diff_runs(con: sqlite3.Connection, base_id: int, target_id: int) -> RunDiff:
+    # Voci che cambiano tra il run `base_id` e il run `target_id` dello stesso progetto:
+    # PASS -> FAIL, FAIL -> PASS, altri cambi (con SKIP), eseguite solo nel target, ancora da fare
+    # nel target. Un solo join: le voci attive in ordine di checklist (idx_checklist_project_ordine)
+    # con due ricerche sull'indice UNIQUE (run_id, checklist_item_id); le voci invariate restano in SQL.
+    base = db.get_run(con, base_id)
+    target = db.get_run(con, target_id)
+    if base is None or target is None:
+        raise ValueError(f"Run non trovato: {base_id if base is None else target_id}")
+    if base.project_id != target.project_id:
+        raise ValueError(f"I run {base_id} e {target_id} appartengono a progetti diversi")
+    project = db.get_project(con, base.project_id)
+    assert project is not None
+    cur = con.execute(
+        f"""
+        SELECT tipo, id, codice, categoria, titolo, esito_base, esito_target, note FROM (
+          SELECT {_DIFF_TIPO} AS tipo, ci.id, ci.codice, ci.categoria, ci.titolo, ci.ordine,
+                 b.esito AS esito_base, t.esito AS esito_target, coalesce(t.note, b.note, '') AS note
+          FROM checklist_items ci
+          LEFT JOIN run_items b ON b.run_id=? AND b.checklist_item_id=ci.id
+          LEFT JOIN run_items t ON t.run_id=? AND t.checklist_item_id=ci.id
+          WHERE ci.project_id=? AND ci.attivo=1
+        )
+        WHERE tipo IS NOT NULL
+        ORDER BY ordine, id
+        """,
+        (base_id, target_id, project.id),
+    )
+    cur.row_factory = None
+    righe: dict[str, list[DiffRow]] = {tipo: [] for tipo in DIFF_TIPI}
+    for r in cur:
+        righe[r[0]].append(r[1:])
+    totale = int(
+        con.execute("SELECT count(*) FROM checklist_items WHERE project_id=? AND attivo=1", (project.id,)).fetchone()[0]
+    )
+    return RunDiff(project, base, target, totale, righe)
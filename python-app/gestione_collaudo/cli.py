@@ -1,13 +1,14 @@
 from __future__ import annotations
 
 import argparse
-import pathlib
+import contextlib
+import sqlite3
 import sys
+import time
+from typing import Callable
 
 from gestione_collaudo import APP_AUTORE, APP_NOME, APP_VERSIONE
-from gestione_collaudo import db
-from gestione_collaudo.importers import import_checklist_csv
-from gestione_collaudo.reports import build_markdown_report, markdown_to_simple_html
+from gestione_collaudo import db, profiling
 
 
 def main() -> int:
@@ -17,6 +18,25 @@ def main() -> int:
     )
     parser.add_argument("--version", action="store_true", help="Mostra versione e esce")
     parser.add_argument("--db", default="collaudo.sqlite", help="Percorso DB SQLite")
+    parser.add_argument(
+        "--journal",
+        choices=db.JOURNAL_MODES,
+        default=None,
+        help="Modalita' journal (es. wal per piu' postazioni sullo stesso disco locale; non usare wal su cartelle di rete)",
+    )
+    parser.add_argument("--synchronous", choices=db.SYNCHRONOUS_LEVELS, default=None, help="Livello PRAGMA synchronous")
+    parser.add_argument(
+        "--busy-timeout",
+        type=int,
+        default=db.DEFAULT_BUSY_TIMEOUT_MS,
+        help="Attesa massima (ms) se il DB e' occupato da un altro processo",
+    )
+    parser.add_argument("--profile", action="store_true", help="Misura query e fasi e stampa un riepilogo su stderr")
+    parser.add_argument(
+        "--profile-out",
+        default="",
+        help="Salva anche le statistiche cProfile in questo file, implica --profile (python -m pstats FILE)",
+    )
     # Non rendiamo obbligatorio il subcomando per consentire `--version` senza errori.
     sub = parser.add_subparsers(dest="cmd")
 
@@ -26,20 +46,111 @@ def main() -> int:
     p_new.add_argument("--sito", default="")
     p_new.add_argument("--note", default="")
 
-    p_imp = sub.add_parser("import-checklist", help="Importa checklist da CSV (sostituisce)")
+    p_imp = sub.add_parser("import-checklist", help="Importa checklist da CSV (sostituisce, o aggiorna con --sync)")
     p_imp.add_argument("--project-id", type=int, required=True)
     p_imp.add_argument("--csv", required=True)
+    p_imp.add_argument(
+        "--sync",
+        action="store_true",
+        help="Aggiorna solo le voci cambiate mantenendo gli esiti dei run (abbina per codice o titolo+categoria)",
+    )
+
+    p_dir = sub.add_parser("import-dir", help="Crea un progetto per ogni CSV di una cartella e ne importa la checklist")
+    p_dir.add_argument("--dir", required=True)
+    p_dir.add_argument("--pattern", default="*.csv", help="Filtro file (default: *.csv)")
+    p_dir.add_argument("--cliente", default="")
+    p_dir.add_argument("--sito", default="")
+    p_dir.add_argument("--workers", type=int, default=None, help="Processi per il parsing (default: numero di CPU)")
+    p_dir.add_argument("--batch", type=int, default=20, help="File scritti per transazione")
 
     p_run = sub.add_parser("new-run", help="Crea una nuova esecuzione")
     p_run.add_argument("--project-id", type=int, required=True)
     p_run.add_argument("--nome", required=True)
     p_run.add_argument("--operatore", default="")
 
+    p_res = sub.add_parser("record-results", help="Registra in blocco gli esiti di un run da CSV/JSONL")
+    p_res.add_argument("--run-id", type=int, required=True)
+    p_res.add_argument("--file", required=True, help="CSV o JSONL con checklist_item_id, esito, note")
+
     p_rep = sub.add_parser("export-report", help="Esporta report di un run")
     p_rep.add_argument("--project-id", type=int, required=True)
     p_rep.add_argument("--run-id", type=int, required=True)
     p_rep.add_argument("--out-md", required=True)
     p_rep.add_argument("--out-html", required=False)
+    p_rep.add_argument("--out-csv", required=False)
+    p_rep.add_argument("--out-json", required=False)
+    p_rep.add_argument("--no-cache", action="store_true", help="Rigenera anche se i dati non sono cambiati")
+
+    p_st = sub.add_parser("status", help="Avanzamento di tutti i run di un progetto")
+    p_st.add_argument("--project-id", type=int, required=True)
+
+    p_an = sub.add_parser("analyze", help="Voci che falliscono spesso o alternano PASS/FAIL tra i run")
+    p_an.add_argument(
+        "--project-id", type=int, action="append", default=None, help="Progetto (ripetibile; default: tutti)"
+    )
+    p_an.add_argument(
+        "--shared",
+        action="store_true",
+        help="Considera anche i run degli altri progetti con le stesse voci (richiede un solo --project-id)",
+    )
+    p_an.add_argument("--ordine", default="tasso", help="tasso, fail, flip o recenti (default: tasso)")
+    p_an.add_argument("--min-run", type=int, default=2, help="Ignora le voci con meno esiti di cosi'")
+    p_an.add_argument("--limit", type=int, default=20, help="Righe mostrate (0 = tutte)")
+
+    p_df = sub.add_parser("diff-runs", help="Voci che cambiano esito tra due run dello stesso progetto")
+    p_df.add_argument("--base", type=int, required=True, help="Run di riferimento (es. il collaudo precedente)")
+    p_df.add_argument("--target", type=int, required=True, help="Run da confrontare (es. il collaudo dopo la correzione)")
+    p_df.add_argument("--format", choices=("md", "html", "json"), default="md")
+    p_df.add_argument("--out", default="", help="File di output (default: stdout)")
+    p_df.add_argument("--fail-on-regression", action="store_true", help="Esce con codice 3 se ci sono voci PASS -> FAIL")
+
+    p_se = sub.add_parser("search", help="Cerca nelle voci della checklist e nelle note degli esiti")
+    p_se.add_argument("testo", help="Parole da cercare (anche parziali: 'emerg' trova 'emergenza')")
+    p_se.add_argument("--project-id", type=int, default=None)
+    p_se.add_argument("--run-id", type=int, default=None, help="Solo note di questo run")
+    p_se.add_argument("--esito", choices=db.ESITI, default=None, help="Solo note con questo esito")
+    p_se.add_argument("--in", dest="dove", choices=("tutto", "voci", "note"), default="tutto")
+    p_se.add_argument("--limit", type=int, default=20, help="Risultati per sezione (0 = tutti)")
+
+    p_reps = sub.add_parser("export-reports", help="Esporta i report di tutti i run (in parallelo)")
+    p_reps.add_argument("--project-id", default="all", help="ID progetto oppure 'all' (default)")
+    p_reps.add_argument("--closed-only", action="store_true", help="Solo run chiusi")
+    p_reps.add_argument(
+        "--template",
+        default=None,
+        help="Percorso dei file senza estensione; segnaposto: {project_id} {run_id} {project} {run} "
+        "(default: _export/report_project{project_id}_run{run_id})",
+    )
+    p_reps.add_argument("--formats", default="md,html", help="Formati separati da virgola (md,html,csv,json)")
+    p_reps.add_argument("--workers", type=int, default=None, help="Processi di rendering (default: numero di CPU)")
+    p_reps.add_argument("--no-cache", action="store_true", help="Rigenera anche i report con dati invariati")
+
+    p_dat = sub.add_parser("export-data", help="Esporta gli esiti con progetto, run e voce in CSV o JSONL (anche .gz)")
+    p_dat.add_argument("--out", required=True, help="File .csv, .jsonl, .csv.gz, .jsonl.gz; '-' per stdout")
+    p_dat.add_argument("--format", choices=("csv", "jsonl"), default=None, help="Default: dall'estensione di --out")
+    p_dat.add_argument("--gzip", action="store_true", help="Comprimi (implicito con estensione .gz)")
+    p_dat.add_argument("--project-id", type=int, action="append", default=None, help="Progetto (ripetibile; default: tutti)")
+    p_dat.add_argument("--dal", default=None, help="Esiti registrati da questa data (AAAA-MM-GG o ISO)")
+    p_dat.add_argument("--al", default=None, help="Esiti registrati fino a questa data (o istante ISO, UTC) compresa")
+    p_dat.add_argument("--esito", choices=db.ESITI, action="append", default=None, help="Solo questo esito (ripetibile)")
+
+    p_ing = sub.add_parser("ingest", help="Registra esiti da un file JSONL (anche in crescita, come tail -f) o da stdin")
+    p_ing.add_argument("file", help="File JSONL con run_id, voce, esito, note, valore; '-' per stdin")
+    p_ing.add_argument("--follow", action="store_true", help="Resta in attesa di nuove righe (Ctrl+C per uscire)")
+    p_ing.add_argument(
+        "--source", default=None, help="Nome con cui salvare la posizione raggiunta (default: percorso del file)"
+    )
+    p_ing.add_argument("--from-start", action="store_true", help="Ignora la posizione salvata e rilegge tutto")
+    p_ing.add_argument("--batch", type=int, default=1000, help="Esiti massimi per transazione")
+    p_ing.add_argument("--batch-ms", type=int, default=500, help="Attesa massima prima di scrivere un lotto")
+    p_ing.add_argument("--poll-ms", type=int, default=200, help="Intervallo di controllo del file con --follow")
+
+    p_srv = sub.add_parser("serve", help="API HTTP/JSON per piu' postazioni sullo stesso DB")
+    p_srv.add_argument("--host", default="127.0.0.1", help="Indirizzo di ascolto (0.0.0.0 per la rete locale)")
+    p_srv.add_argument("--port", type=int, default=8765)
+    p_srv.add_argument("--readers", type=int, default=4, help="Connessioni per le letture")
+    p_srv.add_argument("--max-batch", type=int, default=2000, help="Esiti massimi per transazione di scrittura")
+    p_srv.add_argument("--token", default=None, help="Richiede l'header 'Authorization: Bearer TOKEN'")
 
     args = parser.parse_args()
     if args.version:
@@ -48,50 +159,425 @@ def main() -> int:
     if not args.cmd:
         parser.print_help()
         return 2
-    con = db.connect(args.db)
+    if not (args.profile or args.profile_out):
+        return _run(parser, args)
+    profiler = profiling.enable()
+    calls = profiling.profile_calls(args.profile_out) if args.profile_out else contextlib.nullcontext()
+    try:
+        with calls, profiling.span(f"cli.{args.cmd}"):
+            return _run(parser, args)
+    finally:
+        profiling.disable()
+        print(profiler.summary(), file=sys.stderr)
+        if args.profile_out:
+            print(f"cProfile: {args.profile_out}", file=sys.stderr)
 
-    if args.cmd == "new-project":
-        pid = db.create_project(con, args.nome, args.cliente, args.sito, args.note)
-        print(f"OK project_id={pid}")
-        return 0
 
-    if args.cmd == "import-checklist":
-        items = import_checklist_csv(args.csv)
-        n = db.replace_checklist(con, args.project_id, items)
-        print(f"OK checklist importata: {n} voci")
-        return 0
+def _run(parser: argparse.ArgumentParser, args: argparse.Namespace) -> int:
+    con = db.connect(args.db, args.journal, args.synchronous, args.busy_timeout)
+    try:
+        return _dispatch(parser, args, con)
+    finally:
+        con.close()
+
+
+def _dispatch(parser: argparse.ArgumentParser, args: argparse.Namespace, con: sqlite3.Connection) -> int:
+    command = _COMMANDS.get(args.cmd)
+    if command is None:
+        parser.print_help()
+        return 1
+    return command(con, args)
+
+
+# I comandi importano cio' che serve solo quando vengono eseguiti (report, import, csv, ...):
+# l'avvio della CLI resta veloce anche quando viene lanciata migliaia di volte da script.
+
+
+def _new_project(con: sqlite3.Connection, args: argparse.Namespace) -> int:
+    pid = db.create_project(con, args.nome, args.cliente, args.sito, args.note)
+    print(f"OK project_id={pid}")
+    return 0
+
 
-    if args.cmd == "new-run":
-        rid = db.create_run(con, args.project_id, args.nome, args.operatore)
-        print(f"OK run_id={rid}")
+def _import_checklist(con: sqlite3.Connection, args: argparse.Namespace) -> int:
+    from gestione_collaudo.importers import iter_checklist_csv
+
+    items = iter_checklist_csv(args.csv)
+    if args.sync:
+        res = db.sync_checklist(con, args.project_id, items)
+        print(
+            f"OK checklist sincronizzata: {res.inserite} nuove, {res.aggiornate} aggiornate, "
+            f"{res.riordinate} riordinate, {res.ritirate} ritirate, {res.invariate} invariate"
+        )
         return 0
+    n = db.replace_checklist(con, args.project_id, items)
+    print(f"OK checklist importata: {n} voci")
+    return 0
 
-    if args.cmd == "export-report":
-        project = db.get_project(con, args.project_id)
-        if not project:
-            print("Progetto non trovato.", file=sys.stderr)
-            return 1
-        runs = [r for r in db.list_runs(con, args.project_id) if r.id == args.run_id]
-        if not runs:
-            print("Run non trovato.", file=sys.stderr)
+
+def _status(con: sqlite3.Connection, args: argparse.Namespace) -> int:
+    project = db.get_project(con, args.project_id)
+    if not project:
+        print("Progetto non trovato.", file=sys.stderr)
+        return 1
+    runs = {r.id: r for r in db.list_runs(con, args.project_id)}
+    print(f"{project.nome} - project_id={project.id}")
+    print(f"{'run':>6}  {'nome':<24} {'stato':<7} {'PASS':>6} {'FAIL':>6} {'SKIP':>6} {'TODO':>6} {'%':>6}")
+    for s in db.get_run_summaries(con, args.project_id):
+        r = runs.get(s.run_id)
+        nome = r.nome if r else ""
+        stato = "chiuso" if r and r.closed_at else "aperto"
+        print(
+            f"{s.run_id:>6}  {nome[:24]:<24} {stato:<7} {s.n_pass:>6} {s.n_fail:>6} {s.n_skip:>6} "
+            f"{s.n_todo:>6} {s.completamento:>5.1f}%"
+        )
+    return 0
+
+
+def _analyze(con: sqlite3.Connection, args: argparse.Namespace) -> int:
+    from gestione_collaudo import analytics
+
+    if args.ordine not in analytics.ORDINAMENTI:
+        print(f"Ordinamento non valido: {args.ordine} (usa {', '.join(analytics.ORDINAMENTI)})", file=sys.stderr)
+        return 2
+    if args.shared and len(args.project_id or ()) != 1:
+        print("--shared richiede esattamente un --project-id.", file=sys.stderr)
+        return 2
+    t0 = time.perf_counter()
+    stats = analytics.item_stats(
+        con,
+        project_ids=None if args.shared else args.project_id,
+        shared_with=args.project_id[0] if args.shared else None,
+        ordine=args.ordine,
+        min_runs=args.min_run,
+        limit=args.limit or None,
+    )
+    print(f"{'voce':<40} {'prog':>4} {'run':>6} {'FAIL':>6} {'%fail':>6} {'flip':>5}  ultimo FAIL")
+    for st in stats:
+        voce = f"[{st.codice}] {st.titolo}" if st.codice else f"[{st.categoria}] {st.titolo}"
+        print(
+            f"{voce[:40]:<40} {st.n_progetti:>4} {st.n_run:>6} {st.n_fail:>6} {st.tasso_fail:>5.1f}% "
+            f"{st.flip:>5}  {st.ultimo_fail or '-'}"
+        )
+    print(f"{len(stats)} voci in {time.perf_counter() - t0:.2f}s")
+    return 0
+
+
+def _diff_runs(con: sqlite3.Connection, args: argparse.Namespace) -> int:
+    from gestione_collaudo import analytics
+    from gestione_collaudo.reports import DIFF_RENDERERS
+
+    try:
+        diff = analytics.diff_runs(con, args.base, args.target)
+    except ValueError as exc:
+        print(f"Errore: {exc}", file=sys.stderr)
+        return 1
+    render = DIFF_RENDERERS[args.format]
+    if args.out:
+        try:
+            with open(args.out, "w", encoding="utf-8", newline="\n") as f, profiling.span(f"diff.render.{args.format}"):
+                render(diff, f)
+        except OSError as exc:
+            print(f"Errore: {exc}", file=sys.stderr)
             return 1
-        run = runs[0]
-        checklist = db.list_checklist(con, args.project_id)
-        progress = db.get_run_progress(con, args.run_id)
-        md = build_markdown_report(project, run, checklist, progress, generated_by=f"{APP_NOME} v{APP_VERSIONE} ({APP_AUTORE})")
-        out_md = pathlib.Path(args.out_md).resolve()
-        out_md.parent.mkdir(parents=True, exist_ok=True)
-        out_md.write_text(md, encoding="utf-8")
-        print(f"OK MD: {out_md}")
-        if args.out_html:
-            out_html = pathlib.Path(args.out_html).resolve()
-            out_html.parent.mkdir(parents=True, exist_ok=True)
-            out_html.write_text(markdown_to_simple_html(md, footer=f"{APP_NOME} v{APP_VERSIONE} - {APP_AUTORE}"), encoding="utf-8")
-            print(f"OK HTML: {out_html}")
+        cambi = ", ".join(f"{len(rows)} {tipo}" for tipo, rows in diff.righe.items())
+        print(f"OK {args.format.upper()}: {args.out} ({cambi}, {diff.invariate} invariate)")
+    else:
+        render(diff, sys.stdout)
+    return 3 if args.fail_on_regression and diff.regressioni else 0
+
+
+def _search(con: sqlite3.Connection, args: argparse.Namespace) -> int:
+    from gestione_collaudo import search
+
+    limit = args.limit or None
+    if not search.fts_available(con):
+        print("(FTS5 non disponibile: ricerca con LIKE, piu' lenta e senza ordinamento per pertinenza)")
+    if args.dove in ("tutto", "voci") and args.run_id is None and args.esito is None:
+        voci = search.search_checklist(con, args.testo, args.project_id, limit)
+        print(f"Voci ({len(voci)}):")
+        for v in voci:
+            cod = f"[{v.codice}] " if v.codice else ""
+            cat = f"[{v.categoria}] " if v.categoria else ""
+            print(f"  project_id={v.project_id} id={v.id}  {cod}{cat}{v.titolo}")
+    if args.dove in ("tutto", "note"):
+        note = search.search_notes(con, args.testo, args.project_id, args.run_id, args.esito, limit)
+        print(f"Note ({len(note)}):")
+        for n in note:
+            print(f"  run_id={n.run_id} voce={n.checklist_item_id} {n.esito:<4} {n.titolo}: {n.note}")
+    return 0
+
+
+def _new_run(con: sqlite3.Connection, args: argparse.Namespace) -> int:
+    rid = db.create_run(con, args.project_id, args.nome, args.operatore)
+    print(f"OK run_id={rid}")
+    return 0
+
+
+def _record_results(con: sqlite3.Connection, args: argparse.Namespace) -> int:
+    import csv
+
+    from gestione_collaudo.importers import iter_results_file
+
+    try:
+        n = db.set_run_items_bulk(con, args.run_id, iter_results_file(args.file))
+    except (OSError, ValueError, csv.Error, sqlite3.IntegrityError) as exc:
+        print(f"Errore: {exc}", file=sys.stderr)
+        return 1
+    print(f"OK esiti registrati: {n}")
+    return 0
+
+
+def _export_report(con: sqlite3.Connection, args: argparse.Namespace) -> int:
+    import pathlib
+
+    from gestione_collaudo.export import export_run_report
+
+    outputs = {"md": args.out_md, "html": args.out_html, "csv": args.out_csv, "json": args.out_json}
+    paths = {fmt: pathlib.Path(p).resolve() for fmt, p in outputs.items() if p}
+    if not db.get_project(con, args.project_id):
+        print("Progetto non trovato.", file=sys.stderr)
+        return 1
+    res = export_run_report(con, args.project_id, args.run_id, paths, use_cache=not args.no_cache)
+    if res is None:
+        print("Run non trovato.", file=sys.stderr)
+        return 1
+    stato = " (invariato, da cache)" if res.cached else ""
+    for fmt, path in paths.items():
+        print(f"OK {fmt.upper()}: {path}{stato}")
+    return 0
+
+
+def _export_reports(con: sqlite3.Connection, args: argparse.Namespace) -> int:
+    from gestione_collaudo.export import CACHE_STATS, DEFAULT_TEMPLATE, export_reports_batch
+
+    project_id = None
+    if args.project_id != "all":
+        try:
+            project_id = int(args.project_id)
+        except ValueError:
+            print("--project-id deve essere un numero oppure 'all'.", file=sys.stderr)
+            return 2
+    formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+    runs = db.find_runs(con, project_id, closed_only=args.closed_only)
+    if not runs:
+        print("Nessun run da esportare.")
         return 0
 
-    parser.print_help()
-    return 1
+    t0 = time.perf_counter()
+    errors = 0
+    files = 0
+    size = 0
+    try:
+        template = args.template or DEFAULT_TEMPLATE
+        for res in export_reports_batch(args.db, runs, template, formats, args.workers, not args.no_cache):
+            if res.error:
+                errors += 1
+                print(f"ERRORE project={res.project_id} run={res.run_id}: {res.error}")
+                continue
+            if res.cached:
+                print(f"OK project={res.project_id} run={res.run_id}: invariato (cache)")
+                continue
+            files += len(res.paths)
+            size += res.size
+            print(f"OK project={res.project_id} run={res.run_id}: {res.elapsed * 1000:.0f} ms -> {', '.join(res.paths)}")
+    except KeyError as exc:
+        print(f"Segnaposto non valido nel template: {exc}", file=sys.stderr)
+        return 2
+    except ValueError as exc:
+        print(f"Errore: {exc}", file=sys.stderr)
+        return 2
+    elapsed = time.perf_counter() - t0
+    ok = len(runs) - errors
+    print(
+        f"Totale: {ok} run, {files} file scritti, {size / 1e6:.1f} MB in {elapsed:.2f}s "
+        f"({ok / elapsed:.1f} run/s, {size / 1e6 / elapsed:.1f} MB/s), {errors} errori"
+    )
+    print(f"Cache report: {CACHE_STATS.hits} hit, {CACHE_STATS.misses} miss")
+    return 1 if errors else 0
+
+
+def _import_dir(con: sqlite3.Connection, args: argparse.Namespace) -> int:
+    import pathlib
+
+    from gestione_collaudo.importers import parse_checklist_files
+
+    folder = pathlib.Path(args.dir).resolve()
+    if not folder.is_dir():
+        print(f"Cartella non trovata: {folder}", file=sys.stderr)
+        return 1
+    files = sorted(p for p in folder.glob(args.pattern) if p.is_file())
+    if not files:
+        print(f"Nessun file {args.pattern} in {folder}")
+        return 0
+
+    t0 = time.perf_counter()
+    # (file, voci, secondi parsing, secondi scrittura, errore)
+    report: list[tuple[str, int, float, float, str]] = []
+    batch = []
+
+    def flush() -> None:
+        if not batch:
+            return
+        tw = time.perf_counter()
+        try:
+            with db.transaction(con):
+                for parsed in batch:
+                    pid = db.create_project(con, pathlib.Path(parsed.path).stem, args.cliente, args.sito)
+                    db.replace_checklist(con, pid, parsed.items)
+        except sqlite3.Error as exc:
+            for parsed in batch:
+                report.append((parsed.path, 0, parsed.elapsed, 0.0, f"Errore DB: {exc}"))
+        else:
+            per_file = (time.perf_counter() - tw) / len(batch)
+            for parsed in batch:
+                report.append((parsed.path, len(parsed.items), parsed.elapsed, per_file, ""))
+        batch.clear()
+
+    for parsed in parse_checklist_files(files, args.workers):
+        if parsed.error:
+            report.append((parsed.path, 0, parsed.elapsed, 0.0, parsed.error))
+            continue
+        batch.append(parsed)
+        if len(batch) >= max(args.batch, 1):
+            flush()
+    flush()
+
+    elapsed = time.perf_counter() - t0
+    errors = 0
+    for path, n, t_parse, t_write, err in report:
+        name = pathlib.Path(path).name
+        if err:
+            errors += 1
+            print(f"ERRORE {name}: {err} (parsing {t_parse * 1000:.0f} ms)")
+        else:
+            print(f"OK {name}: {n} voci (parsing {t_parse * 1000:.0f} ms, scrittura {t_write * 1000:.0f} ms)")
+    ok = len(report) - errors
+    voci = sum(n for _, n, _, _, _ in report)
+    print(f"Totale: {ok} progetti importati, {errors} errori, {voci} voci in {elapsed:.2f}s")
+    return 1 if errors else 0
+
+
+def _ingest(con: sqlite3.Connection, args: argparse.Namespace) -> int:
+    import os
+    import signal
+
+    from gestione_collaudo import ingest
+
+    errors = 0
+
+    def on_error(position: int, message: str) -> None:
+        nonlocal errors
+        errors += 1
+        if errors <= 20:
+            print(f"Riga scartata (byte {position}): {message}", file=sys.stderr)
+
+    stdin = args.file == "-"
+    source = None if stdin else args.source or os.path.abspath(args.file)
+    if source is not None and args.from_start:
+        db.reset_ingest_offset(con, source)
+    ingestor = ingest.Ingestor(con, source, "", args.batch, args.batch_ms / 1000, on_error)
+    # SIGTERM (es. servizio fermato) come Ctrl+C: si scrive il lotto in attesa e si esce.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    t0 = time.perf_counter()
+    try:
+        if stdin:
+            ingest.read_stream(sys.stdin.buffer, ingestor, args.poll_ms / 1000)
+        else:
+            ingest.follow_file(args.file, ingestor, args.follow, args.poll_ms / 1000)
+    except OSError as exc:
+        print(f"Errore: {exc}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        ingestor.flush()
+    elapsed = time.perf_counter() - t0
+    st = ingestor.stats()
+    print(
+        f"OK esiti registrati: {st.registrate} su {st.lette} righe ({st.scartate} scartate) "
+        f"in {st.batch} transazioni, {elapsed:.2f}s ({st.registrate / max(elapsed, 1e-9):.0f}/s)"
+    )
+    if source is not None:
+        print(f"Posizione salvata per {source}: byte {st.posizione}")
+        rest = os.path.getsize(args.file) - st.posizione if not args.follow else 0
+        if rest > 0:
+            print(f"Ultima riga incompleta ({rest} byte senza a capo): verra' letta alla prossima esecuzione", file=sys.stderr)
+    return 0
+
+
+def _serve(con: sqlite3.Connection, args: argparse.Namespace) -> int:
+    import asyncio
+
+    from gestione_collaudo import server
+
+    # Il server e' l'unico processo sul DB (disco locale): WAL permette letture durante le scritture.
+    srv = server.Server(
+        args.db,
+        args.journal or "wal",
+        args.synchronous,
+        args.busy_timeout,
+        args.readers,
+        args.max_batch,
+        args.token,
+    )
+
+    def ready(host: str, port: int) -> None:
+        print(f"In ascolto su http://{host}:{port} (Ctrl+C per fermare)", flush=True)
+
+    try:
+        asyncio.run(server.serve(srv, args.host, args.port, ready))
+    except OSError as exc:
+        print(f"Errore: {exc}", file=sys.stderr)
+        return 1
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    s = srv.stats
+    print(f"Fermato: {s.richieste} richieste, {s.esiti} esiti in {s.transazioni} transazioni")
+    return 0
+
+
+def _export_data(con: sqlite3.Connection, args: argparse.Namespace) -> int:
+    from gestione_collaudo.export import data_format, date_bounds, export_data
+
+    fmt, compress = data_format(args.out)
+    try:
+        since, until = date_bounds(args.dal, args.al)
+        res = export_data(
+            con,
+            sys.stdout.buffer if args.out == "-" else args.out,
+            args.format or fmt,
+            compress or args.gzip,
+            args.project_id,
+            since,
+            until,
+            args.esito,
+        )
+    except (OSError, ValueError, sqlite3.Error) as exc:
+        print(f"Errore: {exc}", file=sys.stderr)
+        return 1
+    size = f", {res.size / 1e6:.1f} MB" if res.size is not None else ""
+    print(
+        f"OK {res.righe} esiti esportati in {res.elapsed:.2f}s ({res.righe / max(res.elapsed, 1e-9):.0f}/s{size}): {res.path}",
+        file=sys.stderr if args.out == "-" else sys.stdout,
+    )
+    return 0
+
+
+_COMMANDS: dict[str, Callable[[sqlite3.Connection, argparse.Namespace], int]] = {
+    "new-project": _new_project,
+    "import-checklist": _import_checklist,
+    "import-dir": _import_dir,
+    "new-run": _new_run,
+    "record-results": _record_results,
+    "export-report": _export_report,
+    "status": _status,
+    "analyze": _analyze,
+    "diff-runs": _diff_runs,
+    "search": _search,
+    "export-reports": _export_reports,
+    "export-data": _export_data,
+    "ingest": _ingest,
+    "serve": _serve,
+}
 
 
 if __name__ == "__main__":
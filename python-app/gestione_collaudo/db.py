@@ -1,22 +1,190 @@
 from __future__ import annotations
 
+import atexit
+import os
+import random
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Iterable
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Sequence
 
-from gestione_collaudo.models import ChecklistItem, Project, Run
+from gestione_collaudo import profiling
+from gestione_collaudo.models import (
+    ChecklistItem,
+    ChecklistSyncResult,
+    Esito,
+    ItemResult,
+    Project,
+    Run,
+    RunProgress,
+    RunSummary,
+)
 
+# Versione dello schema, salvata in `PRAGMA user_version`.
+# Ogni migrazione in `_MIGRATIONS` porta lo schema dalla versione i alla i+1.
+SCHEMA_VERSION = 10
 
-def connect(db_path: str) -> sqlite3.Connection:
-    con = sqlite3.connect(db_path)
+JOURNAL_MODES = ("delete", "truncate", "persist", "wal")
+SYNCHRONOUS_LEVELS = ("off", "normal", "full", "extra")
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+
+# Tentativi (con backoff esponenziale + jitter) per acquisire il lock di scrittura
+# quando il busy_timeout non basta (es. commit in modalita' rollback con lettori attivi).
+WRITE_RETRIES = 6
+_RETRY_BASE_DELAY = 0.05
+_RETRY_MAX_DELAY = 2.0
+
+_connections: dict[str, sqlite3.Connection] = {}
+_connections_lock = threading.Lock()
+
+
+def connect(
+    db_path: str,
+    journal_mode: str | None = None,
+    synchronous: str | None = None,
+    busy_timeout_ms: int = DEFAULT_BUSY_TIMEOUT_MS,
+) -> sqlite3.Connection:
+    # journal_mode e' persistente nel file: None lascia quello attuale.
+    # Nota: WAL richiede memoria condivisa, non usarlo su DB in cartelle di rete (SMB).
+    if journal_mode is not None and journal_mode.lower() not in JOURNAL_MODES:
+        raise ValueError(f"journal_mode non valido: {journal_mode}")
+    if synchronous is not None and synchronous.lower() not in SYNCHRONOUS_LEVELS:
+        raise ValueError(f"synchronous non valido: {synchronous}")
+    # TracedConnection misura le query solo mentre un profiler e' attivo (vedi profiling.enable).
+    con = sqlite3.connect(db_path, timeout=max(busy_timeout_ms, 0) / 1000, factory=profiling.TracedConnection)
     con.row_factory = sqlite3.Row
     con.execute("PRAGMA foreign_keys = ON;")
-    _init_schema(con)
+    if journal_mode is not None:
+        _set_journal_mode(con, journal_mode.lower())
+    if synchronous is not None:
+        con.execute(f"PRAGMA synchronous = {synchronous.upper()}")
+    # Percorso veloce: se lo schema e' gia' aggiornato non eseguiamo DDL ne' commit.
+    if _schema_version(con) < SCHEMA_VERSION:
+        _init_schema(con)
+    _sync_fts(con)
     return con
 
 
+def get_connection(
+    db_path: str,
+    journal_mode: str | None = None,
+    synchronous: str | None = None,
+    busy_timeout_ms: int = DEFAULT_BUSY_TIMEOUT_MS,
+) -> sqlite3.Connection:
+    # Una connessione condivisa per percorso DB, per tutta la vita del processo.
+    # La connessione e' utilizzabile solo dal thread che l'ha creata.
+    # Le opzioni valgono solo alla prima apertura.
+    key = _path_key(db_path)
+    with _connections_lock:
+        con = _connections.get(key)
+        if con is None:
+            con = connect(db_path, journal_mode, synchronous, busy_timeout_ms)
+            _connections[key] = con
+        return con
+
+
+def close_connection(db_path: str) -> None:
+    with _connections_lock:
+        con = _connections.pop(_path_key(db_path), None)
+    if con is not None:
+        con.close()
+
+
+def close_all() -> None:
+    with _connections_lock:
+        cons = list(_connections.values())
+        _connections.clear()
+    for con in cons:
+        try:
+            con.close()
+        except sqlite3.Error:
+            pass
+
+
+atexit.register(close_all)
+
+
+def _path_key(db_path: str) -> str:
+    if db_path == ":memory:" or db_path.startswith("file:"):
+        return db_path
+    return os.path.normcase(os.path.abspath(db_path))
+
+
+def _schema_version(con: sqlite3.Connection) -> int:
+    return int(con.execute("PRAGMA user_version").fetchone()[0])
+
+
+def _set_journal_mode(con: sqlite3.Connection, mode: str) -> None:
+    current = str(con.execute("PRAGMA journal_mode").fetchone()[0]).lower()
+    if current == mode:
+        return
+    # Il cambio di modalita' richiede un lock esclusivo: riproviamo se il DB e' occupato.
+    _with_backoff(lambda: con.execute(f"PRAGMA journal_mode = {mode.upper()}").fetchone())
+
+
+@contextmanager
+def transaction(con: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    # Transazione di scrittura: BEGIN IMMEDIATE prende subito il lock di scrittura
+    # (con retry/backoff), cosi' non si resta bloccati a meta' tra piu' scrittori.
+    # Se c'e' gia' una transazione aperta, le operazioni entrano in quella.
+    if con.in_transaction:
+        yield con
+        return
+    _with_backoff(lambda: con.execute("BEGIN IMMEDIATE"))
+    try:
+        yield con
+    except BaseException:
+        con.rollback()
+        raise
+    try:
+        _with_backoff(con.commit)
+    except BaseException:
+        con.rollback()
+        raise
+
+
+def _is_busy(exc: sqlite3.OperationalError) -> bool:
+    msg = str(exc).lower()
+    return "locked" in msg or "busy" in msg
+
+
+def _with_backoff(fn: Callable[[], object]) -> None:
+    delay = _RETRY_BASE_DELAY
+    for attempt in range(WRITE_RETRIES):
+        try:
+            fn()
+            return
+        except sqlite3.OperationalError as exc:
+            if not _is_busy(exc) or attempt == WRITE_RETRIES - 1:
+                raise
+        time.sleep(delay + random.uniform(0, delay))
+        delay = min(delay * 2, _RETRY_MAX_DELAY)
+
+
 def _init_schema(con: sqlite3.Connection) -> None:
-    con.executescript(
+    # BEGIN IMMEDIATE: se piu' processi aprono insieme un DB vecchio, uno solo migra.
+    with transaction(con):
+        version = _schema_version(con)
+        for v in range(version, SCHEMA_VERSION):
+            _MIGRATIONS[v](con)
+        if version < SCHEMA_VERSION:
+            con.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def _run_statements(con: sqlite3.Connection, script: str) -> None:
+    # Come executescript, ma dentro la transazione corrente (executescript fa COMMIT).
+    for stmt in script.split(";"):
+        if stmt.strip():
+            con.execute(stmt)
+
+
+def _migrate_v1(con: sqlite3.Connection) -> None:
+    # Schema base; IF NOT EXISTS rende la migrazione sicura anche sui DB creati prima del versionamento.
+    _run_statements(
+        con,
         """
         CREATE TABLE IF NOT EXISTS projects (
           id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -61,9 +229,250 @@ def _init_schema(con: sqlite3.Connection) -> None:
         CREATE INDEX IF NOT EXISTS idx_checklist_project ON checklist_items(project_id);
         CREATE INDEX IF NOT EXISTS idx_runs_project ON runs(project_id);
         CREATE INDEX IF NOT EXISTS idx_run_items_run ON run_items(run_id);
+        """,
+    )
+
+
+def _migrate_v2(con: sqlite3.Connection) -> None:
+    # Un solo esito per (run, voce): teniamo la riga piu' recente e aggiungiamo il vincolo
+    # UNIQUE su cui si appoggia l'UPSERT. L'indice su run_id diventa ridondante.
+    _run_statements(
+        con,
         """
+        DELETE FROM run_items
+        WHERE id NOT IN (SELECT max(id) FROM run_items GROUP BY run_id, checklist_item_id);
+
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_run_items_run_item ON run_items(run_id, checklist_item_id);
+        DROP INDEX IF EXISTS idx_run_items_run;
+        """,
     )
-    con.commit()
+
+
+def _migrate_v3(con: sqlite3.Connection) -> None:
+    # `codice`: chiave stabile opzionale della voce. `attivo`: le voci tolte dalla checklist
+    # vengono ritirate invece che cancellate, cosi' gli esiti gia' registrati restano.
+    cols = {str(r[1]) for r in con.execute("PRAGMA table_info(checklist_items)")}
+    if "codice" not in cols:
+        con.execute("ALTER TABLE checklist_items ADD COLUMN codice TEXT NOT NULL DEFAULT ''")
+    if "attivo" not in cols:
+        con.execute("ALTER TABLE checklist_items ADD COLUMN attivo INTEGER NOT NULL DEFAULT 1")
+    _run_statements(
+        con,
+        """
+        CREATE INDEX IF NOT EXISTS idx_checklist_project_ordine ON checklist_items(project_id, attivo, ordine);
+        DROP INDEX IF EXISTS idx_checklist_project;
+        """,
+    )
+
+
+def _migrate_v4(con: sqlite3.Connection) -> None:
+    # `checklist_rev` cresce a ogni modifica della checklist (impronta dei report in cache).
+    cols = {str(r[1]) for r in con.execute("PRAGMA table_info(projects)")}
+    if "checklist_rev" not in cols:
+        con.execute("ALTER TABLE projects ADD COLUMN checklist_rev INTEGER NOT NULL DEFAULT 0")
+    _run_statements(
+        con,
+        """
+        CREATE TABLE IF NOT EXISTS report_cache (
+          path TEXT PRIMARY KEY,
+          fingerprint TEXT NOT NULL,
+          file_stat TEXT NOT NULL
+        ) WITHOUT ROWID;
+        """,
+    )
+
+
+def _migrate_v5(con: sqlite3.Connection) -> None:
+    # Indice di copertura per le sintesi dei run (GROUP BY run_id, esito senza leggere la tabella)
+    # e indice parziale per sapere subito se un progetto ha voci ritirate.
+    _run_statements(
+        con,
+        """
+        CREATE INDEX IF NOT EXISTS idx_run_items_run_esito ON run_items(run_id, esito, checklist_item_id);
+        CREATE INDEX IF NOT EXISTS idx_checklist_retired ON checklist_items(project_id) WHERE attivo=0;
+        """,
+    )
+
+
+def _migrate_v6(con: sqlite3.Connection) -> None:
+    # Storico di una voce su tutti i run, gia' in ordine di run: le analisi (analytics.py)
+    # leggono solo l'indice, senza ordinamenti temporanei.
+    _run_statements(
+        con,
+        """
+        CREATE INDEX IF NOT EXISTS idx_run_items_item_run ON run_items(checklist_item_id, run_id, esito, timestamp);
+        """,
+    )
+
+
+# Tabelle FTS5 (a contenuto esterno) per la ricerca testuale, tenute allineate dai trigger.
+# Le note vuote non vengono indicizzate. Vedi search.py.
+_FTS_TABLES = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS checklist_fts USING fts5("
+    "titolo, categoria, atteso, content='checklist_items', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS run_notes_fts USING fts5("
+    "note, content='run_items', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+)
+
+_FTS_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS checklist_fts_ai AFTER INSERT ON checklist_items BEGIN
+      INSERT INTO checklist_fts(rowid, titolo, categoria, atteso)
+      VALUES (new.id, new.titolo, new.categoria, new.atteso);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS checklist_fts_ad AFTER DELETE ON checklist_items BEGIN
+      INSERT INTO checklist_fts(checklist_fts, rowid, titolo, categoria, atteso)
+      VALUES ('delete', old.id, old.titolo, old.categoria, old.atteso);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS checklist_fts_au AFTER UPDATE OF titolo, categoria, atteso ON checklist_items BEGIN
+      INSERT INTO checklist_fts(checklist_fts, rowid, titolo, categoria, atteso)
+      VALUES ('delete', old.id, old.titolo, old.categoria, old.atteso);
+      INSERT INTO checklist_fts(rowid, titolo, categoria, atteso)
+      VALUES (new.id, new.titolo, new.categoria, new.atteso);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS run_notes_fts_ai AFTER INSERT ON run_items WHEN new.note <> '' BEGIN
+      INSERT INTO run_notes_fts(rowid, note) VALUES (new.id, new.note);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS run_notes_fts_ad AFTER DELETE ON run_items WHEN old.note <> '' BEGIN
+      INSERT INTO run_notes_fts(run_notes_fts, rowid, note) VALUES ('delete', old.id, old.note);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS run_notes_fts_au AFTER UPDATE OF note ON run_items
+    WHEN old.note IS NOT new.note BEGIN
+      INSERT INTO run_notes_fts(run_notes_fts, rowid, note) SELECT 'delete', old.id, old.note WHERE old.note <> '';
+      INSERT INTO run_notes_fts(rowid, note) SELECT new.id, new.note WHERE new.note <> '';
+    END""",
+)
+
+
+_FTS_TRIGGER_NAMES = (
+    "checklist_fts_ai",
+    "checklist_fts_ad",
+    "checklist_fts_au",
+    "run_notes_fts_ai",
+    "run_notes_fts_ad",
+    "run_notes_fts_au",
+)
+
+
+def fts5_available(con: sqlite3.Connection) -> bool:
+    # Modulo FTS5 presente nella libreria SQLite in uso (senza DDL: basta un PRAGMA).
+    return any(r[0] == "fts5" for r in con.execute("PRAGMA module_list"))
+
+
+def _create_fts(con: sqlite3.Connection) -> None:
+    # Tabelle e trigger FTS, con l'indice ricostruito da capo dalle tabelle di contenuto.
+    # I trigger si eseguono uno alla volta: _run_statements spezza sui ";".
+    for stmt in _FTS_TABLES + _FTS_TRIGGERS:
+        con.execute(stmt)
+    con.execute("INSERT INTO checklist_fts(checklist_fts) VALUES ('delete-all')")
+    con.execute("INSERT INTO run_notes_fts(run_notes_fts) VALUES ('delete-all')")
+    con.execute(
+        "INSERT INTO checklist_fts(rowid, titolo, categoria, atteso) "
+        "SELECT id, titolo, categoria, atteso FROM checklist_items"
+    )
+    con.execute("INSERT INTO run_notes_fts(rowid, note) SELECT id, note FROM run_items WHERE note <> ''")
+
+
+def _migrate_v7(con: sqlite3.Connection) -> None:
+    # Ricerca testuale su voci e note. Senza FTS5 nella libreria SQLite non si crea nulla
+    # e la ricerca usa LIKE (vedi anche _sync_fts).
+    if fts5_available(con):
+        _create_fts(con)
+
+
+def _fts_state(con: sqlite3.Connection) -> tuple[bool, int]:
+    # (tabelle FTS presenti, numero di trigger FTS presenti)
+    names = ("checklist_fts", "run_notes_fts") + _FTS_TRIGGER_NAMES
+    r = con.execute(
+        f"SELECT total(type='table'), total(type='trigger') FROM sqlite_master "
+        f"WHERE name IN ({','.join('?' * len(names))})",
+        names,
+    ).fetchone()
+    return int(r[0]) == 2, int(r[1])
+
+
+def _sync_fts(con: sqlite3.Connection) -> None:
+    # Lo stesso file puo' essere aperto da librerie SQLite diverse (es. un'altra build di Python).
+    # Se manca FTS5 i trigger renderebbero impossibile ogni scrittura ("no such module: fts5"):
+    # si eliminano e la ricerca usa LIKE. Con FTS5 di nuovo disponibile si ricreano trigger e
+    # indice (che nel frattempo non e' stato aggiornato).
+    fts5 = fts5_available(con)
+    tables, triggers = _fts_state(con)
+    if (triggers == len(_FTS_TRIGGER_NAMES)) if fts5 else not triggers:
+        return
+    with transaction(con):
+        tables, triggers = _fts_state(con)  # un altro processo puo' averlo gia' fatto
+        if fts5 and triggers < len(_FTS_TRIGGER_NAMES):
+            _create_fts(con)
+        elif not fts5:
+            for name in _FTS_TRIGGER_NAMES:
+                con.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def _migrate_v8(con: sqlite3.Connection) -> None:
+    # Indici per gli elenchi ordinati e paginati (list_projects_page / list_runs_page):
+    # l'ordinamento viene dall'indice, anche con il filtro per cliente o sito.
+    _run_statements(
+        con,
+        """
+        CREATE INDEX IF NOT EXISTS idx_projects_created ON projects(created_at, id);
+        CREATE INDEX IF NOT EXISTS idx_projects_cliente_created ON projects(cliente, created_at, id);
+        CREATE INDEX IF NOT EXISTS idx_projects_sito_created ON projects(sito, created_at, id);
+        CREATE INDEX IF NOT EXISTS idx_runs_project_started ON runs(project_id, started_at, id);
+        DROP INDEX IF EXISTS idx_runs_project;
+        """,
+    )
+
+
+def _migrate_v9(con: sqlite3.Connection) -> None:
+    # Posizione (byte) fino a cui ogni sorgente di `ingest` e' stata registrata; `file_id`
+    # identifica il file (dispositivo:inode) per accorgersi di rotazioni.
+    _run_statements(
+        con,
+        """
+        CREATE TABLE IF NOT EXISTS ingest_offsets (
+          source TEXT PRIMARY KEY,
+          file_id TEXT NOT NULL DEFAULT '',
+          position INTEGER NOT NULL,
+          updated_at TEXT NOT NULL
+        ) WITHOUT ROWID;
+        """,
+    )
+
+
+def _migrate_v10(con: sqlite3.Connection) -> None:
+    # `esiti_rev` cresce a ogni scrittura di esiti del run (impronta dei report in cache): numero
+    # e ultimo timestamp degli esiti non cambiano se un esito viene corretto nello stesso secondo.
+    cols = {str(r[1]) for r in con.execute("PRAGMA table_info(runs)")}
+    if "esiti_rev" not in cols:
+        con.execute("ALTER TABLE runs ADD COLUMN esiti_rev INTEGER NOT NULL DEFAULT 0")
+
+
+_MIGRATIONS: list[Callable[[sqlite3.Connection], None]] = [
+    _migrate_v1,
+    _migrate_v2,
+    _migrate_v3,
+    _migrate_v4,
+    _migrate_v5,
+    _migrate_v6,
+    _migrate_v7,
+    _migrate_v8,
+    _migrate_v9,
+    _migrate_v10,
+]
+
+
+ESITI = ("PASS", "FAIL", "SKIP")
+
+# Righe per executemany negli import in streaming.
+IMPORT_CHUNK = 5000
+
+_UPSERT_RUN_ITEM = (
+    "INSERT INTO run_items(run_id, checklist_item_id, esito, note, timestamp) VALUES(?,?,?,?,?) "
+    "ON CONFLICT(run_id, checklist_item_id) DO UPDATE SET "
+    "esito=excluded.esito, note=excluded.note, timestamp=excluded.timestamp"
+)
 
 
 def _now_iso() -> str:
@@ -71,148 +480,599 @@ def _now_iso() -> str:
 
 
 def create_project(con: sqlite3.Connection, nome: str, cliente: str = "", sito: str = "", note: str = "") -> int:
-    cur = con.execute(
-        "INSERT INTO projects(nome, cliente, sito, note, created_at) VALUES(?,?,?,?,?)",
-        (nome.strip(), cliente.strip(), sito.strip(), note.strip(), _now_iso()),
-    )
-    con.commit()
+    with transaction(con):
+        cur = con.execute(
+            "INSERT INTO projects(nome, cliente, sito, note, created_at) VALUES(?,?,?,?,?)",
+            (nome.strip(), cliente.strip(), sito.strip(), note.strip(), _now_iso()),
+        )
     return int(cur.lastrowid)
 
 
+# Colonne nell'ordine dei campi dei modelli: le righe diventano oggetti con Model(*row).
+_PROJECT_COLS = "id, nome, cliente, sito, note, created_at"
+_RUN_COLS = "id, project_id, nome, operatore, started_at, closed_at"
+_CHECKLIST_COLS = "id, project_id, titolo, categoria, atteso, ordine, codice"
+
+
+def _tuples(con: sqlite3.Connection, sql: str, params: Sequence[object] = ()) -> sqlite3.Cursor:
+    # Cursore con righe tuple (senza sqlite3.Row), per mappare le colonne per posizione.
+    cur = con.cursor()
+    cur.row_factory = None
+    return cur.execute(sql, params)
+
+
 def list_projects(con: sqlite3.Connection) -> list[Project]:
-    cur = con.execute("SELECT * FROM projects ORDER BY created_at DESC")
-    out: list[Project] = []
-    for r in cur.fetchall():
-        out.append(
-            Project(
-                id=int(r["id"]),
-                nome=str(r["nome"]),
-                cliente=str(r["cliente"]),
-                sito=str(r["sito"]),
-                note=str(r["note"]),
-                created_at=datetime.fromisoformat(str(r["created_at"]).replace("Z", "")),
-            )
-        )
-    return out
+    cur = _tuples(con, f"SELECT {_PROJECT_COLS} FROM projects ORDER BY created_at DESC, id DESC")
+    return [Project(*r) for r in cur]
+
+
+# Cursore di paginazione: (valore della colonna di ordinamento, id) dell'ultima riga della pagina.
+PageCursor = tuple[str, int]
+
+PAGE_SIZE = 200
+
+
+def _check_page_limit(limit: int) -> None:
+    # Con limit <= 0 SQLite non restituisce righe (o le restituisce tutte) e il cursore sarebbe incoerente.
+    if limit < 1:
+        raise ValueError(f"limit deve essere almeno 1: {limit}")
+
+
+def list_projects_page(
+    con: sqlite3.Connection,
+    after: PageCursor | None = None,
+    limit: int = PAGE_SIZE,
+    cliente: str | None = None,
+    sito: str | None = None,
+) -> tuple[list[Project], PageCursor | None]:
+    # Progetti dal piu' recente, una pagina alla volta (keyset: costo costante anche in fondo
+    # all'elenco). Restituisce la pagina e il cursore da passare come `after` per la successiva,
+    # None se non ce ne sono altre. `cliente` e `sito` filtrano per valore esatto.
+    _check_page_limit(limit)
+    where: list[str] = []
+    params: list[object] = []
+    if cliente:
+        where.append("cliente=?")
+        params.append(cliente.strip())
+    if sito:
+        where.append("sito=?")
+        params.append(sito.strip())
+    if after is not None:
+        where.append("(created_at, id) < (?, ?)")
+        params.extend(after)
+    sql = f"SELECT {_PROJECT_COLS} FROM projects"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    projects = [Project(*r) for r in _tuples(con, sql + " ORDER BY created_at DESC, id DESC LIMIT ?", (*params, limit))]
+    cursor = (projects[-1].created_at, projects[-1].id) if len(projects) == limit else None
+    return projects, cursor
 
 
 def delete_project(con: sqlite3.Connection, project_id: int) -> None:
-    con.execute("DELETE FROM projects WHERE id=?", (project_id,))
-    con.commit()
+    with transaction(con):
+        con.execute("DELETE FROM projects WHERE id=?", (project_id,))
+
+
+def replace_checklist(
+    con: sqlite3.Connection,
+    project_id: int,
+    items: Iterable[Sequence[str]],
+    progress: Callable[[int], None] | None = None,
+) -> int:
+    # items: (titolo, categoria, atteso[, codice]). Cancella anche gli esiti gia' registrati
+    # sulle voci: per aggiornare una checklist in uso vedi `sync_checklist`.
+    # Le righe vengono consumate in streaming a blocchi di IMPORT_CHUNK (memoria costante);
+    # `progress` riceve il numero di voci scritte dopo ogni blocco.
+    written = 0
+    with profiling.span("import.checklist"), transaction(con):
+        con.execute("DELETE FROM checklist_items WHERE project_id=?", (project_id,))
+        _bump_checklist_rev(con, project_id)
+        rows = (
+            (project_id, titolo, categoria, atteso, codice, ordine)
+            for ordine, (titolo, categoria, atteso, codice) in enumerate(_checklist_rows(items), start=1)
+        )
+        for chunk in _chunks(rows, IMPORT_CHUNK):
+            con.executemany(
+                "INSERT INTO checklist_items(project_id, titolo, categoria, atteso, codice, ordine) VALUES(?,?,?,?,?,?)",
+                chunk,
+            )
+            written += len(chunk)
+            if progress is not None:
+                progress(written)
+    return written
 
 
-def replace_checklist(con: sqlite3.Connection, project_id: int, items: Iterable[tuple[str, str, str]]) -> int:
-    con.execute("DELETE FROM checklist_items WHERE project_id=?", (project_id,))
-    rows = []
-    ordine = 1
-    for titolo, categoria, atteso in items:
+def sync_checklist(
+    con: sqlite3.Connection,
+    project_id: int,
+    items: Iterable[Sequence[str]],
+    progress: Callable[[int], None] | None = None,
+) -> ChecklistSyncResult:
+    # Aggiorna la checklist scrivendo solo le differenze. Le voci si abbinano per `codice`
+    # (se presente) oppure per titolo+categoria; quelle non piu' presenti vengono ritirate
+    # (attivo=0), quindi gli esiti dei run gia' eseguiti non si perdono.
+    # `progress` riceve il numero di righe del CSV elaborate, ogni IMPORT_CHUNK righe.
+    with profiling.span("import.sync"), transaction(con):
+        existing = con.execute(
+            "SELECT id, titolo, categoria, atteso, codice, ordine, attivo FROM checklist_items "
+            "WHERE project_id=? ORDER BY attivo DESC, ordine ASC, id ASC",
+            (project_id,),
+        ).fetchall()
+        by_codice: dict[str, list] = {}
+        by_titolo: dict[tuple[str, str], list] = {}
+        for r in existing:
+            if r[4]:
+                by_codice.setdefault(str(r[4]), []).append(r)
+            by_titolo.setdefault(_checklist_key(r[1], r[2]), []).append(r)
+
+        matched: set[int] = set()
+        inserts = []
+        updates = []
+        reorders = []
+        invariate = 0
+        ordine = 0
+        n_inserite = n_aggiornate = n_riordinate = 0
+        for titolo, categoria, atteso, codice in _checklist_rows(items):
+            ordine += 1
+            if ordine % IMPORT_CHUNK == 0:
+                n_inserite += _flush_checklist_changes(con, inserts, updates, reorders)
+                n_aggiornate += len(updates)
+                n_riordinate += len(reorders)
+                inserts, updates, reorders = [], [], []
+                if progress is not None:
+                    progress(ordine)
+            row = None
+            if codice:
+                row = next((c for c in by_codice.get(codice, []) if int(c[0]) not in matched), None)
+            if row is None:
+                # Senza codice (o voce creata prima che il codice esistesse): titolo+categoria.
+                row = next(
+                    (
+                        c
+                        for c in by_titolo.get(_checklist_key(titolo, categoria), [])
+                        if int(c[0]) not in matched and (not codice or not c[4])
+                    ),
+                    None,
+                )
+            if row is None:
+                inserts.append((project_id, titolo, categoria, atteso, codice, ordine))
+                continue
+            item_id = int(row[0])
+            matched.add(item_id)
+            if (row[1], row[2], row[3], row[4], int(row[6])) != (titolo, categoria, atteso, codice, 1):
+                updates.append((titolo, categoria, atteso, codice, ordine, item_id))
+            elif int(row[5]) != ordine:
+                reorders.append((ordine, item_id))
+            else:
+                invariate += 1
+
+        n_inserite += _flush_checklist_changes(con, inserts, updates, reorders)
+        n_aggiornate += len(updates)
+        n_riordinate += len(reorders)
+        retire = [(int(r[0]),) for r in existing if int(r[6]) == 1 and int(r[0]) not in matched]
+        con.executemany("UPDATE checklist_items SET attivo=0 WHERE id=?", retire)
+        if n_inserite or n_aggiornate or n_riordinate or retire:
+            _bump_checklist_rev(con, project_id)
+        if progress is not None:
+            progress(ordine)
+    return ChecklistSyncResult(
+        inserite=n_inserite,
+        aggiornate=n_aggiornate,
+        riordinate=n_riordinate,
+        ritirate=len(retire),
+        invariate=invariate,
+    )
+
+
+def _bump_checklist_rev(con: sqlite3.Connection, project_id: int) -> None:
+    con.execute("UPDATE projects SET checklist_rev = checklist_rev + 1 WHERE id=?", (project_id,))
+
+
+def _flush_checklist_changes(con: sqlite3.Connection, inserts: list, updates: list, reorders: list) -> int:
+    con.executemany(
+        "INSERT INTO checklist_items(project_id, titolo, categoria, atteso, codice, ordine) VALUES(?,?,?,?,?,?)",
+        inserts,
+    )
+    con.executemany(
+        "UPDATE checklist_items SET titolo=?, categoria=?, atteso=?, codice=?, ordine=?, attivo=1 WHERE id=?",
+        updates,
+    )
+    con.executemany("UPDATE checklist_items SET ordine=? WHERE id=?", reorders)
+    return len(inserts)
+
+
+def _chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _checklist_rows(items: Iterable[Sequence[str]]) -> Iterator[tuple[str, str, str, str]]:
+    for row in items:
+        titolo, categoria, atteso = row[0], row[1], row[2]
+        codice = row[3] if len(row) > 3 else ""
         t = (titolo or "").strip()
         if not t:
             continue
-        rows.append((project_id, t, (categoria or "").strip(), (atteso or "").strip(), ordine))
-        ordine += 1
-    con.executemany(
-        "INSERT INTO checklist_items(project_id, titolo, categoria, atteso, ordine) VALUES(?,?,?,?,?)",
-        rows,
-    )
-    con.commit()
-    return len(rows)
+        yield (t, (categoria or "").strip(), (atteso or "").strip(), (codice or "").strip())
+
+
+def _checklist_key(titolo: str, categoria: str) -> tuple[str, str]:
+    return (str(titolo).strip().casefold(), str(categoria).strip().casefold())
 
 
 def list_checklist(con: sqlite3.Connection, project_id: int) -> list[ChecklistItem]:
-    cur = con.execute("SELECT * FROM checklist_items WHERE project_id=? ORDER BY ordine ASC, id ASC", (project_id,))
-    return [
-        ChecklistItem(
-            id=int(r["id"]),
-            project_id=int(r["project_id"]),
-            titolo=str(r["titolo"]),
-            categoria=str(r["categoria"]),
-            atteso=str(r["atteso"]),
-            ordine=int(r["ordine"]),
-        )
-        for r in cur.fetchall()
-    ]
+    cur = _tuples(
+        con,
+        f"SELECT {_CHECKLIST_COLS} FROM checklist_items WHERE project_id=? AND attivo=1 ORDER BY ordine ASC, id ASC",
+        (project_id,),
+    )
+    return [ChecklistItem(*r) for r in cur]
 
 
 def create_run(con: sqlite3.Connection, project_id: int, nome: str, operatore: str = "") -> int:
-    cur = con.execute(
-        "INSERT INTO runs(project_id, nome, operatore, started_at) VALUES(?,?,?,?)",
-        (project_id, nome.strip(), operatore.strip(), _now_iso()),
-    )
-    con.commit()
+    with transaction(con):
+        cur = con.execute(
+            "INSERT INTO runs(project_id, nome, operatore, started_at) VALUES(?,?,?,?)",
+            (project_id, nome.strip(), operatore.strip(), _now_iso()),
+        )
     return int(cur.lastrowid)
 
 
 def list_runs(con: sqlite3.Connection, project_id: int) -> list[Run]:
-    cur = con.execute("SELECT * FROM runs WHERE project_id=? ORDER BY started_at DESC", (project_id,))
-    out: list[Run] = []
-    for r in cur.fetchall():
-        out.append(
-            Run(
-                id=int(r["id"]),
-                project_id=int(r["project_id"]),
-                nome=str(r["nome"]),
-                operatore=str(r["operatore"]),
-                started_at=datetime.fromisoformat(str(r["started_at"]).replace("Z", "")),
-                closed_at=(
-                    datetime.fromisoformat(str(r["closed_at"]).replace("Z", "")) if r["closed_at"] else None
-                ),
-            )
-        )
-    return out
+    cur = _tuples(con, f"SELECT {_RUN_COLS} FROM runs WHERE project_id=? ORDER BY started_at DESC, id DESC", (project_id,))
+    return [Run(*r) for r in cur]
+
+
+def list_runs_page(
+    con: sqlite3.Connection,
+    project_id: int,
+    after: PageCursor | None = None,
+    limit: int = PAGE_SIZE,
+) -> tuple[list[Run], PageCursor | None]:
+    # Come list_projects_page, per i run di un progetto (dal piu' recente).
+    _check_page_limit(limit)
+    sql = f"SELECT {_RUN_COLS} FROM runs WHERE project_id=?"
+    params: list[object] = [project_id]
+    if after is not None:
+        sql += " AND (started_at, id) < (?, ?)"
+        params.extend(after)
+    runs = [Run(*r) for r in _tuples(con, sql + " ORDER BY started_at DESC, id DESC LIMIT ?", (*params, limit))]
+    cursor = (runs[-1].started_at, runs[-1].id) if len(runs) == limit else None
+    return runs, cursor
+
+
+def find_runs(con: sqlite3.Connection, project_id: int | None = None, closed_only: bool = False) -> list[Run]:
+    # Run di un progetto (o di tutti se project_id e' None), per gli export in blocco.
+    sql = f"SELECT {_RUN_COLS} FROM runs WHERE 1=1"
+    params: list[object] = []
+    if project_id is not None:
+        sql += " AND project_id=?"
+        params.append(project_id)
+    if closed_only:
+        sql += " AND closed_at IS NOT NULL"
+    cur = _tuples(con, sql + " ORDER BY project_id ASC, id ASC", params)
+    return [Run(*r) for r in cur]
 
 
 def close_run(con: sqlite3.Connection, run_id: int) -> None:
-    con.execute("UPDATE runs SET closed_at=? WHERE id=?", (_now_iso(), run_id))
-    con.commit()
+    with transaction(con):
+        con.execute("UPDATE runs SET closed_at=? WHERE id=?", (_now_iso(), run_id))
 
 
-def set_run_item(con: sqlite3.Connection, run_id: int, checklist_item_id: int, esito: str, note: str = "") -> None:
-    esito_n = esito.strip().upper()
-    if esito_n not in ["PASS", "FAIL", "SKIP"]:
+def normalize_esito(esito: str) -> str:
+    # "pass", " Fail " -> PASS, FAIL; ValueError se non e' uno di ESITI.
+    esito_n = (esito or "").strip().upper()
+    if esito_n not in ESITI:
         raise ValueError("Esito non valido. Usa PASS, FAIL o SKIP.")
+    return esito_n
 
-    cur = con.execute(
-        "SELECT id FROM run_items WHERE run_id=? AND checklist_item_id=?",
-        (run_id, checklist_item_id),
+
+def set_run_item(con: sqlite3.Connection, run_id: int, checklist_item_id: int, esito: str, note: str = "") -> None:
+    esito_n = normalize_esito(esito)
+    _check_run_items(con, [(run_id, checklist_item_id)])
+    with transaction(con):
+        con.execute(_UPSERT_RUN_ITEM, (run_id, checklist_item_id, esito_n, (note or "").strip(), _now_iso()))
+        _bump_esiti_rev(con, [run_id])
+
+
+# Esiti controllati a blocchi di questa dimensione (anche il limite di parametri per query IN).
+_CHECK_CHUNK = 900
+
+
+def set_run_items_bulk(con: sqlite3.Connection, run_id: int, results: Iterable[tuple[int, str, str]]) -> int:
+    # Registra molti esiti (checklist_item_id, esito, note) in un'unica transazione.
+    # I risultati vengono consumati in streaming: un esito non valido, o di una voce di un altro
+    # progetto, annulla tutto il lotto.
+    ts = _now_iso()
+    count = 0
+    with profiling.span("import.results"), transaction(con):
+        for chunk in _chunks(results, _CHECK_CHUNK):
+            rows = [
+                (run_id, int(item_id), normalize_esito(esito), (note or "").strip(), ts) for item_id, esito, note in chunk
+            ]
+            _check_run_items(con, [(r[0], r[1]) for r in rows])
+            con.executemany(_UPSERT_RUN_ITEM, rows)
+            count += len(rows)
+        _bump_esiti_rev(con, [run_id])
+    return count
+
+
+def _bump_esiti_rev(con: sqlite3.Connection, run_ids: Iterable[int]) -> None:
+    # Una volta per run e per transazione, non per esito: costo trascurabile anche sui lotti grandi.
+    con.executemany("UPDATE runs SET esiti_rev = esiti_rev + 1 WHERE id=?", [(r,) for r in set(run_ids)])
+
+
+def foreign_run_items(con: sqlite3.Connection, pairs: Iterable[tuple[int, int]]) -> list[tuple[int, int]]:
+    # Coppie (run_id, checklist_item_id) con run e voce esistenti ma di progetti diversi: la voce
+    # non e' nella checklist del run. Run o voci inesistenti restano all'errore di chiave esterna.
+    pairs = list(pairs)
+    runs = _project_ids(con, "runs", {r for r, _ in pairs})
+    items = _project_ids(con, "checklist_items", {i for _, i in pairs})
+    return [(r, i) for r, i in pairs if r in runs and i in items and runs[r] != items[i]]
+
+
+def _project_ids(con: sqlite3.Connection, table: str, ids: Iterable[int]) -> dict[int, int]:
+    out: dict[int, int] = {}
+    for chunk in _chunks(ids, _CHECK_CHUNK):
+        sql = f"SELECT id, project_id FROM {table} WHERE id IN ({','.join('?' * len(chunk))})"
+        out.update(_tuples(con, sql, chunk))
+    return out
+
+
+def _check_run_items(con: sqlite3.Connection, pairs: Iterable[tuple[int, int]]) -> None:
+    bad = foreign_run_items(con, pairs)
+    if bad:
+        run_id, item_id = bad[0]
+        raise ValueError(f"La voce {item_id} non e' nella checklist del progetto del run {run_id}.")
+
+
+def record_ingest_batch(
+    con: sqlite3.Connection,
+    rows: Sequence[tuple[int, int, str, str]],
+    source: str | None = None,
+    file_id: str = "",
+    position: int = 0,
+) -> None:
+    # Esiti (run_id, checklist_item_id, esito, note) gia' validati e, nella stessa transazione,
+    # la posizione raggiunta nella sorgente: dopo un riavvio si riparte esattamente da li'.
+    ts = _now_iso()
+    with profiling.span("import.ingest"), transaction(con):
+        con.executemany(_UPSERT_RUN_ITEM, [(*r, ts) for r in rows])
+        _bump_esiti_rev(con, [r[0] for r in rows])
+        if source is not None:
+            con.execute(
+                "INSERT INTO ingest_offsets(source, file_id, position, updated_at) VALUES(?,?,?,?) "
+                "ON CONFLICT(source) DO UPDATE SET file_id=excluded.file_id, position=excluded.position, "
+                "updated_at=excluded.updated_at",
+                (source, file_id, position, ts),
+            )
+
+
+def get_ingest_offset(con: sqlite3.Connection, source: str) -> tuple[str, int] | None:
+    # (file_id, posizione) salvati da record_ingest_batch per questa sorgente.
+    r = _tuples(con, "SELECT file_id, position FROM ingest_offsets WHERE source=?", (source,)).fetchone()
+    return (r[0], r[1]) if r else None
+
+
+def reset_ingest_offset(con: sqlite3.Connection, source: str) -> None:
+    with transaction(con):
+        con.execute("DELETE FROM ingest_offsets WHERE source=?", (source,))
+
+
+def get_run_progress(con: sqlite3.Connection, run_id: int) -> dict[int, dict[str, str]]:
+    cur = _tuples(con, "SELECT checklist_item_id, esito, note, timestamp FROM run_items WHERE run_id=?", (run_id,))
+    return {r[0]: {"esito": r[1], "note": r[2], "timestamp": r[3]} for r in cur}
+
+
+def load_run_progress(con: sqlite3.Connection, run_id: int) -> RunProgress:
+    # Esiti del run in forma compatta (vedi RunProgress), letti in ordine dall'indice UNIQUE
+    # (run_id, checklist_item_id). I timestamp ripetuti (esiti salvati insieme) vengono condivisi.
+    progress = RunProgress()
+    codes = Esito.__members__
+    seen: dict[str, str] = {}
+    cur = _tuples(
+        con,
+        "SELECT checklist_item_id, esito, note, timestamp FROM run_items WHERE run_id=? ORDER BY checklist_item_id",
+        (run_id,),
     )
-    row = cur.fetchone()
-    if row:
-        con.execute(
-            "UPDATE run_items SET esito=?, note=?, timestamp=? WHERE id=?",
-            (esito_n, (note or "").strip(), _now_iso(), int(row["id"])),
-        )
-    else:
+    for item_id, esito, note, ts in cur:
+        progress.append(item_id, codes[esito], note, seen.setdefault(ts, ts))
+    return progress
+
+
+def get_run_item_progress(con: sqlite3.Connection, run_id: int, checklist_item_id: int) -> ItemResult | None:
+    # Esito di una sola voce (indice UNIQUE run_id, checklist_item_id).
+    r = _tuples(
+        con,
+        "SELECT esito, note, timestamp FROM run_items WHERE run_id=? AND checklist_item_id=?",
+        (run_id, checklist_item_id),
+    ).fetchone()
+    return ItemResult(*r) if r else None
+
+
+def get_run(con: sqlite3.Connection, run_id: int) -> Run | None:
+    r = _tuples(con, f"SELECT {_RUN_COLS} FROM runs WHERE id=?", (run_id,)).fetchone()
+    return Run(*r) if r else None
+
+
+def get_run_counts(con: sqlite3.Connection, project_id: int, run_id: int) -> tuple[int, int, int]:
+    # (totale voci, eseguite, fail) calcolati in SQL, senza caricare checklist e progress.
+    r = con.execute(
+        "SELECT count(*), count(ri.id), total(ri.esito = 'FAIL') FROM checklist_items ci "
+        "LEFT JOIN run_items ri ON ri.run_id=? AND ri.checklist_item_id=ci.id "
+        "WHERE ci.project_id=? AND ci.attivo=1",
+        (run_id, project_id),
+    ).fetchone()
+    return int(r[0]), int(r[1]), int(r[2])
+
+
+def get_run_summaries(
+    con: sqlite3.Connection, project_id: int, run_ids: Sequence[int] | None = None
+) -> list[RunSummary]:
+    # PASS/FAIL/SKIP/TODO di tutti i run del progetto (o solo di `run_ids`) con una sola query
+    # raggruppata, servita dall'indice idx_run_items_run_esito. Gli esiti di voci ritirate non contano.
+    totale = int(
         con.execute(
-            "INSERT INTO run_items(run_id, checklist_item_id, esito, note, timestamp) VALUES(?,?,?,?,?)",
-            (run_id, checklist_item_id, esito_n, (note or "").strip(), _now_iso()),
-        )
-    con.commit()
+            "SELECT count(*) FROM checklist_items WHERE project_id=? AND attivo=1", (project_id,)
+        ).fetchone()[0]
+    )
+    has_retired = con.execute(
+        "SELECT 1 FROM checklist_items WHERE project_id=? AND attivo=0 LIMIT 1", (project_id,)
+    ).fetchone()
+    join = "LEFT JOIN run_items ri ON ri.run_id=r.id"
+    params: tuple[int, ...] = (project_id,)
+    if has_retired:
+        join += " AND ri.checklist_item_id IN (SELECT id FROM checklist_items WHERE project_id=? AND attivo=1)"
+        params = (project_id, project_id)
+    where = "r.project_id=?"
+    if run_ids is not None:
+        where += f" AND r.id IN ({','.join('?' * len(run_ids))})"
+        params = (*params, *run_ids)
+    cur = con.execute(
+        "SELECT r.id, total(ri.esito='PASS'), total(ri.esito='FAIL'), total(ri.esito='SKIP') "
+        f"FROM runs r {join} WHERE {where} GROUP BY r.id ORDER BY r.started_at DESC, r.id DESC",
+        params,
+    )
+    return [RunSummary(int(r[0]), totale, int(r[1]), int(r[2]), int(r[3])) for r in cur.fetchall()]
 
 
-def get_run_progress(con: sqlite3.Connection, run_id: int) -> dict[int, dict[str, str]]:
-    cur = con.execute("SELECT checklist_item_id, esito, note, timestamp FROM run_items WHERE run_id=?", (run_id,))
-    out: dict[int, dict[str, str]] = {}
-    for r in cur.fetchall():
-        out[int(r["checklist_item_id"])] = {
-            "esito": str(r["esito"]),
-            "note": str(r["note"]),
-            "timestamp": str(r["timestamp"]),
-        }
+def iter_run_report_rows(
+    con: sqlite3.Connection, project_id: int, run_id: int
+) -> Iterator[tuple[str, str, str, str | None, str, str]]:
+    # Righe del report in ordine di checklist, lette dal cursore senza materializzarle:
+    # (categoria, titolo, atteso, esito o None se da fare, note, timestamp).
+    cur = con.cursor()
+    cur.row_factory = None
+    cur.execute(
+        "SELECT ci.categoria, ci.titolo, ci.atteso, ri.esito, coalesce(ri.note, ''), coalesce(ri.timestamp, '') "
+        "FROM checklist_items ci "
+        "LEFT JOIN run_items ri ON ri.run_id=? AND ri.checklist_item_id=ci.id "
+        "WHERE ci.project_id=? AND ci.attivo=1 ORDER BY ci.ordine ASC, ci.id ASC",
+        (run_id, project_id),
+    )
+    try:
+        yield from cur
+    finally:
+        cur.close()
+
+
+# Colonne di export-data: progetto e run, voce, esito (in quest'ordine in ogni riga esportata).
+EXPORT_RUN_COLUMNS = ("project_id", "progetto", "cliente", "sito", "run_id", "run", "operatore", "run_inizio", "run_chiuso")
+EXPORT_ITEM_COLUMNS = ("checklist_item_id", "codice", "categoria", "titolo", "atteso")
+EXPORT_RESULT_COLUMNS = ("esito", "note", "timestamp")
+EXPORT_COLUMNS = EXPORT_RUN_COLUMNS + EXPORT_ITEM_COLUMNS + EXPORT_RESULT_COLUMNS
+EXPORT_CHUNK = 5000
+
+
+def _project_filter(column: str, project_ids: Sequence[int] | None) -> tuple[str, list[object]]:
+    if not project_ids:
+        return "", []
+    return f" AND {column} IN ({','.join('?' * len(project_ids))})", list(project_ids)
+
+
+def iter_export_runs(con: sqlite3.Connection, project_ids: Sequence[int] | None = None) -> Iterator[tuple]:
+    # Righe EXPORT_RUN_COLUMNS di tutti i run (dei progetti indicati), per progetto e run.
+    where, params = _project_filter("r.project_id", project_ids)
+    yield from _tuples(
+        con,
+        "SELECT p.id, p.nome, p.cliente, p.sito, r.id, r.nome, r.operatore, r.started_at, r.closed_at "
+        f"FROM runs r JOIN projects p ON p.id=r.project_id WHERE 1=1{where} ORDER BY r.project_id, r.id",
+        params,
+    )
+
+
+def iter_export_items(con: sqlite3.Connection, project_id: int) -> Iterator[tuple]:
+    # Righe EXPORT_ITEM_COLUMNS delle voci del progetto, ritirate comprese (possono avere esiti).
+    yield from _tuples(
+        con, "SELECT id, codice, categoria, titolo, atteso FROM checklist_items WHERE project_id=?", (project_id,)
+    )
+
+
+def iter_export_results(
+    con: sqlite3.Connection,
+    project_ids: Sequence[int] | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    esiti: Sequence[str] | None = None,
+) -> Iterator[list[tuple[int, int, str, str, str]]]:
+    # Esiti (run_id, checklist_item_id, esito, note, timestamp) a blocchi di EXPORT_CHUNK, ordinati
+    # per run e voce. Un solo cursore percorre run_items nell'ordine dell'indice (run_id,
+    # checklist_item_id), senza join ne' ordinamenti: memoria costante anche con decine di milioni
+    # di righe. `since`/`until`: limiti ISO sul timestamp dell'esito (`until` escluso).
+    # Il filtro sui progetti passa da run_id (prima colonna dell'indice), non da un join con runs.
+    where, params = _project_filter("project_id", project_ids)
+    if where:
+        where = f" AND run_id IN (SELECT id FROM runs WHERE 1=1{where})"
+    if since:
+        where += " AND timestamp >= ?"
+        params.append(since)
+    if until:
+        where += " AND timestamp < ?"
+        params.append(until)
+    if esiti:
+        esiti_n = sorted({normalize_esito(e) for e in esiti})
+        where += f" AND esito IN ({','.join('?' * len(esiti_n))})"
+        params.extend(esiti_n)
+    cur = _tuples(
+        con,
+        "SELECT run_id, checklist_item_id, esito, note, timestamp FROM run_items "
+        f"WHERE 1=1{where} ORDER BY run_id, checklist_item_id",
+        params,
+    )
+    cur.arraysize = EXPORT_CHUNK
+    return _iter_chunks(cur)
+
+
+def _iter_chunks(cur: sqlite3.Cursor) -> Iterator[list]:
+    try:
+        while True:
+            rows = cur.fetchmany()
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+
+def get_report_inputs(con: sqlite3.Connection, project_id: int, run_id: int) -> tuple | None:
+    # Dati economici che cambiano quando cambia il report di un run: righe di progetto e run,
+    # revisioni della checklist e degli esiti del run, numero di esiti e timestamp dell'ultimo esito.
+    r = con.execute(
+        "SELECT p.nome, p.cliente, p.sito, p.checklist_rev, r.nome, r.operatore, r.started_at, r.closed_at, "
+        "r.esiti_rev, "
+        "(SELECT count(*) FROM run_items WHERE run_id=r.id), "
+        "(SELECT max(timestamp) FROM run_items WHERE run_id=r.id) "
+        "FROM runs r JOIN projects p ON p.id=r.project_id WHERE r.id=? AND r.project_id=?",
+        (run_id, project_id),
+    ).fetchone()
+    return tuple(r) if r else None
+
+
+def get_report_cache(con: sqlite3.Connection, paths: Iterable[str]) -> dict[str, tuple[str, str]]:
+    # percorso -> (impronta, stat del file) per i report gia' generati.
+    out: dict[str, tuple[str, str]] = {}
+    for path in paths:
+        r = con.execute("SELECT fingerprint, file_stat FROM report_cache WHERE path=?", (path,)).fetchone()
+        if r:
+            out[path] = (str(r[0]), str(r[1]))
     return out
 
 
+def set_report_cache(con: sqlite3.Connection, entries: Iterable[tuple[str, str, str]]) -> None:
+    # entries: (percorso, impronta, stat del file).
+    with transaction(con):
+        con.executemany(
+            "INSERT INTO report_cache(path, fingerprint, file_stat) VALUES(?,?,?) "
+            "ON CONFLICT(path) DO UPDATE SET fingerprint=excluded.fingerprint, file_stat=excluded.file_stat",
+            entries,
+        )
+
+
 def get_project(con: sqlite3.Connection, project_id: int) -> Project | None:
-    cur = con.execute("SELECT * FROM projects WHERE id=?", (project_id,))
-    r = cur.fetchone()
-    if not r:
-        return None
-    return Project(
-        id=int(r["id"]),
-        nome=str(r["nome"]),
-        cliente=str(r["cliente"]),
-        sito=str(r["sito"]),
-        note=str(r["note"]),
-        created_at=datetime.fromisoformat(str(r["created_at"]).replace("Z", "")),
-    )
+    r = _tuples(con, f"SELECT {_PROJECT_COLS} FROM projects WHERE id=?", (project_id,)).fetchone()
+    return Project(*r) if r else None
 
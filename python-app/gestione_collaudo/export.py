@@ -0,0 +1,411 @@
+from __future__ import annotations
+
+import contextlib
+import csv
+import gzip
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import pathlib
+import re
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from datetime import date, datetime, timedelta, timezone
+from typing import BinaryIO, Callable, Iterable, Iterator, Sequence, TextIO
+
+from gestione_collaudo import APP_AUTORE, APP_NOME, APP_VERSIONE, db, profiling
+from gestione_collaudo.models import DataExportResult, ReportExportResult, Run
+from gestione_collaudo.reports import RENDERER_VERSION, RENDERERS, ReiterableRows, ReportModel, ReportRow, render_all
+
+GENERATED_BY = f"{APP_NOME} v{APP_VERSIONE} ({APP_AUTORE})"
+FOOTER = f"{APP_NOME} v{APP_VERSIONE} - {APP_AUTORE}"
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+
+
+# Contatori della cache dei report per questo processo (diagnostica).
+CACHE_STATS = CacheStats()
+
+
+def load_report_model(con: sqlite3.Connection, project_id: int, run_id: int) -> ReportModel | None:
+    # Sintesi calcolata una volta in SQL; le righe vengono rilette dal cursore per ogni formato.
+    project = db.get_project(con, project_id)
+    run = db.get_run(con, run_id)
+    if not project or not run or run.project_id != project_id:
+        return None
+    totale, eseguite, fail = db.get_run_counts(con, project_id, run_id)
+    rows = ReiterableRows(lambda: db.iter_run_report_rows(con, project_id, run_id))
+    return ReportModel(project, run, totale, eseguite, fail, rows, GENERATED_BY, FOOTER)
+
+
+def report_fingerprint(con: sqlite3.Connection, project_id: int, run_id: int) -> str | None:
+    inputs = db.get_report_inputs(con, project_id, run_id)
+    if inputs is None:
+        return None
+    key = repr((RENDERER_VERSION, APP_VERSIONE, project_id, run_id, inputs))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def export_run_report(
+    con: sqlite3.Connection,
+    project_id: int,
+    run_id: int,
+    outputs: dict[str, pathlib.Path],
+    use_cache: bool = True,
+    progress: Callable[[int], None] | None = None,
+) -> ReportExportResult | None:
+    # outputs: formato ("md", "html", "csv", "json") -> percorso del file da scrivere.
+    # Con use_cache, se l'impronta dei dati non e' cambiata e i file sono ancora quelli
+    # scritti l'ultima volta, non si rigenera nulla. None se progetto/run non esistono.
+    # `progress` riceve le righe rese finora (tutti i formati) ogni PROGRESS_ROWS righe; se solleva
+    # un'eccezione l'export si interrompe e la cache non viene aggiornata.
+    _check_formats(outputs)
+    t0 = time.perf_counter()
+    fingerprint = report_fingerprint(con, project_id, run_id)
+    if fingerprint is None:
+        return None
+    paths = [str(p) for p in outputs.values()]
+    if use_cache:
+        if _cache_hit(con, fingerprint, outputs):
+            CACHE_STATS.hits += 1
+            return ReportExportResult(project_id, run_id, paths, time.perf_counter() - t0, 0, cached=True)
+        CACHE_STATS.misses += 1
+    if not _render_to_files(con, project_id, run_id, outputs, progress):
+        return None
+    if use_cache:
+        db.set_report_cache(con, _cache_entries(fingerprint, outputs))
+    size = sum(p.stat().st_size for p in outputs.values())
+    return ReportExportResult(project_id, run_id, paths, time.perf_counter() - t0, size)
+
+
+def _render_to_files(
+    con: sqlite3.Connection,
+    project_id: int,
+    run_id: int,
+    outputs: dict[str, pathlib.Path],
+    progress: Callable[[int], None] | None = None,
+) -> bool:
+    model = load_report_model(con, project_id, run_id)
+    if model is None:
+        return False
+    if progress is not None:
+        model = replace(model, rows=_CountingRows(model.rows, progress))
+    with contextlib.ExitStack() as stack:
+        files = {}
+        for fmt, path in outputs.items():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # newline="" per il CSV, come richiesto dal modulo csv.
+            f = stack.enter_context(path.open("w", encoding="utf-8", newline="" if fmt == "csv" else None))
+            files[fmt] = profiling.timed_writes(f, "export.write")
+        # export.write (scrittura su file) e' compreso nei tempi di report.render.*
+        render_all(model, files)
+    return True
+
+
+# Ogni quante righe rese viene chiamato il callback `progress` di export_run_report.
+PROGRESS_ROWS = 2000
+
+
+class _CountingRows:
+    def __init__(self, rows: Iterable[ReportRow], progress: Callable[[int], None]) -> None:
+        self._rows = rows
+        self._progress = progress
+        self._n = 0
+
+    def __iter__(self) -> Iterator[ReportRow]:
+        for row in self._rows:
+            self._n += 1
+            if self._n % PROGRESS_ROWS == 0:
+                self._progress(self._n)
+            yield row
+
+
+def _check_formats(formats: Iterable[str]) -> None:
+    unknown = set(formats) - set(RENDERERS)
+    if unknown:
+        raise ValueError(f"Formato report non supportato: {', '.join(sorted(unknown))}")
+
+
+def _file_stat(path: pathlib.Path) -> str:
+    st = path.stat()
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def _cache_hit(con: sqlite3.Connection, fingerprint: str, outputs: dict[str, pathlib.Path]) -> bool:
+    cached = db.get_report_cache(con, [str(p) for p in outputs.values()])
+    for path in outputs.values():
+        entry = cached.get(str(path))
+        if entry is None or entry[0] != fingerprint:
+            return False
+        try:
+            if _file_stat(path) != entry[1]:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def _cache_entries(fingerprint: str, outputs: dict[str, pathlib.Path]) -> list[tuple[str, str, str]]:
+    return [(str(p), fingerprint, _file_stat(p)) for p in outputs.values()]
+
+
+DEFAULT_TEMPLATE = "_export/report_project{project_id}_run{run_id}"
+
+
+def report_paths(template: str, run: Run, project_nome: str, formats: Iterable[str]) -> dict[str, pathlib.Path]:
+    # Segnaposto del template: {project_id}, {run_id}, {project} e {run} (nomi resi sicuri per il file system).
+    # L'estensione di ogni formato viene aggiunta in fondo.
+    base = template.format(
+        project_id=run.project_id,
+        run_id=run.id,
+        project=_slug(project_nome),
+        run=_slug(run.nome),
+    )
+    return {fmt: pathlib.Path(f"{base}.{fmt}").resolve() for fmt in formats}
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", text.strip()).strip("_") or "senza_nome"
+
+
+def export_reports_batch(
+    db_path: str,
+    runs: list[Run],
+    template: str = DEFAULT_TEMPLATE,
+    formats: Iterable[str] = ("md", "html"),
+    workers: int | None = None,
+    use_cache: bool = True,
+) -> Iterator[ReportExportResult]:
+    # Le impronte vengono controllate qui (letture veloci): ai worker vanno solo i report
+    # da rigenerare. Rendering e scrittura sono distribuiti su un pool di processi e ogni
+    # worker apre una sola connessione sua (_init_worker); la cache la aggiorna solo
+    # questo processo, cosi' c'e' un unico scrittore sul DB.
+    formats = list(formats)
+    _check_formats(formats)
+    con = db.get_connection(db_path)
+    nomi = {pid: p.nome for pid in {r.project_id for r in runs} if (p := db.get_project(con, pid))}
+    tasks = []
+    fingerprints: dict[int, str] = {}
+    for r in runs:
+        outputs = report_paths(template, r, nomi.get(r.project_id, ""), formats)
+        fingerprint = report_fingerprint(con, r.project_id, r.id)
+        if fingerprint is None:
+            yield ReportExportResult(r.project_id, r.id, [], 0.0, 0, "Run non trovato.")
+            continue
+        if use_cache:
+            if _cache_hit(con, fingerprint, outputs):
+                CACHE_STATS.hits += 1
+                yield ReportExportResult(r.project_id, r.id, [str(p) for p in outputs.values()], 0.0, 0, cached=True)
+                continue
+            CACHE_STATS.misses += 1
+        fingerprints[r.id] = fingerprint
+        tasks.append((db_path, r.project_id, r.id, {fmt: str(p) for fmt, p in outputs.items()}))
+
+    for res in _run_tasks(db_path, tasks, workers):
+        if use_cache and not res.error:
+            db.set_report_cache(con, _cache_entries(fingerprints[res.run_id], {p: pathlib.Path(p) for p in res.paths}))
+        yield res
+
+
+# Connessione del processo worker, aperta da _init_worker; None nel processo principale.
+_worker_con: sqlite3.Connection | None = None
+
+
+def _init_worker(db_path: str) -> None:
+    global _worker_con
+    _worker_con = db.connect(db_path)
+
+
+def _run_tasks(
+    db_path: str, tasks: list[tuple[str, int, int, dict[str, str]]], workers: int | None
+) -> Iterator[ReportExportResult]:
+    if not tasks:
+        return
+    if workers is None:
+        workers = min(os.cpu_count() or 1, len(tasks))
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _export_task(task)
+        return
+    # Worker avviati con "spawn" (come su Windows), non con fork: una connessione SQLite aperta
+    # qui (quella di db.get_connection) non deve finire, copiata, nei processi figli.
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=(db_path,)) as pool:
+        yield from pool.map(_export_task, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+
+
+def _export_task(task: tuple[str, int, int, dict[str, str]]) -> ReportExportResult:
+    db_path, project_id, run_id, outputs = task
+    t0 = time.perf_counter()
+    paths = {fmt: pathlib.Path(p) for fmt, p in outputs.items()}
+    try:
+        ok = _render_to_files(_worker_con or db.get_connection(db_path), project_id, run_id, paths)
+    except (OSError, sqlite3.Error) as exc:
+        return ReportExportResult(project_id, run_id, list(outputs.values()), time.perf_counter() - t0, 0, str(exc))
+    if not ok:
+        return ReportExportResult(project_id, run_id, [], time.perf_counter() - t0, 0, "Run non trovato.")
+    size = sum(p.stat().st_size for p in paths.values())
+    return ReportExportResult(project_id, run_id, list(outputs.values()), time.perf_counter() - t0, size)
+
+
+DATA_FORMATS = ("csv", "jsonl")
+# Compressione gzip dei dati esportati: 6 e' il compromesso usuale tra dimensione e velocita'.
+GZIP_LEVEL = 6
+
+
+def data_format(path: str) -> tuple[str, bool]:
+    # (formato, gzip) dedotti dal nome: .csv / .jsonl / .ndjson, eventualmente seguiti da .gz.
+    suffixes = [s.lower() for s in pathlib.Path(path).suffixes[-2:]]
+    compress = bool(suffixes) and suffixes[-1] == ".gz"
+    if compress:
+        suffixes = suffixes[:-1]
+    ext = suffixes[-1] if suffixes else ""
+    return ("jsonl" if ext in (".jsonl", ".ndjson") else "csv"), compress
+
+
+def date_bounds(dal: str | None, al: str | None) -> tuple[str | None, str | None]:
+    # Limiti [since, until) sui timestamp degli esiti, nel formato del DB (UTC, "...Z"):
+    # date AAAA-MM-GG (giorno di `al` compreso) o istanti ISO (secondo di `al` compreso);
+    # gli istanti senza fuso sono in UTC come i timestamp registrati.
+    bounds = []
+    for value, end in ((dal, False), (al, True)):
+        value = (value or "").strip()
+        if not value:
+            bounds.append(None)
+            continue
+        try:
+            dt = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"Data non valida: {value} (atteso AAAA-MM-GG o AAAA-MM-GGThh:mm:ss)") from None
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+        if end:
+            dt = dt.replace(microsecond=0) + (timedelta(days=1) if _is_date(value) else timedelta(seconds=1))
+        bounds.append(dt.isoformat(timespec="seconds") + "Z")
+    return bounds[0], bounds[1]
+
+
+def _is_date(value: str) -> bool:
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def export_data(
+    con: sqlite3.Connection,
+    out: str | BinaryIO,
+    fmt: str = "csv",
+    compress: bool = False,
+    project_ids: Sequence[int] | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    esiti: Sequence[str] | None = None,
+) -> DataExportResult:
+    # Esiti con progetto, run e voce (db.EXPORT_COLUMNS) su file o stream binario, in streaming
+    # progetto per progetto dal cursore degli esiti: memoria costante, qualunque sia il numero di righe.
+    if fmt not in DATA_FORMATS:
+        raise ValueError(f"Formato dati non supportato: {fmt}")
+    t0 = time.perf_counter()
+    # Filtri validati prima di creare il file.
+    esiti = sorted({db.normalize_esito(e) for e in esiti}) if esiti else None
+    runs: dict[int, list[tuple]] = {}
+    for r in db.iter_export_runs(con, project_ids):
+        runs.setdefault(r[0], []).append(r)
+    path = out if isinstance(out, str) else "-"
+    n = 0
+    with contextlib.ExitStack() as stack:
+        if isinstance(out, str):
+            target = pathlib.Path(out)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            raw: BinaryIO = stack.enter_context(target.open("wb"))
+        else:
+            raw = out
+        if compress:
+            raw = stack.enter_context(gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=GZIP_LEVEL))  # type: ignore[assignment]
+        text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        try:
+            f = profiling.timed_writes(text, "export.write")
+            write_rows = _write_csv_rows if fmt == "csv" else _write_jsonl_rows
+            with profiling.span("export.data"):
+                if fmt == "csv":
+                    csv.writer(f, delimiter=";").writerow(db.EXPORT_COLUMNS)
+                for project_id, project_runs in runs.items():
+                    # Cursore chiuso anche se la scrittura si interrompe, prima che si chiuda la connessione.
+                    with contextlib.closing(db.iter_export_results(con, [project_id], since, until, esiti)) as chunks:
+                        n += write_rows(f, con, project_id, project_runs, chunks)
+            text.flush()
+        finally:
+            text.detach()  # lo stream sottostante resta aperto: lo chiude chi l'ha aperto
+    size = pathlib.Path(out).stat().st_size if isinstance(out, str) else None
+    return DataExportResult(path, n, size, time.perf_counter() - t0)
+
+
+# Gli esiti di un progetto arrivano per run e voce; le colonne di run e voce, uguali su migliaia di
+# righe, si preparano una volta (per run e per voce del progetto) e si riusano per ogni esito.
+# Un esito di una voce che non e' nella checklist del progetto (dati registrati prima del controllo
+# in db.set_run_items_bulk) esce con il solo checklist_item_id e le altre colonne della voce vuote.
+
+
+def _missing_item(item_id: int) -> tuple:
+    return (item_id,) + ("",) * (len(db.EXPORT_ITEM_COLUMNS) - 1)
+
+
+class _ItemColumns(dict):
+    # Colonne preparate per voce; quelle di una voce assente le produce `missing`.
+    def __init__(self, items: Iterable[tuple[int, object]], missing: Callable[[int], object]) -> None:
+        super().__init__(items)
+        self._missing = missing
+
+    def __missing__(self, item_id: int) -> object:
+        return self._missing(item_id)
+
+
+def _write_csv_rows(
+    f: TextIO, con: sqlite3.Connection, project_id: int, runs: list[tuple], chunks: Iterable[list[tuple]]
+) -> int:
+    w = csv.writer(f, delimiter=";")
+    run_cols = {r[4]: r for r in runs}
+    items = _ItemColumns(((r[0], r) for r in db.iter_export_items(con, project_id)), _missing_item)
+    n = 0
+    for chunk in chunks:
+        w.writerows(
+            run_cols[run_id] + items[item_id] + (esito, note, ts) for run_id, item_id, esito, note, ts in chunk
+        )
+        n += len(chunk)
+    return n
+
+
+def _json_fields(names: Iterable[str], values: Iterable[object]) -> str:
+    return ",".join(f"{json.dumps(k)}:{json.dumps(v, ensure_ascii=False)}" for k, v in zip(names, values))
+
+
+def _write_jsonl_rows(
+    f: TextIO, con: sqlite3.Connection, project_id: int, runs: list[tuple], chunks: Iterable[list[tuple]]
+) -> int:
+    # Frammenti JSON gia' codificati: per ogni esito si codificano solo esito, note e timestamp.
+    run_prefix = {r[4]: "{" + _json_fields(db.EXPORT_RUN_COLUMNS, r) + "," for r in runs}
+    items = _ItemColumns(
+        ((r[0], _json_fields(db.EXPORT_ITEM_COLUMNS, r) + ",") for r in db.iter_export_items(con, project_id)),
+        lambda item_id: _json_fields(db.EXPORT_ITEM_COLUMNS, _missing_item(item_id)) + ",",
+    )
+    escape = json.JSONEncoder(ensure_ascii=False).encode
+    n = 0
+    for chunk in chunks:
+        f.write(
+            "".join(
+                f'{run_prefix[run_id]}{items[item_id]}"esito":"{esito}","note":{escape(note)},"timestamp":{escape(ts)}}}\n'
+                for run_id, item_id, esito, note, ts in chunk
+            )
+        )
+        n += len(chunk)
+    return n
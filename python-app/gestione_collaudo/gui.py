@@ -1,13 +1,43 @@
 from __future__ import annotations
 
+import bisect
 import pathlib
+import sqlite3
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
+from typing import Any, Callable, Sequence
 
 from gestione_collaudo import APP_AUTORE, APP_HOME, APP_NOME, APP_VERSIONE
-from gestione_collaudo import db
-from gestione_collaudo.importers import import_checklist_csv
-from gestione_collaudo.reports import build_markdown_report, markdown_to_simple_html
+from gestione_collaudo import db, profiling, search
+from gestione_collaudo.export import export_run_report
+from gestione_collaudo.importers import iter_checklist_csv
+from gestione_collaudo.models import ItemResult, Run, RunSummary
+from gestione_collaudo.session import RunSession
+from gestione_collaudo.worker import DbWorker, Task, TaskCancelled
+
+# Righe del report mostrate nella scheda Report (il file completo resta in _export).
+PREVIEW_LINES = 2000
+
+# Ogni quanti ms la UI raccoglie i risultati del thread DB.
+POLL_MS = 15
+# Righe inserite in una tabella per ogni giro del loop Tk: liste lunghe non bloccano la finestra.
+FILL_CHUNK = 250
+# Ogni quanti ms si controlla (PRAGMA data_version) se altri hanno scritto sul run aperto.
+SESSION_CHECK_MS = 2000
+# Attesa dopo l'ultimo tasto prima di lanciare la ricerca.
+SEARCH_DELAY_MS = 250
+# Aggiornamento della finestra di diagnostica (Ctrl+Maiusc+D) mentre e' aperta.
+DIAG_REFRESH_MS = 1000
+
+
+class _Pager:
+    # Stato di una tabella caricata a pagine (keyset) man mano che si scorre.
+    def __init__(self) -> None:
+        self.rows: list[tuple[str, tuple]] = []
+        self.cursor: db.PageCursor | None = None
+        self.key: object = None  # filtro/progetto a cui si riferiscono le righe caricate
+        self.gen = 0
+        self.loading = False
 
 
 class App(tk.Tk):
@@ -24,7 +54,31 @@ class App(tk.Tk):
         self.run_id = tk.IntVar(value=0)
         self.operatore = tk.StringVar(value="")
 
+        # Tutto l'accesso al DB (e il parsing dei CSV) gira sul thread del worker.
+        self.worker = DbWorker(self.db_path.get().strip())
+        self._long_task: Task | None = None
+        self._fill_tokens: dict[str, object] = {}
+        # Righe mostrate in ogni tabella: iid (id nel DB) -> valori, per aggiornare solo le differenze.
+        self._tree_rows: dict[str, dict[str, tuple]] = {}
+        # Checklist ed esiti del run aperto nella scheda Esecuzione (vive sulla connessione del worker).
+        self._session: RunSession | None = None
+        # Filtri di ricerca attivi (id delle voci da mostrare) e timer dei campi di ricerca.
+        self.check_query = tk.StringVar(value="")
+        self.run_query = tk.StringVar(value="")
+        self._run_filter: set[int] | None = None
+        self._debounce_ids: dict[str, str] = {}
+        self.f_cliente = tk.StringVar(value="")
+        self.f_sito = tk.StringVar(value="")
+        self._proj_pager = _Pager()
+        self._runs_pager = _Pager()
+        self._diag: tk.Toplevel | None = None
+
         self._build()
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        # Finestra di diagnostica non presente nei menu: query e fasi misurate mentre e' attiva.
+        self.bind_all("<Control-Shift-KeyPress-D>", lambda _e: self._diagnostics())
+        self.after(POLL_MS, self._poll)
+        self.after(SESSION_CHECK_MS, self._check_session)
         self._refresh_projects()
 
     def _build(self) -> None:
@@ -63,8 +117,166 @@ class App(tk.Tk):
         self._build_run_tab()
         self._build_report_tab()
 
-    def _con(self):
-        return db.connect(self.db_path.get().strip())
+    def _submit(
+        self,
+        fn: Callable[[sqlite3.Connection, Task], Any],
+        key: str | None = None,
+        on_done: Callable[[Any], None] | None = None,
+        on_error: Callable[[Exception], None] | None = None,
+        on_progress: Callable[[Any], None] | None = None,
+    ) -> Task:
+        # Il percorso si legge qui (le variabili Tk non vanno toccate dal thread del worker).
+        self.worker.db_path = self.db_path.get().strip()
+        return self.worker.submit(fn, key, on_done, on_error or self._task_error, on_progress)
+
+    def _poll(self) -> None:
+        self.worker.poll()
+        self.after(POLL_MS, self._poll)
+
+    def _task_error(self, exc: Exception) -> None:
+        if not isinstance(exc, TaskCancelled):
+            messagebox.showerror("Errore", str(exc))
+
+    def _start_long(self, task: Task, cancel_btn: ttk.Button) -> None:
+        self._long_task = task
+        cancel_btn.configure(state="normal")
+
+    def _end_long(self, cancel_btn: ttk.Button) -> None:
+        self._long_task = None
+        cancel_btn.configure(state="disabled")
+
+    def _long_running(self) -> bool:
+        if self._long_task is not None:
+            messagebox.showerror("Attendere", "C'e' gia' un'operazione in corso.")
+            return True
+        return False
+
+    def _cancel_long(self) -> None:
+        if self._long_task is not None:
+            self._long_task.cancel()
+
+    def _sync_tree(self, tree: ttk.Treeview, rows: Sequence[tuple[str, tuple]]) -> None:
+        # rows: (iid, valori) nell'ordine voluto; l'iid e' l'id della riga nel DB.
+        # Si toccano solo le righe cambiate, cosi' selezione e scorrimento restano dove sono;
+        # se c'e' quasi tutto da inserire (es. cambio progetto) si riempie da zero a blocchi.
+        shown = self._tree_rows.setdefault(str(tree), {})
+        wanted = dict(rows)
+        inserts = sum(1 for iid in wanted if iid not in shown)
+        if not shown or inserts > FILL_CHUNK:
+            self._fill_tree(tree, rows)
+            return
+        self._fill_tokens.pop(str(tree), None)
+        gone = [iid for iid in shown if iid not in wanted]
+        if gone:
+            tree.delete(*gone)
+            for iid in gone:
+                del shown[iid]
+        for index, (iid, values) in enumerate(rows):
+            old = shown.get(iid)
+            if old is None:
+                tree.insert("", index, iid=iid, values=values)
+            elif old != values:
+                tree.item(iid, values=values)
+            shown[iid] = values
+        order = [iid for iid, _ in rows]
+        children = tree.get_children()
+        if list(children) != order:
+            # Restano ferme le righe gia' in ordine relativo (sottosequenza crescente piu' lunga),
+            # le altre si staccano e si riattaccano alla posizione finale: 2 operazioni per riga spostata.
+            position = {iid: i for i, iid in enumerate(children)}
+            keep = _longest_increasing([position[iid] for iid in order])
+            moved = [(index, iid) for index, iid in enumerate(order) if index not in keep]
+            tree.detach(*(iid for _, iid in moved))
+            for index, iid in moved:
+                tree.move(iid, "", index)
+
+    def _fill_tree(self, tree: ttk.Treeview, rows: Sequence[tuple[str, tuple]]) -> None:
+        # Riempie la tabella a blocchi di FILL_CHUNK righe, uno per giro del loop Tk;
+        # un riempimento successivo della stessa tabella interrompe quello in corso.
+        token = object()
+        self._fill_tokens[str(tree)] = token
+        tree.delete(*tree.get_children())
+        shown = self._tree_rows[str(tree)] = {}
+
+        def step(start: int) -> None:
+            if self._fill_tokens.get(str(tree)) is not token:
+                return
+            for iid, values in rows[start : start + FILL_CHUNK]:
+                tree.insert("", "end", iid=iid, values=values)
+                shown[iid] = values
+            if start + FILL_CHUNK < len(rows):
+                self.after(1, step, start + FILL_CHUNK)
+            else:
+                self._fill_tokens.pop(str(tree), None)
+
+        step(0)
+
+    def _update_row(self, tree: ttk.Treeview, iid: str, values: tuple) -> None:
+        shown = self._tree_rows.get(str(tree), {})
+        if iid in shown and shown[iid] != values:
+            tree.item(iid, values=values)
+            shown[iid] = values
+
+    def _clear_tree(self, tree: ttk.Treeview) -> None:
+        self._fill_tree(tree, ())
+
+    def _load_page(
+        self,
+        tree: ttk.Treeview,
+        pager: _Pager,
+        key: object,
+        fetch: Callable[[sqlite3.Connection, db.PageCursor | None, int], tuple[list, db.PageCursor | None]],
+        on_loaded: Callable[[bool], None] | None = None,
+        reset: bool = True,
+    ) -> None:
+        # reset: ricarica dall'inizio tante righe quante ne erano gia' caricate (la tabella si aggiorna
+        # per differenze); altrimenti aggiunge la pagina successiva. `fetch(con, after, limit)` gira sul
+        # worker e restituisce le righe (iid, valori) e il cursore della pagina seguente.
+        if not reset and (pager.loading or pager.cursor is None or pager.key != key):
+            return
+        if reset:
+            pager.gen += 1
+            if pager.key != key:
+                pager.rows, pager.cursor, pager.key = [], None, key
+        gen = pager.gen
+        after = None if reset else pager.cursor
+        limit = max(db.PAGE_SIZE, len(pager.rows)) if reset else db.PAGE_SIZE
+        pager.loading = True
+
+        def done(res: tuple[list, db.PageCursor | None]) -> None:
+            if gen != pager.gen:
+                return
+            pager.loading = False
+            rows, pager.cursor = res
+            pager.rows = rows if reset else pager.rows + rows
+            self._sync_tree(tree, pager.rows)
+            if on_loaded is not None:
+                on_loaded(reset)
+
+        def failed(exc: Exception) -> None:
+            if gen == pager.gen:
+                pager.loading = False
+            self._task_error(exc)
+
+        task_key = f"{tree}:{'reset' if reset else 'more'}"
+        self._submit(lambda con, task: fetch(con, after, limit), key=task_key, on_done=done, on_error=failed)
+
+    def _scrolled(self, sb: ttk.Scrollbar, more: Callable[[], None], first: str, last: str) -> None:
+        # yscrollcommand delle tabelle paginate: vicino al fondo si carica la pagina successiva.
+        sb.set(first, last)
+        if float(last) >= 0.9:
+            more()
+
+    def _debounce(self, name: str, fn: Callable[[], None], ms: int = SEARCH_DELAY_MS) -> None:
+        if name in self._debounce_ids:
+            self.after_cancel(self._debounce_ids[name])
+        self._debounce_ids[name] = self.after(ms, fn)
+
+    def _on_close(self) -> None:
+        profiling.disable()
+        self._cancel_long()
+        self.worker.stop()
+        self.destroy()
 
     def _choose_db(self) -> None:
         p = filedialog.asksaveasfilename(
@@ -85,11 +297,25 @@ class App(tk.Tk):
         right = ttk.LabelFrame(f, text="Nuovo progetto")
         right.pack(side="right", fill="y", padx=(12, 0))
 
-        self.projects = ttk.Treeview(left, columns=("id", "nome", "cliente", "sito"), show="headings", height=18)
+        bar = ttk.Frame(left)
+        bar.pack(fill="x", pady=(0, 8))
+        ttk.Label(bar, text="Filtra cliente").pack(side="left")
+        ttk.Entry(bar, textvariable=self.f_cliente, width=22).pack(side="left", padx=(8, 16))
+        ttk.Label(bar, text="sito").pack(side="left")
+        ttk.Entry(bar, textvariable=self.f_sito, width=22).pack(side="left", padx=8)
+        for var in (self.f_cliente, self.f_sito):
+            var.trace_add("write", lambda *_: self._debounce("projects", self._refresh_projects))
+
+        box = ttk.Frame(left)
+        box.pack(fill="both", expand=True)
+        self.projects = ttk.Treeview(box, columns=("id", "nome", "cliente", "sito"), show="headings", height=18)
         for c, w in [("id", 60), ("nome", 280), ("cliente", 200), ("sito", 260)]:
             self.projects.heading(c, text=c)
             self.projects.column(c, width=w, anchor="w")
-        self.projects.pack(fill="both", expand=True)
+        sb = ttk.Scrollbar(box, orient="vertical", command=self.projects.yview)
+        self.projects.configure(yscrollcommand=lambda a, b: self._scrolled(sb, self._more_projects, a, b))
+        self.projects.pack(side="left", fill="both", expand=True)
+        sb.pack(side="right", fill="y")
         self.projects.bind("<<TreeviewSelect>>", lambda e: self._on_project_select())
 
         btns = ttk.Frame(left)
@@ -113,16 +339,29 @@ class App(tk.Tk):
         ttk.Button(right, text="Crea", command=self._create_project).grid(row=8, column=0, padx=8, pady=8, sticky="ew")
 
     def _refresh_projects(self) -> None:
-        con = self._con()
-        projs = db.list_projects(con)
-        for i in self.projects.get_children():
-            self.projects.delete(i)
-        for p in projs:
-            self.projects.insert("", "end", values=(p.id, p.nome, p.cliente, p.sito))
-        if projs and self.project_id.get() == 0:
-            self.project_id.set(projs[0].id)
+        self._load_projects(reset=True)
+
+    def _more_projects(self) -> None:
+        self._load_projects(reset=False)
+
+    def _load_projects(self, reset: bool) -> None:
+        cliente, sito = self.f_cliente.get().strip(), self.f_sito.get().strip()
+
+        def fetch(con: sqlite3.Connection, after: db.PageCursor | None, limit: int) -> tuple[list, Any]:
+            projs, cursor = db.list_projects_page(con, after, limit, cliente or None, sito or None)
+            return [(str(p.id), (p.id, p.nome, p.cliente, p.sito)) for p in projs], cursor
+
+        self._load_page(self.projects, self._proj_pager, (cliente, sito), fetch, self._projects_loaded, reset)
+
+    def _projects_loaded(self, reset: bool) -> None:
+        if not reset:
+            return
+        rows = self._proj_pager.rows
+        if rows and self.project_id.get() == 0:
+            self.project_id.set(int(rows[0][0]))
         self._refresh_checklist()
         self._refresh_runs()
+        self._refresh_run_items()
 
     def _on_project_select(self) -> None:
         sel = self.projects.selection()
@@ -134,6 +373,7 @@ class App(tk.Tk):
             self.run_id.set(0)
             self._refresh_checklist()
             self._refresh_runs()
+            self._refresh_run_items()
 
     def _create_project(self) -> None:
         nome = self.p_nome.get().strip()
@@ -141,8 +381,12 @@ class App(tk.Tk):
             messagebox.showerror("Errore", "Inserisci un nome progetto.")
             return
         note = self.p_note_box.get("1.0", tk.END).strip()
-        con = self._con()
-        pid = db.create_project(con, nome, self.p_cliente.get(), self.p_sito.get(), note)
+        cliente, sito = self.p_cliente.get(), self.p_sito.get()
+        self._submit(
+            lambda con, task: db.create_project(con, nome, cliente, sito, note), on_done=self._project_created
+        )
+
+    def _project_created(self, pid: int) -> None:
         self.project_id.set(pid)
         self.p_nome.set("")
         self.p_cliente.set("")
@@ -155,11 +399,9 @@ class App(tk.Tk):
         if pid <= 0:
             return
         if messagebox.askyesno("Conferma", "Eliminare il progetto selezionato? (anche checklist e run)"):
-            con = self._con()
-            db.delete_project(con, pid)
             self.project_id.set(0)
             self.run_id.set(0)
-            self._refresh_projects()
+            self._submit(lambda con, task: db.delete_project(con, pid), on_done=lambda _: self._refresh_projects())
 
     # Checklist
     def _build_checklist_tab(self) -> None:
@@ -167,10 +409,21 @@ class App(tk.Tk):
         top = ttk.Frame(f)
         top.pack(fill="x")
         ttk.Button(top, text="Importa checklist da CSV (sostituisce)", command=self._import_checklist).pack(side="left")
+        ttk.Button(
+            top, text="Aggiorna da CSV (mantiene esiti)", command=lambda: self._import_checklist(sync=True)
+        ).pack(side="left", padx=(8, 0))
         ttk.Button(top, text="Aggiorna", command=self._refresh_checklist).pack(side="left", padx=8)
+        self.check_cancel = ttk.Button(top, text="Annulla", command=self._cancel_long, state="disabled")
+        self.check_cancel.pack(side="left")
         self.check_label = ttk.Label(top, text="Nessun progetto selezionato.")
         self.check_label.pack(side="right")
 
+        bar = ttk.Frame(f)
+        bar.pack(fill="x", pady=(8, 0))
+        ttk.Label(bar, text="Cerca").pack(side="left")
+        ttk.Entry(bar, textvariable=self.check_query, width=40).pack(side="left", padx=8)
+        self.check_query.trace_add("write", lambda *_: self._debounce("check", self._refresh_checklist))
+
         self.checklist = ttk.Treeview(f, columns=("ordine", "categoria", "titolo", "atteso"), show="headings", height=20)
         for c, w in [("ordine", 60), ("categoria", 140), ("titolo", 420), ("atteso", 340)]:
             self.checklist.heading(c, text=c)
@@ -179,18 +432,29 @@ class App(tk.Tk):
 
     def _refresh_checklist(self) -> None:
         pid = self.project_id.get()
-        for i in self.checklist.get_children():
-            self.checklist.delete(i)
         if pid <= 0:
+            self._clear_tree(self.checklist)
             self.check_label.configure(text="Nessun progetto selezionato.")
             return
-        con = self._con()
-        items = db.list_checklist(con, pid)
-        self.check_label.configure(text=f"Voci: {len(items)} | project_id={pid}")
-        for it in items:
-            self.checklist.insert("", "end", values=(it.ordine, it.categoria, it.titolo, it.atteso))
+        query = self.check_query.get().strip()
 
-    def _import_checklist(self) -> None:
+        def work(con: sqlite3.Connection, task: Task) -> tuple[list, set[int] | None]:
+            items = db.list_checklist(con, pid)
+            if not query:
+                return items, None
+            return items, {m.id for m in search.search_checklist(con, query, pid, limit=None)}
+
+        self._submit(work, key="checklist", on_done=lambda res: self._show_checklist(pid, *res))
+
+    def _show_checklist(self, pid: int, items: list, ids: set[int] | None = None) -> None:
+        if ids is None:
+            self.check_label.configure(text=f"Voci: {len(items)} | project_id={pid}")
+        else:
+            items = [it for it in items if it.id in ids]
+            self.check_label.configure(text=f"Voci trovate: {len(items)} | project_id={pid}")
+        self._sync_tree(self.checklist, [(str(it.id), (it.ordine, it.categoria, it.titolo, it.atteso)) for it in items])
+
+    def _import_checklist(self, sync: bool = False) -> None:
         pid = self.project_id.get()
         if pid <= 0:
             messagebox.showerror("Errore", "Seleziona un progetto.")
@@ -199,16 +463,44 @@ class App(tk.Tk):
             title="Scegli checklist CSV",
             filetypes=[("CSV", "*.csv;*.txt"), ("Tutti i file", "*.*")],
         )
-        if not p:
+        if not p or self._long_running():
             return
-        try:
-            items = import_checklist_csv(p)
-        except Exception as exc:  # noqa: BLE001
+
+        def work(con: sqlite3.Connection, task: Task) -> Any:
+            # Parsing e scrittura in streaming sul thread DB; task.progress solleva TaskCancelled
+            # se l'utente annulla, e la transazione dell'import viene annullata.
+            items = iter_checklist_csv(p)
+            if sync:
+                return db.sync_checklist(con, pid, items, progress=task.progress)
+            return db.replace_checklist(con, pid, items, progress=task.progress)
+
+        self.check_label.configure(text="Import in corso...")
+        task = self._submit(
+            work,
+            on_done=lambda res: self._import_done(sync, res),
+            on_error=self._import_failed,
+            on_progress=lambda n: self.check_label.configure(text=f"Import in corso: {n} voci..."),
+        )
+        self._start_long(task, self.check_cancel)
+
+    def _import_done(self, sync: bool, res: Any) -> None:
+        self._end_long(self.check_cancel)
+        if sync:
+            messagebox.showinfo(
+                "OK",
+                f"Checklist aggiornata: {res.inserite} nuove, {res.aggiornate} modificate, "
+                f"{res.riordinate} riordinate, {res.ritirate} ritirate, {res.invariate} invariate",
+            )
+        else:
+            messagebox.showinfo("OK", f"Checklist importata: {res} voci")
+        self._refresh_checklist()
+
+    def _import_failed(self, exc: Exception) -> None:
+        self._end_long(self.check_cancel)
+        if isinstance(exc, TaskCancelled):
+            self.check_label.configure(text="Import annullato, checklist invariata.")
+        else:
             messagebox.showerror("Errore import", str(exc))
-            return
-        con = self._con()
-        n = db.replace_checklist(con, pid, items)
-        messagebox.showinfo("OK", f"Checklist importata: {n} voci")
         self._refresh_checklist()
 
     # Esecuzioni
@@ -231,13 +523,40 @@ class App(tk.Tk):
         right = ttk.LabelFrame(mid, text="Esito voce selezionata")
         right.pack(side="right", fill="y", padx=(12, 0))
 
-        self.runs = ttk.Treeview(left, columns=("id", "nome", "operatore", "started", "closed"), show="headings", height=8)
-        for c, w in [("id", 60), ("nome", 240), ("operatore", 120), ("started", 170), ("closed", 170)]:
+        box = ttk.Frame(left)
+        box.pack(fill="x")
+        self.runs = ttk.Treeview(
+            box,
+            columns=("id", "nome", "operatore", "started", "closed", "pass", "fail", "skip", "todo", "%"),
+            show="headings",
+            height=8,
+        )
+        for c, w in [
+            ("id", 60),
+            ("nome", 200),
+            ("operatore", 110),
+            ("started", 150),
+            ("closed", 150),
+            ("pass", 55),
+            ("fail", 55),
+            ("skip", 55),
+            ("todo", 55),
+            ("%", 60),
+        ]:
             self.runs.heading(c, text=c)
             self.runs.column(c, width=w, anchor="w")
-        self.runs.pack(fill="x")
+        sb = ttk.Scrollbar(box, orient="vertical", command=self.runs.yview)
+        self.runs.configure(yscrollcommand=lambda a, b: self._scrolled(sb, self._more_runs, a, b))
+        self.runs.pack(side="left", fill="x", expand=True)
+        sb.pack(side="right", fill="y")
         self.runs.bind("<<TreeviewSelect>>", lambda e: self._on_run_select())
 
+        bar = ttk.Frame(left)
+        bar.pack(fill="x", pady=(10, 0))
+        ttk.Label(bar, text="Cerca (voci e note)").pack(side="left")
+        ttk.Entry(bar, textvariable=self.run_query, width=40).pack(side="left", padx=8)
+        self.run_query.trace_add("write", lambda *_: self._debounce("run", self._refresh_run_items))
+
         self.run_items = ttk.Treeview(left, columns=("id", "categoria", "titolo", "esito", "timestamp"), show="headings", height=18)
         for c, w in [("id", 60), ("categoria", 140), ("titolo", 420), ("esito", 90), ("timestamp", 170)]:
             self.run_items.heading(c, text=c)
@@ -259,28 +578,31 @@ class App(tk.Tk):
 
     def _refresh_runs(self) -> None:
         pid = self.project_id.get()
-        for i in self.runs.get_children():
-            self.runs.delete(i)
-        for i in self.run_items.get_children():
-            self.run_items.delete(i)
         if pid <= 0:
+            self._clear_tree(self.runs)
             self.run_label.configure(text="Nessun progetto selezionato.")
             return
-        con = self._con()
-        runs = db.list_runs(con, pid)
-        self.run_label.configure(text=f"Run: {len(runs)} | project_id={pid}")
-        for r in runs:
-            self.runs.insert(
-                "",
-                "end",
-                values=(
-                    r.id,
-                    r.nome,
-                    r.operatore,
-                    r.started_at.isoformat(timespec="seconds"),
-                    r.closed_at.isoformat(timespec="seconds") if r.closed_at else "",
-                ),
-            )
+        self._load_runs(pid, reset=True)
+
+    def _more_runs(self) -> None:
+        pid = self.project_id.get()
+        if pid > 0:
+            self._load_runs(pid, reset=False)
+
+    def _load_runs(self, pid: int, reset: bool) -> None:
+        def fetch(con: sqlite3.Connection, after: db.PageCursor | None, limit: int) -> tuple[list, Any]:
+            runs, cursor = db.list_runs_page(con, pid, after, limit)
+            # Oltre qualche centinaio di run conviene una sola query su tutto il progetto.
+            ids = [r.id for r in runs] if len(runs) <= db.PAGE_SIZE else None
+            by_run = {s.run_id: s for s in db.get_run_summaries(con, pid, ids)}
+            return [(str(r.id), _run_values(r, by_run.get(r.id))) for r in runs], cursor
+
+        def loaded(reset: bool) -> None:
+            pager = self._runs_pager
+            more = "+" if pager.cursor is not None else ""
+            self.run_label.configure(text=f"Run: {len(pager.rows)}{more} | project_id={pid}")
+
+        self._load_page(self.runs, self._runs_pager, pid, fetch, loaded, reset)
 
     def _on_run_select(self) -> None:
         sel = self.runs.selection()
@@ -297,8 +619,10 @@ class App(tk.Tk):
         if pid <= 0:
             messagebox.showerror("Errore", "Seleziona un progetto.")
             return
-        con = self._con()
-        rid = db.create_run(con, pid, f"Run {pid}", self.operatore.get())
+        operatore = self.operatore.get()
+        self._submit(lambda con, task: db.create_run(con, pid, f"Run {pid}", operatore), on_done=self._run_created)
+
+    def _run_created(self, rid: int) -> None:
         self.run_id.set(rid)
         self._refresh_runs()
         self._refresh_run_items()
@@ -307,25 +631,71 @@ class App(tk.Tk):
         rid = self.run_id.get()
         if rid <= 0:
             return
-        con = self._con()
-        db.close_run(con, rid)
-        self._refresh_runs()
+        self._submit(lambda con, task: db.close_run(con, rid), on_done=lambda _: self._refresh_runs())
 
     def _refresh_run_items(self) -> None:
         rid = self.run_id.get()
         pid = self.project_id.get()
-        for i in self.run_items.get_children():
-            self.run_items.delete(i)
         if rid <= 0 or pid <= 0:
+            self._session = None
+            self._clear_tree(self.run_items)
+            return
+        session = self._session
+        query = self.run_query.get().strip()
+
+        def work(con: sqlite3.Connection, task: Task) -> tuple[RunSession, set[int] | None]:
+            s = session
+            if s is None or s.con is not con or s.run_id != rid:
+                s = RunSession(con, rid)
+            s.refresh()
+            if not query:
+                return s, None
+            # Voci il cui testo corrisponde, piu' quelle con una nota corrispondente in questo run.
+            ids = {m.id for m in search.search_checklist(con, query, s.project_id, limit=None)}
+            ids.update(m.checklist_item_id for m in search.search_notes(con, query, run_id=rid, limit=None))
+            return s, ids
+
+        self._submit(work, key="run_items", on_done=self._run_items_loaded)
+
+    def _run_items_loaded(self, res: tuple[RunSession, set[int] | None]) -> None:
+        session, ids = res
+        if session.run_id != self.run_id.get():
             return
-        con = self._con()
-        checklist = db.list_checklist(con, pid)
-        prog = db.get_run_progress(con, rid)
-        for it in checklist:
+        self._run_filter = ids
+        self._show_session(session)
+
+    def _check_session(self) -> None:
+        # Se un'altra postazione ha scritto nel DB la sessione si ricarica e la tabella si aggiorna per differenze.
+        session = self._session
+        if session is not None:
+            self._submit(
+                lambda con, task: session.refresh(),
+                key="session_check",
+                on_done=lambda changed: self._session_changed(session) if changed else None,
+                on_error=lambda exc: None,
+            )
+        self.after(SESSION_CHECK_MS, self._check_session)
+
+    def _session_changed(self, session: RunSession) -> None:
+        if session is self._session:
+            self._show_session(session)
+            self._refresh_runs()
+
+    def _show_session(self, session: RunSession) -> None:
+        if session.run_id != self.run_id.get():
+            return
+        self._session = session
+        rows = []
+        prog = session.progress
+        ids = self._run_filter
+        for it in session.checklist:
+            if ids is not None and it.id not in ids:
+                continue
             p = prog.get(it.id)
-            esito = p["esito"] if p else "TODO"
-            ts = p["timestamp"] if p else ""
-            self.run_items.insert("", "end", values=(it.id, it.categoria, it.titolo, esito, ts))
+            esito = p.esito if p else "TODO"
+            ts = p.timestamp if p else ""
+            rows.append((str(it.id), (it.id, it.categoria, it.titolo, esito, ts)))
+        self._sync_tree(self.run_items, rows)
 
     def _on_item_select(self) -> None:
         sel = self.run_items.selection()
@@ -335,12 +705,14 @@ class App(tk.Tk):
         if not vals:
             return
         self.item_id.set(int(vals[0]))
-        con = self._con()
-        prog = db.get_run_progress(con, self.run_id.get())
-        p = prog.get(self.item_id.get())
+        # Nota letta dalla sessione del run: nessun accesso al DB.
+        session = self._session
+        self._show_note(session.progress_of(self.item_id.get()) if session is not None else None)
+
+    def _show_note(self, p: ItemResult | None) -> None:
         self.note_box.delete("1.0", tk.END)
-        if p and p.get("note"):
-            self.note_box.insert(tk.END, p["note"])
+        if p and p.note:
+            self.note_box.insert(tk.END, p.note)
 
     def _set_esito(self, esito: str) -> None:
         rid = self.run_id.get()
@@ -349,9 +721,26 @@ class App(tk.Tk):
             messagebox.showerror("Errore", "Seleziona un run e una voce.")
             return
         note = self.note_box.get("1.0", tk.END).strip()
-        con = self._con()
-        db.set_run_item(con, rid, cid, esito, note)
-        self._refresh_run_items()
+
+        session = self._session
+
+        def work(con: sqlite3.Connection, task: Task) -> ItemResult | None:
+            if session is not None and session.con is con and session.run_id == rid:
+                return session.set_esito(cid, esito, note)
+            db.set_run_item(con, rid, cid, esito, note)
+            return db.get_run_item_progress(con, rid, cid)
+
+        self._submit(work, on_done=lambda p: self._esito_saved(rid, cid, p))
+
+    def _esito_saved(self, rid: int, cid: int, p: ItemResult | None) -> None:
+        # Aggiorna solo la riga della voce e i contatori del run, senza rileggere la checklist.
+        if p is None or rid != self.run_id.get():
+            return
+        iid = str(cid)
+        old = self._tree_rows.get(str(self.run_items), {}).get(iid)
+        if old is not None:
+            self._update_row(self.run_items, iid, (*old[:3], p.esito, p.timestamp))
+        self._refresh_runs()
 
     # Report
     def _build_report_tab(self) -> None:
@@ -360,6 +749,8 @@ class App(tk.Tk):
         top.pack(fill="x")
         ttk.Button(top, text="Genera report (MD + HTML)", command=self._gen_report).pack(side="left")
         ttk.Button(top, text="Apri cartella export", command=self._open_export_dir).pack(side="left", padx=8)
+        self.rep_cancel = ttk.Button(top, text="Annulla", command=self._cancel_long, state="disabled")
+        self.rep_cancel.pack(side="left")
         self.rep_label = ttk.Label(top, text="")
         self.rep_label.pack(side="right")
 
@@ -379,6 +770,57 @@ class App(tk.Tk):
         )
         messagebox.showinfo("Informazioni", msg)
 
+    def _diagnostics(self) -> None:
+        if self._diag is not None:
+            self._diag.lift()
+            return
+        win = tk.Toplevel(self)
+        win.title("Diagnostica")
+        win.geometry("900x520")
+        self._diag = win
+        prof = profiling.Profiler()
+
+        bar = ttk.Frame(win, padding=8)
+        bar.pack(fill="x")
+        toggle = ttk.Button(bar)
+        toggle.pack(side="left")
+        ttk.Button(bar, text="Azzera", command=lambda: (prof.reset(), self._diag_show(text, prof))).pack(
+            side="left", padx=(8, 0)
+        )
+        status = ttk.Label(bar)
+        status.pack(side="left", padx=(12, 0))
+        text = tk.Text(win, wrap="none", font=("Consolas", 9))
+        text.pack(fill="both", expand=True, padx=8, pady=(0, 8))
+
+        def set_active(on: bool) -> None:
+            if on:
+                profiling.enable(prof)
+            else:
+                profiling.disable()
+            toggle.configure(text="Ferma misura" if on else "Avvia misura", command=lambda: set_active(not on))
+            status.configure(text="misura attiva" if on else "misura ferma (nessun costo)")
+            self._diag_show(text, prof)
+
+        def close() -> None:
+            profiling.disable()
+            self._diag = None
+            win.destroy()
+
+        win.protocol("WM_DELETE_WINDOW", close)
+        set_active(True)
+        self._diag_tick(win, text, prof)
+
+    def _diag_tick(self, win: tk.Toplevel, text: tk.Text, prof: profiling.Profiler) -> None:
+        if self._diag is not win:
+            return
+        if profiling.active() is prof:
+            self._diag_show(text, prof)
+        self.after(DIAG_REFRESH_MS, lambda: self._diag_tick(win, text, prof))
+
+    def _diag_show(self, text: tk.Text, prof: profiling.Profiler) -> None:
+        text.delete("1.0", tk.END)
+        text.insert(tk.END, prof.summary(top=25))
+
     def _open_export_dir(self) -> None:
         out = pathlib.Path("_export").resolve()
         out.mkdir(parents=True, exist_ok=True)
@@ -401,32 +843,96 @@ class App(tk.Tk):
         if pid <= 0 or rid <= 0:
             messagebox.showerror("Errore", "Seleziona un progetto e un run.")
             return
-        con = self._con()
-        project = db.get_project(con, pid)
-        runs = [r for r in db.list_runs(con, pid) if r.id == rid]
-        if not project or not runs:
-            messagebox.showerror("Errore", "Dati non trovati.")
+        if self._long_running():
             return
-        run = runs[0]
-        checklist = db.list_checklist(con, pid)
-        progress = db.get_run_progress(con, rid)
-        md = build_markdown_report(
-            project,
-            run,
-            checklist,
-            progress,
-            generated_by=f"{APP_NOME} v{APP_VERSIONE} ({APP_AUTORE})",
-        )
         outdir = pathlib.Path("_export").resolve()
-        outdir.mkdir(parents=True, exist_ok=True)
         base = f"report_project{pid}_run{rid}"
         md_path = outdir / f"{base}.md"
         html_path = outdir / f"{base}.html"
-        md_path.write_text(md, encoding="utf-8")
-        html_path.write_text(markdown_to_simple_html(md, footer=f"{APP_NOME} v{APP_VERSIONE} - {APP_AUTORE}"), encoding="utf-8")
-        self.rep_label.configure(text=f"Creati: {md_path.name}, {html_path.name}")
-        self._set_rep(md)
-        messagebox.showinfo("OK", f"Report creato in:\\n{outdir}")
+
+        def work(con: sqlite3.Connection, task: Task) -> Any:
+            res = export_run_report(con, pid, rid, {"md": md_path, "html": html_path}, progress=task.progress)
+            return res, (_read_preview(md_path) if res is not None else "")
+
+        def done(out: tuple) -> None:
+            self._end_long(self.rep_cancel)
+            res, preview = out
+            if res is None:
+                self.rep_label.configure(text="")
+                messagebox.showerror("Errore", "Dati non trovati.")
+                return
+            if res.cached:
+                self.rep_label.configure(text=f"Invariati (cache): {md_path.name}, {html_path.name}")
+            else:
+                self.rep_label.configure(text=f"Creati: {md_path.name}, {html_path.name}")
+            self._set_rep(preview)
+            messagebox.showinfo("OK", f"Report creato in:\\n{outdir}")
+
+        def failed(exc: Exception) -> None:
+            self._end_long(self.rep_cancel)
+            if isinstance(exc, TaskCancelled):
+                self.rep_label.configure(text="Report annullato.")
+            else:
+                self.rep_label.configure(text="")
+                messagebox.showerror("Errore", str(exc))
+
+        self.rep_label.configure(text="Report in corso...")
+        task = self._submit(
+            work,
+            on_done=done,
+            on_error=failed,
+            on_progress=lambda n: self.rep_label.configure(text=f"Report in corso: {n} righe..."),
+        )
+        self._start_long(task, self.rep_cancel)
+
+
+def _run_values(r: Run, s: RunSummary | None) -> tuple:
+    return (
+        r.id,
+        r.nome,
+        r.operatore,
+        r.started_dt.isoformat(timespec="seconds"),
+        r.closed_dt.isoformat(timespec="seconds") if r.closed_at else "",
+        s.n_pass if s else 0,
+        s.n_fail if s else 0,
+        s.n_skip if s else 0,
+        s.n_todo if s else 0,
+        f"{s.completamento:.0f}%" if s else "",
+    )
+
+
+def _longest_increasing(seq: Sequence[int]) -> set[int]:
+    # Indici di una sottosequenza strettamente crescente di lunghezza massima (O(n log n)).
+    tails: list[int] = []  # valore finale minimo di una sottosequenza lunga k+1
+    tail_idx: list[int] = []
+    prev = [-1] * len(seq)
+    for i, value in enumerate(seq):
+        k = bisect.bisect_left(tails, value)
+        if k > 0:
+            prev[i] = tail_idx[k - 1]
+        if k == len(tails):
+            tails.append(value)
+            tail_idx.append(i)
+        else:
+            tails[k] = value
+            tail_idx[k] = i
+    out: set[int] = set()
+    i = tail_idx[-1] if tail_idx else -1
+    while i >= 0:
+        out.add(i)
+        i = prev[i]
+    return out
+
+
+def _read_preview(path: pathlib.Path) -> str:
+    lines = []
+    with path.open("r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if i >= PREVIEW_LINES:
+                lines.append(f"\n... anteprima troncata a {PREVIEW_LINES} righe, report completo in {path.name}\n")
+                break
+            lines.append(line)
+    return "".join(lines)
 
 
 def main() -> int:
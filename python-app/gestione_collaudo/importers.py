@@ -1,32 +1,87 @@
 from __future__ import annotations
 
 import csv
+import json
+import os
 import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator
 
+from gestione_collaudo import profiling
+from gestione_collaudo.models import ParsedChecklist
 
-def import_checklist_csv(path: str) -> list[tuple[str, str, str]]:
+
+def import_checklist_csv(path: str) -> list[tuple[str, str, str, str]]:
+    # Righe (titolo, categoria, atteso, codice); `codice` e' opzionale e identifica la voce in modo stabile.
+    return list(iter_checklist_csv(path))
+
+
+def iter_checklist_csv(path: str) -> Iterator[tuple[str, str, str, str]]:
+    # Versione in streaming di `import_checklist_csv`: intestazioni e colonne vengono
+    # risolte subito (gli errori emergono alla chiamata), le righe si leggono una alla volta.
     p = pathlib.Path(path).resolve()
     if not p.exists():
         raise FileNotFoundError(f"File non trovato: {p}")
-    with p.open("r", encoding="utf-8", errors="replace", newline="") as f:
+    f = p.open("r", encoding="utf-8", errors="replace", newline="")
+    try:
         sample = f.read(4096)
         f.seek(0)
-        dialect = csv.Sniffer().sniff(sample, delimiters=";,\\t,")
-        reader = csv.DictReader(f, dialect=dialect)
-        if not reader.fieldnames:
+        dialect = csv.Sniffer().sniff(sample, delimiters=";,\t,")
+        reader = csv.reader(f, dialect=dialect)
+        fieldnames = next(reader, None)
+        if not fieldnames:
             raise ValueError("CSV senza intestazioni.")
-        headers = [h.strip().lower() for h in reader.fieldnames]
+        headers = [h.strip().lower() for h in fieldnames]
         if "titolo" not in headers:
             raise ValueError("CSV deve contenere la colonna 'titolo'.")
+        cols = [headers.index(name) if name in headers else -1 for name in ("titolo", "categoria", "atteso", "codice")]
+    except BaseException:
+        f.close()
+        raise
+    return _iter_checklist_rows(f, reader, cols)
 
-        out: list[tuple[str, str, str]] = []
+
+def _iter_checklist_rows(f, reader, cols: list[int]) -> Iterator[tuple[str, str, str, str]]:
+    i_tit, i_cat, i_att, i_cod = cols
+    with f:
         for r in reader:
-            titolo = str(r.get(_col(reader.fieldnames, "titolo"), "") or "").strip()
-            categoria = str(r.get(_col(reader.fieldnames, "categoria"), "") or "").strip()
-            atteso = str(r.get(_col(reader.fieldnames, "atteso"), "") or "").strip()
-            if titolo:
-                out.append((titolo, categoria, atteso))
-    return out
+            n = len(r)
+            titolo = r[i_tit].strip() if i_tit < n else ""
+            if not titolo:
+                continue
+            yield (
+                titolo,
+                r[i_cat].strip() if 0 <= i_cat < n else "",
+                r[i_att].strip() if 0 <= i_att < n else "",
+                r[i_cod].strip() if 0 <= i_cod < n else "",
+            )
+
+
+def parse_checklist_file(path: str) -> ParsedChecklist:
+    # Eseguita nei processi worker: gli errori vengono restituiti, non sollevati,
+    # cosi' un file non valido non interrompe l'import degli altri.
+    t0 = time.perf_counter()
+    try:
+        with profiling.span("import.parse"):
+            items = import_checklist_csv(path)
+    except Exception as exc:  # noqa: BLE001
+        return ParsedChecklist(path=str(path), items=[], elapsed=time.perf_counter() - t0, error=str(exc))
+    error = None if items else "Nessuna voce valida."
+    return ParsedChecklist(path=str(path), items=items, elapsed=time.perf_counter() - t0, error=error)
+
+
+def parse_checklist_files(paths: Iterable[str], workers: int | None = None) -> Iterator[ParsedChecklist]:
+    # Parsing in parallelo con un pool di processi; i risultati arrivano nell'ordine dei file.
+    paths = [str(p) for p in paths]
+    if workers is None:
+        workers = min(os.cpu_count() or 1, len(paths))
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield parse_checklist_file(path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(parse_checklist_file, paths)
 
 
 def _col(fieldnames: list[str] | None, name: str) -> str:
@@ -37,3 +92,49 @@ def _col(fieldnames: list[str] | None, name: str) -> str:
             return f
     return name
 
+
+def iter_results_file(path: str) -> Iterator[tuple[int, str, str]]:
+    # Esiti da registrare in blocco: CSV (checklist_item_id, esito, note) oppure JSONL
+    # (un oggetto per riga con le stesse chiavi). Le righe vengono lette in streaming.
+    p = pathlib.Path(path).resolve()
+    if not p.exists():
+        raise FileNotFoundError(f"File non trovato: {p}")
+    if p.suffix.lower() in (".jsonl", ".ndjson"):
+        yield from _iter_results_jsonl(p)
+    else:
+        yield from _iter_results_csv(p)
+
+
+def _iter_results_jsonl(p: pathlib.Path) -> Iterator[tuple[int, str, str]]:
+    with p.open("r", encoding="utf-8", errors="replace") as f:
+        for n, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+                yield (int(obj["checklist_item_id"]), str(obj.get("esito") or ""), str(obj.get("note") or ""))
+            except (ValueError, KeyError, TypeError) as exc:
+                raise ValueError(f"Riga {n} non valida: {exc}") from exc
+
+
+def _iter_results_csv(p: pathlib.Path) -> Iterator[tuple[int, str, str]]:
+    with p.open("r", encoding="utf-8", errors="replace", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=";,\t,")
+        reader = csv.DictReader(f, dialect=dialect)
+        if not reader.fieldnames:
+            raise ValueError("CSV senza intestazioni.")
+        headers = [h.strip().lower() for h in reader.fieldnames]
+        for required in ("checklist_item_id", "esito"):
+            if required not in headers:
+                raise ValueError(f"CSV deve contenere la colonna '{required}'.")
+        c_id = _col(reader.fieldnames, "checklist_item_id")
+        c_esito = _col(reader.fieldnames, "esito")
+        c_note = _col(reader.fieldnames, "note")
+        for r in reader:
+            try:
+                item_id = int(str(r.get(c_id) or "").strip())
+            except ValueError as exc:
+                raise ValueError(f"Riga {reader.line_num}: checklist_item_id non valido.") from exc
+            yield (item_id, str(r.get(c_esito) or "").strip(), str(r.get(c_note) or "").strip())
@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import BinaryIO, Callable, Iterator
+
+from gestione_collaudo import db
+from gestione_collaudo.models import IngestStats
+
+# Limiti di un lotto: si scrive quando si raggiunge il numero di esiti o l'eta' del primo in attesa.
+BATCH_SIZE = 1000
+BATCH_SECONDS = 0.5
+# Attesa tra due controlli di un file seguito (`follow`) senza nuovi dati.
+POLL_SECONDS = 0.2
+# Intervallo minimo tra due ricariche dell'indice di un progetto quando una chiave non si trova.
+RELOAD_SECONDS = 5.0
+READ_CHUNK = 1 << 20
+
+# Elemento prodotto dalle sorgenti: (riga senza "\n", posizione dopo la riga) oppure None se
+# non ci sono dati nuovi (serve a scrivere i lotti rimasti in attesa).
+Line = tuple[bytes, int] | None
+
+
+class _ProjectIndex:
+    __slots__ = ("ids", "by_codice", "by_titolo", "loaded")
+
+    def __init__(self, con: sqlite3.Connection, project_id: int) -> None:
+        # Solo voci attive; un titolo ripetuto non identifica una voce e resta fuori.
+        self.ids: set[int] = set()
+        self.by_codice: dict[str, int] = {}
+        self.by_titolo: dict[str, int] = {}
+        doppi: set[str] = set()
+        cur = con.execute(
+            "SELECT id, codice, titolo FROM checklist_items WHERE project_id=? AND attivo=1", (project_id,)
+        )
+        for item_id, codice, titolo in cur:
+            self.ids.add(item_id)
+            if codice:
+                self.by_codice[codice] = item_id
+            key = titolo.strip().casefold()
+            if key in self.by_titolo:
+                doppi.add(key)
+            self.by_titolo[key] = item_id
+        for key in doppi:
+            del self.by_titolo[key]
+        self.loaded = time.monotonic()
+
+    def resolve(self, obj: dict) -> int | None:
+        item_id = obj.get("checklist_item_id")
+        if item_id is not None:
+            item_id = int(item_id)
+            return item_id if item_id in self.ids else None
+        codice = obj.get("codice")
+        if codice is not None:
+            return self.by_codice.get(str(codice).strip())
+        item = obj.get("item")
+        if item is None:
+            raise ValueError("manca la voce (checklist_item_id, codice o item)")
+        item = str(item).strip()
+        found = self.by_codice.get(item)
+        return found if found is not None else self.by_titolo.get(item.casefold())
+
+
+class ItemIndex:
+    # run_id -> progetto -> voci, caricati dal DB al primo uso e tenuti in memoria.
+    def __init__(self, con: sqlite3.Connection) -> None:
+        self._con = con
+        self._runs: dict[int, int] = {}
+        self._projects: dict[int, _ProjectIndex] = {}
+
+    def resolve(self, run_id: int, obj: dict) -> int | None:
+        # checklist_item_id della voce indicata da `obj`, None se run o voce sconosciuti.
+        project_id = self._runs.get(run_id)
+        if project_id is None:
+            # Un run sconosciuto non si memorizza: puo' essere creato mentre si registra (--follow).
+            r = self._con.execute("SELECT project_id FROM runs WHERE id=?", (run_id,)).fetchone()
+            if r is None:
+                return None
+            project_id = self._runs[run_id] = r[0]
+        index = self._projects.get(project_id)
+        if index is None:
+            index = self._projects[project_id] = _ProjectIndex(self._con, project_id)
+        item_id = index.resolve(obj)
+        if item_id is None and time.monotonic() - index.loaded >= RELOAD_SECONDS:
+            # La checklist puo' essere cambiata mentre si registra: si ricarica, senza esagerare.
+            index = self._projects[project_id] = _ProjectIndex(self._con, project_id)
+            item_id = index.resolve(obj)
+        return item_id
+
+
+def parse_line(line: bytes) -> tuple[int, dict, str, str]:
+    # (run_id, oggetto, esito, note) da una riga JSON; il valore misurato finisce nelle note.
+    obj = json.loads(line)
+    if not isinstance(obj, dict):
+        raise ValueError("la riga non e' un oggetto JSON")
+    try:
+        run_id = int(obj["run_id"])
+    except KeyError:
+        raise ValueError("manca run_id") from None
+    esito = db.normalize_esito(str(obj.get("esito") or ""))
+    note = str(obj.get("note") or "").strip()
+    valore = obj.get("valore", obj.get("value"))
+    if valore is not None and valore != "":
+        misura = f"valore: {valore}"
+        note = f"{note} [{misura}]" if note else misura
+    return run_id, obj, esito, note
+
+
+class Ingestor:
+    # Accumula gli esiti letti e li scrive a lotti (per numero o per eta'); ogni lotto salva anche
+    # la posizione raggiunta nella sorgente `source`, cosi' un riavvio non perde ne' ripete righe.
+    def __init__(
+        self,
+        con: sqlite3.Connection,
+        source: str | None = None,
+        file_id: str = "",
+        batch_size: int = BATCH_SIZE,
+        batch_seconds: float = BATCH_SECONDS,
+        on_error: Callable[[int, str], None] | None = None,
+    ) -> None:
+        self._con = con
+        self._index = ItemIndex(con)
+        self.source = source
+        self.file_id = file_id
+        self.batch_size = max(1, batch_size)
+        self.batch_seconds = batch_seconds
+        self._on_error = on_error
+        # (run_id, voce) -> (esito, note): nello stesso lotto vale l'ultimo esito, come per l'upsert.
+        self._pending: dict[tuple[int, int], tuple[str, str]] = {}
+        self._accepted = 0  # righe valide nel lotto in attesa
+        self._since = 0.0  # istante della prima riga in attesa
+        self.position = 0
+        self._saved = 0
+        self.lette = self.registrate = self.scartate = self.batch = 0
+
+    def start_at(self, position: int, file_id: str = "") -> None:
+        # Nuova sorgente (o file ruotato): i lotti in attesa vanno scritti prima.
+        self.flush()
+        self.position = self._saved = position
+        self.file_id = file_id
+
+    def add(self, line: bytes, position: int) -> None:
+        # La posizione avanza solo a riga elaborata: un'interruzione a meta' non la salta.
+        if not self._pending and self.position == self._saved:
+            self._since = time.monotonic()
+        if line.strip():
+            self.lette += 1
+            try:
+                run_id, obj, esito, note = parse_line(line)
+                item_id = self._index.resolve(run_id, obj)
+                if item_id is None:
+                    raise ValueError(f"run {run_id} o voce sconosciuti")
+            except (ValueError, TypeError) as exc:
+                self.scartate += 1
+                if self._on_error is not None:
+                    self._on_error(position - len(line) - 1, str(exc))
+            else:
+                self._pending[run_id, item_id] = (esito, note)
+                self._accepted += 1
+        self.position = position
+        if self._accepted >= self.batch_size:
+            self.flush()
+        else:
+            self.tick()
+
+    def saved_position(self, fid: str, size: int) -> int:
+        # Posizione da cui riprendere `source`: 0 se il file e' un altro o e' piu' corto.
+        if self.source is None:
+            return 0
+        saved = db.get_ingest_offset(self._con, self.source)
+        if saved is None or saved[0] != fid or saved[1] > size:
+            return 0
+        return saved[1]
+
+    def tick(self) -> None:
+        # Scrive il lotto in attesa se e' piu' vecchio di `batch_seconds`.
+        if (self._pending or self.position != self._saved) and time.monotonic() - self._since >= self.batch_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        # Anche senza esiti validi la posizione va salvata: le righe scartate non si rileggono.
+        if not self._pending and (self.position == self._saved or self.source is None):
+            return
+        rows = [(run_id, item_id, esito, note) for (run_id, item_id), (esito, note) in self._pending.items()]
+        db.record_ingest_batch(self._con, rows, self.source, self.file_id, self.position)
+        self.registrate += self._accepted
+        self.batch += 1
+        self._pending = {}
+        self._accepted = 0
+        self._saved = self.position
+        self._since = time.monotonic()
+
+    def stats(self) -> IngestStats:
+        return IngestStats(self.lette, self.registrate, self.scartate, self.batch, self._saved)
+
+
+def file_id(path: str) -> str:
+    st = os.stat(path)
+    return f"{st.st_dev}:{st.st_ino}"
+
+
+def follow_file(
+    path: str,
+    ingestor: Ingestor,
+    follow: bool = False,
+    poll: float = POLL_SECONDS,
+    stop: threading.Event | None = None,
+) -> None:
+    # Legge `path` dalla posizione salvata (se il file e' lo stesso) e, con `follow`, resta in attesa
+    # di nuove righe come `tail -f`: un file troncato si rilegge da capo, uno ruotato (stesso nome,
+    # altro inode) si apre da capo dopo aver finito quello vecchio.
+    fid = file_id(path)
+    start = ingestor.saved_position(fid, os.path.getsize(path))
+    while True:
+        with open(path, "rb") as f:
+            ingestor.start_at(start, fid)
+            for item in _read_lines(f, path, start, follow, poll, stop):
+                if item is None:
+                    ingestor.tick()
+                else:
+                    ingestor.add(*item)
+        if not follow or (stop is not None and stop.is_set()):
+            break
+        # File troncato o ruotato: si riparte dall'inizio del file che ora ha quel nome.
+        start = 0
+        fid = _wait_for(path, poll, stop)
+        if fid is None:
+            break
+    ingestor.flush()
+
+
+def _read_lines(f: BinaryIO, path: str, start: int, follow: bool, poll: float, stop: threading.Event | None) -> Iterator[Line]:
+    # Termina a fine file (senza `follow`), su `stop`, oppure quando il file va riaperto.
+    # Solo righe complete: la posizione prodotta e' sempre subito dopo un "\n".
+    f.seek(start)
+    pos = start
+    buf = b""
+    fid = os.fstat(f.fileno())
+    while True:
+        chunk = f.read(READ_CHUNK)
+        if chunk:
+            buf += chunk
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                pos += len(line) + 1
+                yield line, pos
+            continue
+        if not follow:
+            # Un'ultima riga senza "\n" puo' essere ancora in scrittura: resta dopo la posizione
+            # salvata e si legge intera alla prossima esecuzione.
+            return
+        if stop is not None and stop.is_set():
+            return
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            st = None
+        if st is not None and (st.st_ino != fid.st_ino or st.st_dev != fid.st_dev):
+            return  # ruotato: il vecchio file e' gia' stato letto fino in fondo
+        if os.fstat(f.fileno()).st_size < pos + len(buf):
+            return  # troncato
+        yield None
+        time.sleep(poll)
+
+
+def _wait_for(path: str, poll: float, stop: threading.Event | None) -> str | None:
+    while stop is None or not stop.is_set():
+        try:
+            return file_id(path)
+        except FileNotFoundError:
+            time.sleep(poll)
+    return None
+
+
+def read_stream(stream: BinaryIO, ingestor: Ingestor, poll: float = POLL_SECONDS) -> None:
+    # Sorgente senza posizione ripristinabile (es. stdin): un thread legge le righe e il ciclo
+    # principale le registra, scrivendo i lotti in attesa anche quando lo stream tace.
+    lines: queue.SimpleQueue[bytes | None] = queue.SimpleQueue()
+
+    def reader() -> None:
+        try:
+            for line in stream:
+                lines.put(line)
+        finally:
+            lines.put(None)
+
+    threading.Thread(target=reader, name="ingest-reader", daemon=True).start()
+    pos = 0
+    while True:
+        try:
+            line = lines.get(timeout=poll)
+        except queue.Empty:
+            ingestor.tick()
+            continue
+        if line is None:
+            break
+        pos += len(line)
+        ingestor.add(line.rstrip(b"\r\n"), pos)
+    ingestor.flush()
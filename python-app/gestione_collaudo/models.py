@@ -1,20 +1,35 @@
 from __future__ import annotations
 
+from array import array
+from bisect import bisect_left
 from dataclasses import dataclass
 from datetime import datetime
+from enum import IntEnum
+from typing import Iterator
 
 
-@dataclass(frozen=True)
+def parse_ts(value: str) -> datetime:
+    # Timestamp ISO salvati nel DB (UTC con "Z" finale) -> datetime naive.
+    return datetime.fromisoformat(value.replace("Z", ""))
+
+
+@dataclass(frozen=True, slots=True)
 class Project:
+    # Campi nell'ordine delle colonne di db._PROJECT_COLS (righe mappate per posizione);
+    # i timestamp restano stringhe ISO e created_dt li converte solo quando viene letto.
     id: int
     nome: str
     cliente: str
     sito: str
     note: str
-    created_at: datetime
+    created_at: str
+
+    @property
+    def created_dt(self) -> datetime:
+        return parse_ts(self.created_at)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ChecklistItem:
     id: int
     project_id: int
@@ -22,24 +37,256 @@ class ChecklistItem:
     categoria: str
     atteso: str
     ordine: int
+    codice: str = ""
+
+
+@dataclass(frozen=True, slots=True)
+class ChecklistSyncResult:
+    inserite: int
+    aggiornate: int
+    riordinate: int
+    ritirate: int
+    invariate: int
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
+class ParsedChecklist:
+    path: str
+    items: list[tuple[str, str, str, str]]
+    elapsed: float  # secondi di parsing
+    error: str | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class ReportExportResult:
+    project_id: int
+    run_id: int
+    paths: list[str]
+    elapsed: float  # secondi di rendering + scrittura
+    size: int  # byte scritti
+    error: str | None = None
+    cached: bool = False  # file gia' aggiornati, nessun rendering
+
+
+@dataclass(frozen=True, slots=True)
 class Run:
+    # Campi nell'ordine di db._RUN_COLS.
     id: int
     project_id: int
     nome: str
     operatore: str
-    started_at: datetime
-    closed_at: datetime | None
+    started_at: str
+    closed_at: str | None
+
+    @property
+    def started_dt(self) -> datetime:
+        return parse_ts(self.started_at)
+
+    @property
+    def closed_dt(self) -> datetime | None:
+        return parse_ts(self.closed_at) if self.closed_at else None
+
+
+@dataclass(frozen=True, slots=True)
+class RunSummary:
+    run_id: int
+    totale: int  # voci attive della checklist
+    n_pass: int
+    n_fail: int
+    n_skip: int
+
+    @property
+    def n_todo(self) -> int:
+        return max(self.totale - self.n_pass - self.n_fail - self.n_skip, 0)
+
+    @property
+    def completamento(self) -> float:
+        # Percentuale di voci eseguite (PASS/FAIL/SKIP).
+        if self.totale <= 0:
+            return 0.0
+        return 100.0 * (self.totale - self.n_todo) / self.totale
+
+
+@dataclass(frozen=True, slots=True)
+class ItemStats:
+    chiave: str  # codice, oppure categoria+titolo in minuscolo
+    codice: str
+    categoria: str
+    titolo: str
+    n_progetti: int
+    n_run: int  # run in cui la voce ha un esito
+    n_pass: int
+    n_fail: int
+    n_skip: int
+    flip: int  # passaggi PASS->FAIL o FAIL->PASS tra run consecutivi (SKIP ignorati)
+    ultimo_fail: str | None  # timestamp ISO dell'ultimo FAIL
+
+    @property
+    def tasso_fail(self) -> float:
+        # Percentuale di FAIL sulle prove con esito PASS/FAIL.
+        eseguite = self.n_pass + self.n_fail
+        if eseguite <= 0:
+            return 0.0
+        return 100.0 * self.n_fail / eseguite
+
+
+# Voce cambiata tra due run: (checklist_item_id, codice, categoria, titolo, esito base, esito target, note).
+# Esito None = voce senza esito in quel run; le note sono quelle del target (o della base se manca).
+DiffRow = tuple[int, str, str, str, "str | None", "str | None", str]
+
+
+@dataclass(frozen=True, slots=True)
+class RunDiff:
+    project: Project
+    base: Run
+    target: Run
+    totale: int  # voci attive della checklist
+    righe: dict[str, list[DiffRow]]  # tipo di cambio (analytics.DIFF_TIPI) -> voci in ordine di checklist
+
+    @property
+    def invariate(self) -> int:
+        return self.totale - sum(len(r) for r in self.righe.values())
+
+    @property
+    def regressioni(self) -> int:
+        return len(self.righe.get("regressione", ()))
+
+
+@dataclass(frozen=True, slots=True)
+class ChecklistMatch:
+    id: int  # checklist_items.id
+    project_id: int
+    codice: str
+    categoria: str
+    titolo: str
+    atteso: str
+    rank: float  # piu' basso = piu' pertinente (bm25); 0 con la ricerca LIKE
+
+
+@dataclass(frozen=True, slots=True)
+class NoteMatch:
+    run_item_id: int
+    run_id: int
+    project_id: int
+    checklist_item_id: int
+    titolo: str
+    esito: str
+    note: str
+    timestamp: str
+    rank: float
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
+class DataExportResult:
+    path: str  # "-" per stdout
+    righe: int
+    size: int | None  # byte del file scritto (None su stdout)
+    elapsed: float
+
+
+@dataclass(frozen=True, slots=True)
+class IngestStats:
+    lette: int  # righe lette dalla sorgente
+    registrate: int
+    scartate: int  # righe non valide o con run/voce sconosciuti
+    batch: int  # transazioni eseguite
+    posizione: int  # byte della sorgente gia' registrati
+
+
+@dataclass(frozen=True, slots=True)
 class RunItem:
     id: int
     run_id: int
     checklist_item_id: int
     esito: str  # PASS/FAIL/SKIP
     note: str
-    timestamp: datetime
+    timestamp: str
+
+    @property
+    def timestamp_dt(self) -> datetime:
+        return parse_ts(self.timestamp)
+
+
+class Esito(IntEnum):
+    TODO = 0
+    PASS = 1
+    FAIL = 2
+    SKIP = 3
+
+
+@dataclass(frozen=True, slots=True)
+class ItemResult:
+    esito: str  # PASS/FAIL/SKIP
+    note: str
+    timestamp: str  # ISO, come nel DB
+
+
+class RunProgress:
+    # Esiti di un run in array paralleli ordinati per checklist_item_id: un intero a 8 byte e un
+    # byte di esito (Esito) per voce, piu' un riferimento a nota e timestamp (le note vuote e i
+    # timestamp uguali sono lo stesso oggetto). La ricerca per voce e' binaria, senza dizionari.
+    __slots__ = ("item_ids", "esiti", "notes", "timestamps")
+
+    def __init__(self) -> None:
+        self.item_ids = array("q")
+        self.esiti = bytearray()
+        self.notes: list[str] = []
+        self.timestamps: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self.item_ids)
+
+    def __contains__(self, checklist_item_id: object) -> bool:
+        return isinstance(checklist_item_id, int) and self._index(checklist_item_id) >= 0
+
+    def _index(self, checklist_item_id: int) -> int:
+        i = bisect_left(self.item_ids, checklist_item_id)
+        if i < len(self.item_ids) and self.item_ids[i] == checklist_item_id:
+            return i
+        return -1
+
+    def append(self, checklist_item_id: int, esito: Esito, note: str, timestamp: str) -> None:
+        # Solo per il caricamento, con id crescenti; per le modifiche usare `set`.
+        self.item_ids.append(checklist_item_id)
+        self.esiti.append(esito)
+        self.notes.append(note)
+        self.timestamps.append(timestamp)
+
+    def esito_of(self, checklist_item_id: int) -> Esito:
+        i = self._index(checklist_item_id)
+        return Esito(self.esiti[i]) if i >= 0 else Esito.TODO
+
+    def get(self, checklist_item_id: int) -> ItemResult | None:
+        i = self._index(checklist_item_id)
+        if i < 0:
+            return None
+        return ItemResult(Esito(self.esiti[i]).name, self.notes[i], self.timestamps[i])
+
+    def set(self, checklist_item_id: int, esito: str, note: str, timestamp: str) -> None:
+        code = Esito[esito]
+        i = bisect_left(self.item_ids, checklist_item_id)
+        if i < len(self.item_ids) and self.item_ids[i] == checklist_item_id:
+            self.esiti[i] = code
+            self.notes[i] = note
+            self.timestamps[i] = timestamp
+            return
+        self.item_ids.insert(i, checklist_item_id)
+        self.esiti.insert(i, code)
+        self.notes.insert(i, note)
+        self.timestamps.insert(i, timestamp)
+
+    def copy(self) -> RunProgress:
+        other = RunProgress()
+        other.item_ids = array("q", self.item_ids)
+        other.esiti = bytearray(self.esiti)
+        other.notes = self.notes.copy()
+        other.timestamps = self.timestamps.copy()
+        return other
+
+    def count(self, esito: Esito) -> int:
+        return self.esiti.count(esito)
+
+    def items(self) -> Iterator[tuple[int, ItemResult]]:
+        for i, item_id in enumerate(self.item_ids):
+            yield item_id, ItemResult(Esito(self.esiti[i]).name, self.notes[i], self.timestamps[i])
 
@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import contextlib
+import heapq
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator, TextIO
+
+# Query piu' lente conservate singolarmente.
+SLOWEST = 20
+
+_SPACES = re.compile(r"\s+")
+_PLACEHOLDERS = re.compile(r"\?(?:\s*,\s*\?)+")
+
+# Profiler attivo; None = strumentazione spenta (i cursori sono quelli normali di sqlite3).
+_active: Profiler | None = None
+_NULL = contextlib.nullcontext()
+
+
+@dataclass
+class StatementStats:
+    sql: str
+    count: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    rows: int = 0
+
+
+class Profiler:
+    # Statistiche per istruzione SQL (conteggio, tempo di execute + fetch, righe lette),
+    # le singole esecuzioni piu' lente e le fasi (`span`). Thread-safe: il thread del DB della GUI
+    # registra mentre la finestra di diagnostica legge.
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.perf_counter()
+            self.statements: dict[str, StatementStats] = {}
+            self.slowest: list[tuple[float, int, str]] = []  # heap minimo (secondi, n, sql)
+            self.spans: dict[str, list[float]] = {}  # nome -> [conteggio, secondi]
+            self._n = 0
+
+    def statement(self, sql: str, seconds: float, rows: int, new: bool) -> None:
+        # `new`: prima chiamata per questa esecuzione (le successive aggiungono il tempo dei fetch).
+        with self._lock:
+            st = self.statements.get(sql)
+            if st is None:
+                st = self.statements[sql] = StatementStats(sql)
+            if new:
+                st.count += 1
+            st.seconds += seconds
+            st.rows += rows
+
+    def execution_done(self, sql: str, seconds: float) -> None:
+        with self._lock:
+            st = self.statements.get(sql)
+            if st is not None and seconds > st.max_seconds:
+                st.max_seconds = seconds
+            self._n += 1
+            item = (seconds, self._n, sql)
+            if len(self.slowest) < SLOWEST:
+                heapq.heappush(self.slowest, item)
+            elif seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+
+    def span_done(self, name: str, seconds: float) -> None:
+        with self._lock:
+            s = self.spans.setdefault(name, [0, 0.0])
+            s[0] += 1
+            s[1] += seconds
+
+    def summary(self, top: int = 10) -> str:
+        with self._lock:
+            stats = sorted(self.statements.values(), key=lambda s: s.seconds, reverse=True)
+            slowest = sorted(self.slowest, reverse=True)[:top]
+            spans = sorted(self.spans.items(), key=lambda kv: kv[1][1], reverse=True)
+            elapsed = time.perf_counter() - self.started
+        n = sum(s.count for s in stats)
+        sql_time = sum(s.seconds for s in stats)
+        lines = [f"Profilo: {n} query ({len(stats)} distinte) in {sql_time:.3f}s su {elapsed:.3f}s totali"]
+        if spans:
+            lines.append("")
+            lines.append(f"{'fase':<28} {'volte':>6} {'s':>9}")
+            lines.extend(f"{name:<28} {int(c):>6} {t:>9.3f}" for name, (c, t) in spans)
+        if stats:
+            lines.append("")
+            lines.append(f"{'volte':>6} {'tot s':>8} {'media ms':>9} {'max ms':>8} {'righe':>8}  query")
+            for s in stats[:top]:
+                lines.append(
+                    f"{s.count:>6} {s.seconds:>8.3f} {s.seconds / max(s.count, 1) * 1000:>9.2f} "
+                    f"{s.max_seconds * 1000:>8.2f} {s.rows:>8}  {_short(s.sql)}"
+                )
+        if slowest:
+            lines.append("")
+            lines.append("Esecuzioni piu' lente:")
+            lines.extend(f"{t * 1000:>9.2f} ms  {_short(sql)}" for t, _, sql in slowest)
+        return "\n".join(lines)
+
+
+def active() -> Profiler | None:
+    return _active
+
+
+def enable(profiler: Profiler | None = None) -> Profiler:
+    # Da qui in poi i cursori delle connessioni aperte con db.connect vengono misurati.
+    global _active
+    _active = profiler or _active or Profiler()
+    return _active
+
+
+def disable() -> None:
+    global _active
+    _active = None
+
+
+def span(name: str) -> contextlib.AbstractContextManager:
+    # Misura una fase (es. "export.render"); senza profiler attivo e' un contesto vuoto condiviso.
+    p = _active
+    if p is None:
+        return _NULL
+    return _Span(p, name)
+
+
+class _Span:
+    __slots__ = ("_profiler", "_name", "_t0")
+
+    def __init__(self, profiler: Profiler, name: str) -> None:
+        self._profiler = profiler
+        self._name = name
+        self._t0 = 0.0
+
+    def __enter__(self) -> None:
+        self._t0 = time.perf_counter()
+
+    def __exit__(self, *exc: object) -> None:
+        self._profiler.span_done(self._name, time.perf_counter() - self._t0)
+
+
+def timed_writes(out: TextIO, name: str) -> TextIO:
+    # File con le scritture misurate come fase `name`; senza profiler restituisce `out` stesso.
+    p = _active
+    if p is None:
+        return out
+    return _TimedWriter(out, p, name)  # type: ignore[return-value]
+
+
+class _TimedWriter:
+    def __init__(self, out: TextIO, profiler: Profiler, name: str) -> None:
+        self._out = out
+        self._profiler = profiler
+        self._name = name
+
+    def write(self, s: str) -> int:
+        t0 = time.perf_counter()
+        n = self._out.write(s)
+        self._profiler.span_done(self._name, time.perf_counter() - t0)
+        return n
+
+    def writelines(self, lines: Iterable[str]) -> None:
+        t0 = time.perf_counter()
+        self._out.writelines(lines)
+        self._profiler.span_done(self._name, time.perf_counter() - t0)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._out, name)
+
+
+class TracedConnection(sqlite3.Connection):
+    # Classe delle connessioni di db.connect: finche' il profiler e' spento usa i cursori normali
+    # (costo: una chiamata Python in piu' per query), altrimenti cursori che misurano le query.
+    # Connection.execute crea il cursore in C senza passare da `cursor()`: va ridefinito anche lui.
+    def cursor(self, factory: type = sqlite3.Cursor) -> sqlite3.Cursor:  # type: ignore[override]
+        if _active is None or factory is not sqlite3.Cursor:
+            return super().cursor(factory)
+        return super().cursor(TracedCursor)
+
+    def execute(self, sql: str, parameters: Any = (), /) -> sqlite3.Cursor:
+        if _active is None:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Any, /) -> sqlite3.Cursor:
+        if _active is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script: str, /) -> sqlite3.Cursor:
+        if _active is None:
+            return super().executescript(sql_script)
+        return self.cursor().executescript(sql_script)
+
+
+class TracedCursor(sqlite3.Cursor):
+    # Tempo di execute piu' quello dei fetch successivi, attribuito all'istruzione eseguita.
+    _sql = ""
+    _elapsed = 0.0
+    _open = False
+
+    def execute(self, sql: str, parameters: Any = (), /) -> TracedCursor:
+        return self._timed(sql, super().execute, sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Any, /) -> TracedCursor:
+        return self._timed(sql, super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script: str, /) -> TracedCursor:
+        return self._timed(sql_script, super().executescript, sql_script)
+
+    def _timed(self, sql: str, fn: Any, *args: Any) -> TracedCursor:
+        self._done()
+        p = _active
+        key = normalize(sql)
+        t0 = time.perf_counter()
+        try:
+            fn(*args)
+        finally:
+            elapsed = time.perf_counter() - t0
+            if p is not None:
+                p.statement(key, elapsed, 0, True)
+        self._sql = key
+        self._elapsed = elapsed
+        self._open = True
+        if self.description is None:
+            self._done()  # nessuna riga da leggere
+        return self
+
+    def _fetched(self, t0: float, rows: int, last: bool) -> None:
+        elapsed = time.perf_counter() - t0
+        p = _active
+        if p is not None and self._open:
+            p.statement(self._sql, elapsed, rows, False)
+        self._elapsed += elapsed
+        if last:
+            self._done()
+
+    def _done(self) -> None:
+        if self._open:
+            self._open = False
+            p = _active
+            if p is not None:
+                p.execution_done(self._sql, self._elapsed)
+
+    def __next__(self) -> Any:
+        t0 = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(t0, 0, True)
+            raise
+        self._fetched(t0, 1, False)
+        return row
+
+    def fetchone(self) -> Any:
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(t0, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size: int | None = None) -> list[Any]:
+        t0 = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(t0, len(rows), not rows)
+        return rows
+
+    def fetchall(self) -> list[Any]:
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(t0, len(rows), True)
+        return rows
+
+    def close(self) -> None:
+        self._done()
+        super().close()
+
+    def __del__(self) -> None:
+        self._done()
+
+
+def normalize(sql: str) -> str:
+    # Chiave di raggruppamento: spazi compattati, liste IN (?,?,...) di qualsiasi lunghezza uguali.
+    return _PLACEHOLDERS.sub("?,...", _SPACES.sub(" ", sql).strip())
+
+
+def _short(sql: str, width: int = 110) -> str:
+    return sql if len(sql) <= width else sql[: width - 3] + "..."
+
+
+@contextlib.contextmanager
+def profile_calls(path: str) -> Iterator[None]:
+    # cProfile del blocco, salvato in `path` (leggibile con `python -m pstats path`).
+    import cProfile
+
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        prof.dump_stats(path)
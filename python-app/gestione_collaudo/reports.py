@@ -1,74 +1,369 @@
 from __future__ import annotations
 
+import csv
 import html
+import json
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, TextIO
 
-from gestione_collaudo.models import ChecklistItem, Project, Run
+from gestione_collaudo import profiling
+from gestione_collaudo.models import ChecklistItem, DiffRow, Project, Run, RunDiff
 
+# Riga del dettaglio prove: (categoria, titolo, atteso, esito o None se da fare, note, timestamp).
+ReportRow = tuple[str, str, str, "str | None", str, str]
 
-def build_markdown_report(
+
+@dataclass(frozen=True)
+class ReportModel:
+    # Modello intermedio del report: intestazione e sintesi si calcolano una volta sola,
+    # poi ogni backend lo rende in un unico passaggio sulle righe.
+    # `rows` deve essere ri-iterabile se si generano piu' formati (lista o ReiterableRows).
+    project: Project
+    run: Run
+    totale: int
+    eseguite: int
+    fail: int
+    rows: Iterable[ReportRow]
+    generated_by: str | None = None
+    footer: str | None = None
+
+
+class ReiterableRows:
+    # Rilegge le righe a ogni iterazione (es. da un cursore DB) invece di tenerle in memoria.
+    def __init__(self, factory: Callable[[], Iterable[ReportRow]]) -> None:
+        self._factory = factory
+
+    def __iter__(self) -> Iterator[ReportRow]:
+        return iter(self._factory())
+
+
+def build_report_model(
     project: Project,
     run: Run,
     checklist: list[ChecklistItem],
     progress: dict[int, dict[str, str]],
     generated_by: str | None = None,
-) -> str:
+    footer: str | None = None,
+) -> ReportModel:
+    rows: list[ReportRow] = []
     done = 0
     fail = 0
     for item in checklist:
         p = progress.get(item.id)
         if not p:
+            rows.append((item.categoria, item.titolo, item.atteso, None, "", ""))
             continue
         done += 1
         if p.get("esito") == "FAIL":
             fail += 1
+        rows.append((item.categoria, item.titolo, item.atteso, p.get("esito"), p.get("note") or "", p.get("timestamp") or ""))
+    return ReportModel(project, run, len(checklist), done, fail, rows, generated_by, footer)
+
+
+def build_markdown_report(
+    project: Project,
+    run: Run,
+    checklist: list[ChecklistItem],
+    progress: dict[int, dict[str, str]],
+    generated_by: str | None = None,
+) -> str:
+    with profiling.span("report.markdown"):
+        return "\n".join(_iter_markdown_lines(build_report_model(project, run, checklist, progress, generated_by)))
 
-    total = len(checklist)
 
-    lines: list[str] = []
-    lines.append(f"# Report collaudo - {project.nome}")
-    lines.append("")
-    lines.append(f"- Cliente: {project.cliente or '-'}")
-    lines.append(f"- Sito: {project.sito or '-'}")
-    lines.append(f"- Run: {run.nome}")
-    lines.append(f"- Operatore: {run.operatore or '-'}")
-    lines.append(f"- Avvio: {run.started_at.isoformat(timespec='seconds')}")
+def render_markdown(model: ReportModel, out: TextIO) -> None:
+    _write_joined(out, _iter_markdown_lines(model))
+
+
+def _iter_markdown_lines(model: ReportModel) -> Iterator[str]:
+    project, run = model.project, model.run
+    yield f"# Report collaudo - {project.nome}"
+    yield ""
+    yield f"- Cliente: {project.cliente or '-'}"
+    yield f"- Sito: {project.sito or '-'}"
+    yield f"- Run: {run.nome}"
+    yield f"- Operatore: {run.operatore or '-'}"
+    yield f"- Avvio: {run.started_dt.isoformat(timespec='seconds')}"
     if run.closed_at:
-        lines.append(f"- Chiusura: {run.closed_at.isoformat(timespec='seconds')}")
-    lines.append("")
-    lines.append("## Sintesi")
-    lines.append("")
-    lines.append(f"- Totale prove: **{total}**")
-    lines.append(f"- Eseguite: **{done}**")
-    lines.append(f"- Fail: **{fail}**")
-    lines.append("")
-    lines.append("## Dettaglio prove")
-    lines.append("")
+        yield f"- Chiusura: {run.closed_dt.isoformat(timespec='seconds')}"
+    yield ""
+    yield "## Sintesi"
+    yield ""
+    yield f"- Totale prove: **{model.totale}**"
+    yield f"- Eseguite: **{model.eseguite}**"
+    yield f"- Fail: **{model.fail}**"
+    yield ""
+    yield "## Dettaglio prove"
+    yield ""
 
-    for item in checklist:
-        p = progress.get(item.id)
-        esito = p.get("esito") if p else "TODO"
-        note = (p.get("note") if p else "") or ""
-        ts = (p.get("timestamp") if p else "") or ""
-        cat = f"[{item.categoria}] " if item.categoria else ""
-
-        lines.append(f"- **{esito}** - {cat}{item.titolo}")
-        if item.atteso:
-            lines.append(f"  - Atteso: {item.atteso}")
+    for categoria, titolo, atteso, esito, note, ts in model.rows:
+        cat = f"[{categoria}] " if categoria else ""
+        yield f"- **{esito or 'TODO'}** - {cat}{titolo}"
+        if atteso:
+            yield f"  - Atteso: {atteso}"
+        if ts:
+            yield f"  - Timestamp: {ts}"
+        if note:
+            yield f"  - Note: {note}"
+
+    yield ""
+    if model.generated_by:
+        yield "---"
+        yield f"_Report generato con {model.generated_by}_"
+        yield ""
+
+
+_HTML_HEAD = (
+    '<!doctype html><html lang="it"><head><meta charset="utf-8"/>\n'
+    '<meta name="viewport" content="width=device-width, initial-scale=1"/>\n'
+    "<title>Report collaudo</title>\n"
+    "<style>"
+    "body{font-family:system-ui,Segoe UI,Arial;max-width:900px;margin:24px auto;padding:0 16px;}"
+    "h1{font-size:28px;} h2{margin-top:22px;} ul{padding-left:18px;}"
+    "code{background:#f2f2f2;padding:2px 6px;border-radius:6px;}"
+    "</style>\n"
+    "</head><body>"
+)
+
+
+def render_html(model: ReportModel, out: TextIO) -> None:
+    _write_joined(out, _iter_html_report(model))
+
+
+def _iter_html_report(model: ReportModel) -> Iterator[str]:
+    e = html.escape
+    project, run = model.project, model.run
+    yield _HTML_HEAD
+    yield f"<h1>Report collaudo - {e(project.nome)}</h1>"
+    yield "<ul>"
+    yield f"<li>Cliente: {e(project.cliente or '-')}</li>"
+    yield f"<li>Sito: {e(project.sito or '-')}</li>"
+    yield f"<li>Run: {e(run.nome)}</li>"
+    yield f"<li>Operatore: {e(run.operatore or '-')}</li>"
+    yield f"<li>Avvio: {run.started_dt.isoformat(timespec='seconds')}</li>"
+    if run.closed_at:
+        yield f"<li>Chiusura: {run.closed_dt.isoformat(timespec='seconds')}</li>"
+    yield "</ul>"
+    yield "<h2>Sintesi</h2>"
+    yield "<ul>"
+    yield f"<li>Totale prove: <strong>{model.totale}</strong></li>"
+    yield f"<li>Eseguite: <strong>{model.eseguite}</strong></li>"
+    yield f"<li>Fail: <strong>{model.fail}</strong></li>"
+    yield "</ul>"
+    yield "<h2>Dettaglio prove</h2>"
+    yield "<ul>"
+    for categoria, titolo, atteso, esito, note, ts in model.rows:
+        cat = f"[{e(categoria)}] " if categoria else ""
+        sub = []
+        if atteso:
+            sub.append(f"<li>Atteso: {e(atteso)}</li>")
         if ts:
-            lines.append(f"  - Timestamp: {ts}")
+            sub.append(f"<li>Timestamp: {e(ts)}</li>")
         if note:
-            lines.append(f"  - Note: {note}")
+            sub.append(f"<li>Note: {e(note)}</li>")
+        nested = f"<ul>{''.join(sub)}</ul>" if sub else ""
+        yield f"<li><strong>{e(esito or 'TODO')}</strong> - {cat}{e(titolo)}{nested}</li>"
+    yield "</ul>"
+    if model.footer:
+        yield "<hr/>"
+        yield f"<p><em>{e(model.footer)}</em></p>"
+    yield "</body></html>"
+
+
+def render_csv(model: ReportModel, out: TextIO) -> None:
+    # Solo il dettaglio prove, una riga per voce (intestazione e sintesi sono negli altri formati).
+    w = csv.writer(out, delimiter=";", lineterminator="\n")
+    w.writerow(("categoria", "titolo", "atteso", "esito", "note", "timestamp"))
+    w.writerows((c, t, a, esito or "TODO", n, ts) for c, t, a, esito, n, ts in model.rows)
 
-    lines.append("")
-    if generated_by:
-        lines.append("---")
-        lines.append(f"_Report generato con {generated_by}_")
-        lines.append("")
-    return "\n".join(lines)
+
+def render_json(model: ReportModel, out: TextIO) -> None:
+    # JSON scritto a pezzi: le voci non vengono mai raccolte in una lista.
+    project, run = model.project, model.run
+    head = {
+        "progetto": {"id": project.id, "nome": project.nome, "cliente": project.cliente, "sito": project.sito},
+        "run": _run_json(run),
+        "sintesi": {"totale": model.totale, "eseguite": model.eseguite, "fail": model.fail},
+        "generato_con": model.generated_by,
+    }
+    out.write(json.dumps(head, ensure_ascii=False)[:-1])
+    out.write(', "voci": [')
+    sep = "\n"
+    for categoria, titolo, atteso, esito, note, ts in model.rows:
+        out.write(sep)
+        out.write(
+            json.dumps(
+                {
+                    "categoria": categoria,
+                    "titolo": titolo,
+                    "atteso": atteso,
+                    "esito": esito or "TODO",
+                    "note": note,
+                    "timestamp": ts,
+                },
+                ensure_ascii=False,
+            )
+        )
+        sep = ",\n"
+    out.write("\n]}\n")
+
+
+def _run_json(run: Run) -> dict:
+    return {
+        "id": run.id,
+        "nome": run.nome,
+        "operatore": run.operatore,
+        "avvio": run.started_dt.isoformat(timespec="seconds"),
+        "chiusura": run.closed_dt.isoformat(timespec="seconds") if run.closed_at else None,
+    }
+
+
+# Da incrementare quando cambia l'output di un backend: invalida i report in cache.
+RENDERER_VERSION = 1
+
+# Backend disponibili: formato -> funzione(model, file di testo).
+RENDERERS: dict[str, Callable[[ReportModel, TextIO], None]] = {
+    "md": render_markdown,
+    "html": render_html,
+    "csv": render_csv,
+    "json": render_json,
+}
+
+
+def render_all(model: ReportModel, outputs: dict[str, TextIO]) -> None:
+    # Un passaggio sulle righe per ogni formato richiesto; la sintesi e' gia' nel modello.
+    for fmt, out in outputs.items():
+        with profiling.span(f"report.render.{fmt}"):
+            RENDERERS[fmt](model, out)
+
+
+# Sezioni del confronto tra run, nell'ordine di analytics.DIFF_TIPI.
+DIFF_TITOLI = {
+    "regressione": "Regressioni (PASS -> FAIL)",
+    "risolta": "Risolte (FAIL -> PASS)",
+    "cambiata": "Altri cambi di esito",
+    "nuova": "Eseguite per la prima volta",
+    "da_fare": "Ancora da fare",
+}
+
+
+def _diff_run_label(run: Run) -> str:
+    return f"{run.nome} (#{run.id}, avvio {run.started_dt.isoformat(timespec='seconds')})"
+
+
+def _diff_voce(row: DiffRow) -> tuple[str, str, str, str]:
+    # (cambio "BASE -> TARGET", categoria, titolo con codice, note) di una voce del confronto.
+    _, codice, categoria, titolo, esito_base, esito_target, note = row
+    voce = f"{titolo} ({codice})" if codice else titolo
+    return f"{esito_base or 'TODO'} -> {esito_target or 'TODO'}", categoria, voce, note
+
+
+def render_diff_markdown(diff: RunDiff, out: TextIO) -> None:
+    _write_joined(out, _iter_diff_markdown_lines(diff))
+
+
+def _iter_diff_markdown_lines(diff: RunDiff) -> Iterator[str]:
+    yield f"# Confronto run - {diff.project.nome}"
+    yield ""
+    yield f"- Base: {_diff_run_label(diff.base)}"
+    yield f"- Target: {_diff_run_label(diff.target)}"
+    yield ""
+    yield "## Sintesi"
+    yield ""
+    yield f"- Voci: **{diff.totale}**"
+    for tipo, rows in diff.righe.items():
+        yield f"- {DIFF_TITOLI[tipo]}: **{len(rows)}**"
+    yield f"- Invariate: **{diff.invariate}**"
+    for tipo, rows in diff.righe.items():
+        if not rows:
+            continue
+        yield ""
+        yield f"## {DIFF_TITOLI[tipo]}"
+        yield ""
+        for row in rows:
+            cambio, categoria, voce, note = _diff_voce(row)
+            cat = f"[{categoria}] " if categoria else ""
+            yield f"- **{cambio}** - {cat}{voce}"
+            if note:
+                yield f"  - Note: {note}"
+    yield ""
+
+
+def render_diff_html(diff: RunDiff, out: TextIO) -> None:
+    _write_joined(out, _iter_diff_html(diff))
+
+
+def _iter_diff_html(diff: RunDiff) -> Iterator[str]:
+    e = html.escape
+    yield _HTML_HEAD
+    yield f"<h1>Confronto run - {e(diff.project.nome)}</h1>"
+    yield "<ul>"
+    yield f"<li>Base: {e(_diff_run_label(diff.base))}</li>"
+    yield f"<li>Target: {e(_diff_run_label(diff.target))}</li>"
+    yield "</ul>"
+    yield "<h2>Sintesi</h2>"
+    yield "<ul>"
+    yield f"<li>Voci: <strong>{diff.totale}</strong></li>"
+    for tipo, rows in diff.righe.items():
+        yield f"<li>{e(DIFF_TITOLI[tipo])}: <strong>{len(rows)}</strong></li>"
+    yield f"<li>Invariate: <strong>{diff.invariate}</strong></li>"
+    yield "</ul>"
+    for tipo, rows in diff.righe.items():
+        if not rows:
+            continue
+        yield f"<h2>{e(DIFF_TITOLI[tipo])}</h2>"
+        yield "<ul>"
+        for row in rows:
+            cambio, categoria, voce, note = _diff_voce(row)
+            cat = f"[{e(categoria)}] " if categoria else ""
+            nested = f"<ul><li>Note: {e(note)}</li></ul>" if note else ""
+            yield f"<li><strong>{e(cambio)}</strong> - {cat}{e(voce)}{nested}</li>"
+        yield "</ul>"
+    yield "</body></html>"
+
+
+def render_diff_json(diff: RunDiff, out: TextIO) -> None:
+    project = diff.project
+    sintesi = {"totale": diff.totale, **{tipo: len(rows) for tipo, rows in diff.righe.items()}, "invariate": diff.invariate}
+    cambi = {
+        tipo: [
+            {
+                "checklist_item_id": item_id,
+                "codice": codice,
+                "categoria": categoria,
+                "titolo": titolo,
+                "base": esito_base or "TODO",
+                "target": esito_target or "TODO",
+                "note": note,
+            }
+            for item_id, codice, categoria, titolo, esito_base, esito_target, note in rows
+        ]
+        for tipo, rows in diff.righe.items()
+    }
+    json.dump(
+        {
+            "progetto": {"id": project.id, "nome": project.nome, "cliente": project.cliente, "sito": project.sito},
+            "base": _run_json(diff.base),
+            "target": _run_json(diff.target),
+            "sintesi": sintesi,
+            "cambi": cambi,
+        },
+        out,
+        ensure_ascii=False,
+    )
+    out.write("\n")
+
+
+DIFF_RENDERERS: dict[str, Callable[[RunDiff, TextIO], None]] = {
+    "md": render_diff_markdown,
+    "html": render_diff_html,
+    "json": render_diff_json,
+}
 
 
 def markdown_to_simple_html(md: str, footer: str | None = None) -> str:
-    # Convertitore minimale (non completo). Serve solo a rendere condivisibile il report.
+    # Convertitore minimale (non completo) da Markdown gia' generato.
+    # Per i nuovi report usa render_html, che parte dal modello e mantiene le sotto-voci annidate.
     lines = md.splitlines()
     out: list[str] = []
     out.append('<!doctype html><html lang="it"><head><meta charset="utf-8"/>')
@@ -119,3 +414,14 @@ def markdown_to_simple_html(md: str, footer: str | None = None) -> str:
 
     out.append("</body></html>")
     return "\n".join(out)
+
+
+def _write_joined(out: TextIO, lines: Iterable[str]) -> None:
+    # Equivalente a out.write("\n".join(lines)) senza costruire la stringa intera.
+    first = True
+    for line in lines:
+        if first:
+            first = False
+        else:
+            out.write("\n")
+        out.write(line)
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import re
+import sqlite3
+
+from gestione_collaudo import db
+from gestione_collaudo.models import ChecklistMatch, NoteMatch
+
+# Pesi bm25 delle colonne di checklist_fts: il titolo conta piu' di categoria e risultato atteso.
+_CHECKLIST_WEIGHTS = "10.0, 2.0, 1.0"
+
+_WORD = re.compile(r"\w+")
+
+
+def fts_available(con: sqlite3.Connection) -> bool:
+    # Servono le tabelle FTS (create solo se la migrazione ha trovato FTS5) e il modulo FTS5 nella
+    # libreria SQLite di adesso: un DB creato altrove puo' avere le tabelle ma non il modulo.
+    row = con.execute(
+        "SELECT count(*) FROM sqlite_master WHERE type='table' AND name IN ('checklist_fts', 'run_notes_fts')"
+    ).fetchone()
+    return int(row[0]) == 2 and db.fts5_available(con)
+
+
+def fts_query(text: str) -> str:
+    # Testo libero -> query FTS5: ogni parola deve comparire, anche come prefisso ("emerg" trova "emergenza").
+    return " ".join(f'"{w}"*' for w in _WORD.findall(text))
+
+
+def search_checklist(
+    con: sqlite3.Connection,
+    text: str,
+    project_id: int | None = None,
+    limit: int | None = 50,
+    include_retired: bool = False,
+) -> list[ChecklistMatch]:
+    # Voci della checklist che contengono tutte le parole di `text` in titolo, categoria o atteso,
+    # dalla piu' pertinente. Senza FTS5 si ripiega su LIKE (ordine della checklist, niente rank).
+    words = _WORD.findall(text)
+    if not words:
+        return []
+    where: list[str] = []
+    params: list[object] = []
+    if fts_available(con):
+        sql = (
+            "SELECT ci.id, ci.project_id, ci.codice, ci.categoria, ci.titolo, ci.atteso, "
+            f"bm25(checklist_fts, {_CHECKLIST_WEIGHTS}) AS rank "
+            "FROM checklist_fts JOIN checklist_items ci ON ci.id=checklist_fts.rowid"
+        )
+        where.append("checklist_fts MATCH ?")
+        params.append(fts_query(text))
+        order = "rank"
+    else:
+        sql = "SELECT ci.id, ci.project_id, ci.codice, ci.categoria, ci.titolo, ci.atteso, 0 FROM checklist_items ci"
+        for w in words:
+            where.append(
+                "(ci.titolo LIKE ? ESCAPE '\\' OR ci.categoria LIKE ? ESCAPE '\\' OR ci.atteso LIKE ? ESCAPE '\\')"
+            )
+            params.extend([_like(w)] * 3)
+        order = "ci.project_id, ci.ordine"
+    if project_id is not None:
+        where.append("ci.project_id=?")
+        params.append(project_id)
+    if not include_retired:
+        where.append("ci.attivo=1")
+    sql += f" WHERE {' AND '.join(where)} ORDER BY {order}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    cur = con.execute(sql, params)
+    cur.row_factory = None
+    return [ChecklistMatch(int(r[0]), int(r[1]), r[2] or "", r[3], r[4], r[5], float(r[6])) for r in cur]
+
+
+def search_notes(
+    con: sqlite3.Connection,
+    text: str,
+    project_id: int | None = None,
+    run_id: int | None = None,
+    esito: str | None = None,
+    limit: int | None = 50,
+) -> list[NoteMatch]:
+    # Esiti la cui nota contiene tutte le parole di `text`, filtrabili per progetto, run ed esito.
+    words = _WORD.findall(text)
+    if not words:
+        return []
+    where: list[str] = []
+    params: list[object] = []
+    cols = (
+        "ri.id, ri.run_id, r.project_id, ri.checklist_item_id, ci.titolo, ri.esito, ri.note, ri.timestamp"
+    )
+    joins = "JOIN runs r ON r.id=ri.run_id JOIN checklist_items ci ON ci.id=ri.checklist_item_id"
+    if fts_available(con):
+        sql = (
+            f"SELECT {cols}, bm25(run_notes_fts) AS rank "
+            f"FROM run_notes_fts JOIN run_items ri ON ri.id=run_notes_fts.rowid {joins}"
+        )
+        where.append("run_notes_fts MATCH ?")
+        params.append(fts_query(text))
+        order = "rank"
+    else:
+        sql = f"SELECT {cols}, 0 FROM run_items ri {joins}"
+        for w in words:
+            where.append("ri.note LIKE ? ESCAPE '\\'")
+            params.append(_like(w))
+        order = "ri.timestamp DESC"
+    if project_id is not None:
+        where.append("r.project_id=?")
+        params.append(project_id)
+    if run_id is not None:
+        where.append("ri.run_id=?")
+        params.append(run_id)
+    if esito:
+        where.append("ri.esito=?")
+        params.append(esito.strip().upper())
+    sql += f" WHERE {' AND '.join(where)} ORDER BY {order}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    cur = con.execute(sql, params)
+    cur.row_factory = None
+    return [
+        NoteMatch(int(r[0]), int(r[1]), int(r[2]), int(r[3]), r[4], r[5], r[6], r[7], float(r[8])) for r in cur
+    ]
+
+
+def _like(word: str) -> str:
+    return "%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
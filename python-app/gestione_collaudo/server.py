@@ -0,0 +1,585 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import hmac
+import io
+import json
+import re
+import signal
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+from urllib.parse import parse_qsl, urlsplit
+
+from gestione_collaudo import APP_VERSIONE, db, profiling
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Thread (ognuno con la propria connessione) che servono le letture.
+READERS = 4
+# Esiti massimi scritti dal writer in una transazione: le richieste arrivate mentre la
+# transazione precedente era in corso vengono accorpate nella successiva.
+MAX_BATCH = 2000
+MAX_BODY = 16 << 20
+IDLE_TIMEOUT = 30.0
+
+_REASONS = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+_JSON = "application/json; charset=utf-8"
+_REPORT_TYPES = {
+    "md": "text/markdown; charset=utf-8",
+    "html": "text/html; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "json": _JSON,
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: dict[str, str]
+    headers: dict[str, str]
+    body: bytes
+
+    def json(self) -> dict:
+        try:
+            obj = json.loads(self.body or b"{}")
+        except ValueError as exc:
+            raise HttpError(400, f"JSON non valido: {exc}") from None
+        if not isinstance(obj, dict):
+            raise HttpError(400, "Il corpo deve essere un oggetto JSON.")
+        return obj
+
+
+@dataclass
+class ServerStats:
+    richieste: int = 0
+    errori: int = 0
+    transazioni: int = 0  # transazioni del writer per gli esiti
+    esiti: int = 0
+    lotto_max: int = 0
+    per_rotta: dict[str, int] = field(default_factory=dict)
+
+
+# Risposta: (stato, corpo, content-type)
+Response = tuple[int, bytes, str]
+Handler = Callable[..., Awaitable[Response]]
+
+
+def _jsonable(obj: Any) -> Any:
+    # Modelli (dataclass con slots) come oggetti JSON con i loro campi.
+    if dataclasses.is_dataclass(obj):
+        return {f.name: getattr(obj, f.name) for f in dataclasses.fields(obj)}
+    raise TypeError(f"Tipo non serializzabile: {type(obj).__name__}")
+
+
+def encode(obj: Any) -> bytes:
+    return json.dumps(obj, default=_jsonable, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _ok(obj: Any, status: int = 200) -> Response:
+    return status, encode(obj), _JSON
+
+
+def _int(value: Any, name: str) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HttpError(400, f"'{name}' deve essere un numero intero.") from None
+
+
+def _page_args(query: dict[str, str]) -> tuple[db.PageCursor | None, int]:
+    # `after` = cursore restituito come `next` dalla pagina precedente ("<timestamp>,<id>").
+    after = None
+    if query.get("after"):
+        ts, _, rid = query["after"].rpartition(",")
+        after = (ts, _int(rid, "after"))
+    limit = _int(query.get("limit", db.PAGE_SIZE), "limit")
+    return after, max(1, min(limit, 1000))
+
+
+def _cursor(c: db.PageCursor | None) -> str | None:
+    return f"{c[0]},{c[1]}" if c else None
+
+
+def _result_rows(run_id: int, obj: dict) -> list[tuple[int, int, str, str]]:
+    # Un esito ({checklist_item_id, esito, note}) o piu' esiti ({"results": [...]}) di un run.
+    items = obj.get("results", [obj])
+    if not isinstance(items, list) or not items:
+        raise HttpError(400, "'results' deve essere una lista non vuota.")
+    rows = []
+    for it in items:
+        if not isinstance(it, dict):
+            raise HttpError(400, "Ogni esito deve essere un oggetto JSON.")
+        try:
+            esito = db.normalize_esito(str(it.get("esito") or ""))
+        except ValueError as exc:
+            raise HttpError(400, str(exc)) from None
+        rows.append((run_id, _int(it.get("checklist_item_id"), "checklist_item_id"), esito, str(it.get("note") or "").strip()))
+    return rows
+
+
+def _checklist_rows(obj: dict) -> list[tuple[str, str, str, str]]:
+    items = obj.get("items")
+    if not isinstance(items, list):
+        raise HttpError(400, "'items' deve essere una lista.")
+    rows = []
+    for it in items:
+        if isinstance(it, dict):
+            rows.append(tuple(str(it.get(k) or "") for k in ("titolo", "categoria", "atteso", "codice")))
+        elif isinstance(it, list):
+            rows.append(tuple(str(v or "") for v in (it + ["", "", "", ""])[:4]))
+        else:
+            raise HttpError(400, "Ogni voce deve essere un oggetto o una lista.")
+    return rows  # type: ignore[return-value]
+
+
+class Server:
+    # API HTTP/JSON del modulo db. Le letture girano su un pool di thread con una connessione
+    # ciascuno; tutte le scritture passano da un unico writer (un thread, una connessione), che
+    # accorpa gli esiti in attesa in un'unica transazione: con molti banchi che registrano insieme
+    # si paga un commit per lotto invece che uno per richiesta, senza contesa sul lock del DB.
+    def __init__(
+        self,
+        db_path: str,
+        journal_mode: str | None = "wal",
+        synchronous: str | None = None,
+        busy_timeout_ms: int = db.DEFAULT_BUSY_TIMEOUT_MS,
+        readers: int = READERS,
+        max_batch: int = MAX_BATCH,
+        token: str | None = None,
+    ) -> None:
+        self.db_path = db_path
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout_ms = busy_timeout_ms
+        self.readers = max(1, readers)
+        self.max_batch = max(1, max_batch)
+        self.token = token
+        self.stats = ServerStats()
+        self._local = threading.local()
+        self._read_pool: ThreadPoolExecutor | None = None
+        self._write_pool: ThreadPoolExecutor | None = None
+        self._writes: asyncio.Queue | None = None
+        self._writer_task: asyncio.Task | None = None
+        self._server: asyncio.AbstractServer | None = None
+        self._routes: list[tuple[str, re.Pattern, Handler]] = [
+            ("GET", re.compile(r"/api/health"), self._health),
+            ("GET", re.compile(r"/api/projects"), self._list_projects),
+            ("POST", re.compile(r"/api/projects"), self._create_project),
+            ("GET", re.compile(r"/api/projects/(\d+)"), self._get_project),
+            ("GET", re.compile(r"/api/projects/(\d+)/checklist"), self._list_checklist),
+            ("PUT", re.compile(r"/api/projects/(\d+)/checklist"), self._put_checklist),
+            ("GET", re.compile(r"/api/projects/(\d+)/runs"), self._list_runs),
+            ("POST", re.compile(r"/api/projects/(\d+)/runs"), self._create_run),
+            ("GET", re.compile(r"/api/projects/(\d+)/summaries"), self._summaries),
+            ("GET", re.compile(r"/api/runs/(\d+)"), self._get_run),
+            ("POST", re.compile(r"/api/runs/(\d+)/close"), self._close_run),
+            ("GET", re.compile(r"/api/runs/(\d+)/results"), self._get_results),
+            ("POST", re.compile(r"/api/runs/(\d+)/results"), self._post_results),
+            ("GET", re.compile(r"/api/runs/(\d+)/report"), self._report),
+        ]
+
+    # --- ciclo di vita ---
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> tuple[str, int]:
+        loop = asyncio.get_running_loop()
+        # Il writer apre il DB per primo: eventuali migrazioni e il journal WAL prima dei lettori.
+        self._write_pool = ThreadPoolExecutor(1, "collaudo-writer", initializer=self._open, initargs=(self.journal_mode,))
+        await loop.run_in_executor(self._write_pool, self._con)
+        self._read_pool = ThreadPoolExecutor(self.readers, "collaudo-reader", initializer=self._open, initargs=(None,))
+        self._writes = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._writer())
+        self._server = await asyncio.start_server(self._handle, host, port)
+        sock = self._server.sockets[0].getsockname()
+        return sock[0], sock[1]
+
+    async def serve_forever(self) -> None:
+        assert self._server is not None
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        # Smette di accettare richieste e attende che il writer abbia scritto quelle in coda.
+        if self._server is not None:
+            self._server.close()
+        if self._writes is not None and self._writer_task is not None:
+            self._writes.put_nowait(None)
+            await self._writer_task
+        for pool in (self._read_pool, self._write_pool):
+            if pool is not None:
+                pool.shutdown(wait=True)
+
+    def _open(self, journal_mode: str | None) -> None:
+        self._local.con = db.connect(self.db_path, journal_mode, self.synchronous, self.busy_timeout_ms)
+
+    def _con(self) -> sqlite3.Connection:
+        return self._local.con
+
+    # --- letture e scritture ---
+
+    async def read(self, fn: Callable[..., Any], *args: Any) -> bytes:
+        # Esegue fn(con, *args) su un thread lettore e codifica il risultato in JSON li'
+        # (le risposte grandi non bloccano il ciclo degli eventi).
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_pool, self._read_call, fn, args)
+
+    def _read_call(self, fn: Callable[..., Any], args: tuple) -> bytes:
+        result = fn(self._local.con, *args)
+        if result is None:
+            raise HttpError(404, "Non trovato.")
+        return result if isinstance(result, bytes) else encode(result)
+
+    async def write(self, fn: Callable[..., Any], *args: Any) -> Any:
+        # Scrittura generica, eseguita dal writer nell'ordine di arrivo.
+        fut = asyncio.get_running_loop().create_future()
+        self._writes.put_nowait(("call", (fn, args), fut))  # type: ignore[union-attr]
+        return await fut
+
+    async def write_results(self, rows: list[tuple[int, int, str, str]]) -> int:
+        fut = asyncio.get_running_loop().create_future()
+        self._writes.put_nowait(("results", rows, fut))  # type: ignore[union-attr]
+        return await fut
+
+    async def _writer(self) -> None:
+        loop = asyncio.get_running_loop()
+        queue = self._writes
+        assert queue is not None
+        carry = None
+        while True:
+            item = carry if carry is not None else await queue.get()
+            carry = None
+            if item is None:
+                return
+            kind, payload, fut = item
+            if kind == "call":
+                fn, args = payload
+                try:
+                    result = await loop.run_in_executor(self._write_pool, lambda: fn(self._local.con, *args))
+                except Exception as exc:  # noqa: BLE001
+                    _settle(fut, exc=exc)
+                else:
+                    _settle(fut, result)
+                continue
+            # Esiti: si accodano tutti quelli gia' arrivati, fino a max_batch.
+            batch = [item]
+            n = len(payload)
+            while n < self.max_batch:
+                try:
+                    nxt = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if nxt is None or nxt[0] != "results":
+                    carry = nxt
+                    break
+                batch.append(nxt)
+                n += len(nxt[1])
+            try:
+                errors = await loop.run_in_executor(self._write_pool, self._write_batch, batch)
+            except Exception as exc:  # noqa: BLE001
+                # DB occupato oltre il backoff, disco pieno, ...: fallisce il lotto, non il writer.
+                for _, _, f in batch:
+                    _settle(f, exc=exc)
+                continue
+            self.stats.transazioni += 1
+            self.stats.lotto_max = max(self.stats.lotto_max, n)
+            for (_, rows, f), exc in zip(batch, errors):
+                if exc is None:
+                    self.stats.esiti += len(rows)
+                    _settle(f, len(rows))
+                else:
+                    _settle(f, exc=exc)
+
+    def _write_batch(self, batch: list[tuple[str, list, asyncio.Future]]) -> list[Exception | None]:
+        # Le richieste con voci di un altro progetto vengono scartate (400); le altre vanno in una
+        # transazione per tutto il lotto. Se fallisce (es. voce inesistente) si riscrivono una per
+        # una, cosi' l'errore arriva solo a chi l'ha causato.
+        con = self._local.con
+        foreign = set(db.foreign_run_items(con, [(r[0], r[1]) for _, rows, _ in batch for r in rows]))
+        errors: list[Exception | None] = [None] * len(batch)
+        if foreign:
+            for k, (_, rows, _) in enumerate(batch):
+                bad = next(((r[0], r[1]) for r in rows if (r[0], r[1]) in foreign), None)
+                if bad is not None:
+                    errors[k] = HttpError(400, f"La voce {bad[1]} non e' nella checklist del progetto del run {bad[0]}.")
+        todo = [k for k, e in enumerate(errors) if e is None]
+        try:
+            db.record_ingest_batch(con, [r for k in todo for r in batch[k][1]])
+            return errors
+        except sqlite3.IntegrityError:
+            if len(todo) == 1:
+                errors[todo[0]] = HttpError(409, "Run o voce inesistente.")
+                return errors
+        for k in todo:
+            try:
+                db.record_ingest_batch(con, batch[k][1])
+            except sqlite3.IntegrityError:
+                errors[k] = HttpError(409, "Run o voce inesistente.")
+        return errors
+
+    # --- HTTP ---
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                    break
+                keep_alive, request, error = self._parse_head(head)
+                if request is not None:
+                    try:
+                        length = _int(request.headers.get("content-length", 0) or 0, "content-length")
+                        if length < 0:
+                            raise HttpError(400, "'content-length' non valido.")
+                        if length > MAX_BODY:
+                            raise HttpError(413, f"Corpo della richiesta oltre {MAX_BODY} byte.")
+                    except HttpError as exc:
+                        # Il corpo non si puo' saltare: si risponde e si chiude la connessione.
+                        self.stats.errori += 1
+                        error, keep_alive = _error(exc.status, str(exc)), False
+                    else:
+                        if length:
+                            request.body = await reader.readexactly(length)
+                status, body, ctype = error or await self._respond(request)  # type: ignore[arg-type]
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\nContent-Type: {ctype}\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode(
+                        "latin-1"
+                    )
+                    + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _parse_head(self, head: bytes) -> tuple[bool, Request | None, Response | None]:
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            return False, None, _error(400, "Richiesta non valida.")
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        conn = headers.get("connection", "").lower()
+        keep_alive = conn != "close" if version == "HTTP/1.1" else conn == "keep-alive"
+        url = urlsplit(target)
+        return keep_alive, Request(method.upper(), url.path.rstrip("/") or "/", dict(parse_qsl(url.query)), headers, b""), None
+
+    async def _respond(self, request: Request) -> Response:
+        self.stats.richieste += 1
+        try:
+            if self.token is not None:
+                auth = request.headers.get("authorization", "")
+                if not hmac.compare_digest(auth.encode(), f"Bearer {self.token}".encode()):
+                    raise HttpError(401, "Token mancante o non valido.")
+            handler, args = self._route(request)
+            name = handler.__name__.lstrip("_")
+            self.stats.per_rotta[name] = self.stats.per_rotta.get(name, 0) + 1
+            with profiling.span(f"server.{name}"):
+                return await handler(request, *args)
+        except HttpError as exc:
+            self.stats.errori += 1
+            return _error(exc.status, str(exc))
+        except ValueError as exc:
+            self.stats.errori += 1
+            return _error(400, str(exc))
+        except sqlite3.IntegrityError as exc:
+            self.stats.errori += 1
+            return _error(409, str(exc))
+        except Exception as exc:  # noqa: BLE001
+            self.stats.errori += 1
+            print(f"Errore su {request.method} {request.path}: {exc!r}", file=sys.stderr)
+            return _error(500, "Errore interno.")
+
+    def _route(self, request: Request) -> tuple[Handler, tuple[int, ...]]:
+        allowed = False
+        for method, pattern, handler in self._routes:
+            m = pattern.fullmatch(request.path)
+            if m is None:
+                continue
+            if method == request.method:
+                return handler, tuple(int(g) for g in m.groups())
+            allowed = True
+        if allowed:
+            raise HttpError(405, "Metodo non consentito.")
+        raise HttpError(404, "Risorsa inesistente.")
+
+    # --- rotte ---
+
+    async def _health(self, request: Request) -> Response:
+        s = self.stats
+        return _ok(
+            {
+                "ok": True,
+                "versione": APP_VERSIONE,
+                "schema": db.SCHEMA_VERSION,
+                "richieste": s.richieste,
+                "errori": s.errori,
+                "esiti": s.esiti,
+                "transazioni_esiti": s.transazioni,
+                "lotto_max": s.lotto_max,
+                "coda_scritture": self._writes.qsize() if self._writes is not None else 0,
+                "per_rotta": s.per_rotta,
+            }
+        )
+
+    async def _list_projects(self, request: Request) -> Response:
+        after, limit = _page_args(request.query)
+        cliente, sito = request.query.get("cliente"), request.query.get("sito")
+
+        def page(con: sqlite3.Connection) -> dict:
+            projects, nxt = db.list_projects_page(con, after, limit, cliente, sito)
+            return {"projects": projects, "next": _cursor(nxt)}
+
+        return 200, await self.read(page), _JSON
+
+    async def _create_project(self, request: Request) -> Response:
+        obj = request.json()
+        nome = str(obj.get("nome") or "").strip()
+        if not nome:
+            raise HttpError(400, "'nome' obbligatorio.")
+        pid = await self.write(
+            db.create_project, nome, str(obj.get("cliente") or ""), str(obj.get("sito") or ""), str(obj.get("note") or "")
+        )
+        return _ok({"id": pid}, 201)
+
+    async def _get_project(self, request: Request, project_id: int) -> Response:
+        return 200, await self.read(db.get_project, project_id), _JSON
+
+    async def _list_checklist(self, request: Request, project_id: int) -> Response:
+        return 200, await self.read(db.list_checklist, project_id), _JSON
+
+    async def _put_checklist(self, request: Request, project_id: int) -> Response:
+        # {"items": [...], "sync": true} aggiorna mantenendo gli esiti (come import-checklist --sync).
+        obj = request.json()
+        rows = _checklist_rows(obj)
+        await self.read(db.get_project, project_id)  # 404 se non esiste
+        if obj.get("sync"):
+            result = await self.write(db.sync_checklist, project_id, rows)
+            return _ok(result)
+        return _ok({"voci": await self.write(db.replace_checklist, project_id, rows)})
+
+    async def _list_runs(self, request: Request, project_id: int) -> Response:
+        after, limit = _page_args(request.query)
+
+        def page(con: sqlite3.Connection) -> dict:
+            runs, nxt = db.list_runs_page(con, project_id, after, limit)
+            return {"runs": runs, "next": _cursor(nxt)}
+
+        return 200, await self.read(page), _JSON
+
+    async def _create_run(self, request: Request, project_id: int) -> Response:
+        obj = request.json()
+        nome = str(obj.get("nome") or "").strip()
+        if not nome:
+            raise HttpError(400, "'nome' obbligatorio.")
+        rid = await self.write(db.create_run, project_id, nome, str(obj.get("operatore") or ""))
+        return _ok({"id": rid}, 201)
+
+    async def _summaries(self, request: Request, project_id: int) -> Response:
+        def summaries(con: sqlite3.Connection) -> list[dict]:
+            return [{**_jsonable(s), "n_todo": s.n_todo} for s in db.get_run_summaries(con, project_id)]
+
+        return 200, await self.read(summaries), _JSON
+
+    async def _get_run(self, request: Request, run_id: int) -> Response:
+        return 200, await self.read(db.get_run, run_id), _JSON
+
+    async def _close_run(self, request: Request, run_id: int) -> Response:
+        await self.read(db.get_run, run_id)
+        await self.write(db.close_run, run_id)
+        return _ok({"ok": True})
+
+    async def _get_results(self, request: Request, run_id: int) -> Response:
+        def results(con: sqlite3.Connection) -> list[dict]:
+            progress = db.get_run_progress(con, run_id)
+            return [{"checklist_item_id": item_id, **r} for item_id, r in progress.items()]
+
+        return 200, await self.read(results), _JSON
+
+    async def _post_results(self, request: Request, run_id: int) -> Response:
+        rows = _result_rows(run_id, request.json())
+        return _ok({"registrati": await self.write_results(rows)})
+
+    async def _report(self, request: Request, run_id: int) -> Response:
+        fmt = request.query.get("format", "md")
+        if fmt not in _REPORT_TYPES:
+            raise HttpError(400, f"Formato non valido: {fmt} (md, html, csv, json).")
+
+        def render(con: sqlite3.Connection) -> bytes | None:
+            from gestione_collaudo.export import load_report_model
+            from gestione_collaudo.reports import RENDERERS
+
+            run = db.get_run(con, run_id)
+            model = load_report_model(con, run.project_id, run_id) if run else None
+            if model is None:
+                return None
+            out = io.StringIO()
+            RENDERERS[fmt](model, out)
+            return out.getvalue().encode("utf-8")
+
+        return 200, await self.read(render), _REPORT_TYPES[fmt]
+
+
+def _error(status: int, message: str) -> Response:
+    return status, encode({"errore": message}), _JSON
+
+
+def _settle(fut: asyncio.Future, result: Any = None, exc: BaseException | None = None) -> None:
+    # Il client puo' essersi disconnesso (future annullato) mentre la scrittura era in corso.
+    if fut.done():
+        return
+    if exc is not None:
+        fut.set_exception(exc)
+    else:
+        fut.set_result(result)
+
+
+async def serve(
+    server: Server,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    on_ready: Callable[[str, int], None] | None = None,
+) -> None:
+    # Fino a cancellazione (Ctrl+C, o SIGTERM dove il ciclo degli eventi lo supporta);
+    # le scritture gia' accettate vengono completate prima di uscire.
+    task = asyncio.current_task()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)  # type: ignore[union-attr]
+    except (NotImplementedError, RuntimeError):
+        pass  # Windows
+    bound = await server.start(host, port)
+    if on_ready is not None:
+        on_ready(*bound)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
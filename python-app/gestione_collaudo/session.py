@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import sqlite3
+
+from gestione_collaudo import db
+from gestione_collaudo.models import ChecklistItem, ItemResult, Run, RunProgress
+
+
+class RunSession:
+    # Stato in memoria di un run attivo (checklist + esiti) per frontend che lo consultano spesso:
+    # le letture sono ricerche in memoria (RunProgress), le scritture fatte da qui aggiornano lo stato.
+    # Lo stato e' scaduto quando cambia PRAGMA data_version (commit di un'altra connessione, anche
+    # di un altro processo) o total_changes (altre scritture fatte con questa stessa connessione).
+    # I metodi che toccano il DB vanno chiamati dal thread che possiede la connessione; `item`,
+    # `progress_of` e gli attributi si possono leggere anche da altri thread.
+    def __init__(self, con: sqlite3.Connection, run_id: int) -> None:
+        self.con = con
+        self.run_id = run_id
+        self.run: Run | None = None
+        self.checklist: list[ChecklistItem] = []
+        self.progress = RunProgress()
+        self._items: dict[int, ChecklistItem] = {}
+        self._stamp: tuple[int, int] | None = None
+
+    @property
+    def project_id(self) -> int:
+        return self.run.project_id if self.run else 0
+
+    def load(self) -> None:
+        stamp = self._read_stamp()
+        run = db.get_run(self.con, self.run_id)
+        checklist = db.list_checklist(self.con, run.project_id) if run else []
+        progress = db.load_run_progress(self.con, self.run_id) if run else RunProgress()
+        # Assegnazioni in blocco: chi legge da un altro thread vede lo stato vecchio o quello nuovo.
+        self.run = run
+        self.checklist = checklist
+        self._items = {it.id: it for it in checklist}
+        self.progress = progress
+        self._stamp = stamp
+
+    def is_stale(self) -> bool:
+        return self._stamp is None or self._read_stamp() != self._stamp
+
+    def refresh(self) -> bool:
+        # Ricarica solo se qualcuno ha scritto nel DB dall'ultimo caricamento; True se ha ricaricato.
+        if not self.is_stale():
+            return False
+        self.load()
+        return True
+
+    def invalidate(self) -> None:
+        self._stamp = None
+
+    def item(self, checklist_item_id: int) -> ChecklistItem | None:
+        return self._items.get(checklist_item_id)
+
+    def progress_of(self, checklist_item_id: int) -> ItemResult | None:
+        return self.progress.get(checklist_item_id)
+
+    def set_esito(self, checklist_item_id: int, esito: str, note: str = "") -> ItemResult | None:
+        # Scrive l'esito e aggiorna solo quella voce; se nel frattempo altri hanno scritto,
+        # lo stato resta scaduto e il prossimo refresh lo ricarica tutto.
+        before = self._read_stamp()
+        db.set_run_item(self.con, self.run_id, checklist_item_id, esito, note)
+        p = db.get_run_item_progress(self.con, self.run_id, checklist_item_id)
+        if p is not None:
+            # Modifica su una copia poi sostituita: chi legge non vede mai gli array a meta'.
+            progress = self.progress.copy()
+            progress.set(checklist_item_id, p.esito, p.note, p.timestamp)
+            self.progress = progress
+        after = self._read_stamp()
+        # data_version non cambia per i commit di questa connessione: se e' rimasto uguale
+        # l'unica scrittura e' la nostra, gia' applicata.
+        if before == self._stamp and after[0] == before[0]:
+            self._stamp = after
+        return p
+
+    def _read_stamp(self) -> tuple[int, int]:
+        return int(self.con.execute("PRAGMA data_version").fetchone()[0]), self.con.total_changes
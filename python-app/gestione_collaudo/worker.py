@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Callable
+
+from gestione_collaudo import db, profiling
+
+# Tempo massimo (secondi) che `poll` dedica ai risultati a ogni giro: il resto del frame resta alla UI.
+POLL_BUDGET = 0.008
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class Task:
+    # Lavoro eseguito sul thread del DB. `fn(con, task)` puo' chiamare `task.progress(valore)`:
+    # il valore arriva a `on_progress` sul thread della UI e, se il task e' stato annullato,
+    # la chiamata solleva TaskCancelled (dentro db.transaction la transazione viene annullata).
+    def __init__(
+        self,
+        fn: Callable[[sqlite3.Connection, Task], Any],
+        key: str | None,
+        on_done: Callable[[Any], None] | None,
+        on_error: Callable[[Exception], None] | None,
+        on_progress: Callable[[Any], None] | None,
+        results: queue.SimpleQueue,
+    ) -> None:
+        self.fn = fn
+        self.key = key
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self._results = results
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def check(self) -> None:
+        if self._cancel.is_set():
+            raise TaskCancelled()
+
+    def progress(self, value: Any) -> None:
+        self.check()
+        if self.on_progress is not None:
+            self._results.put((self, self.on_progress, value))
+
+
+class DbWorker:
+    # Un thread dedicato possiede la connessione SQLite (i Connection non si passano tra thread);
+    # la UI accoda lavori con `submit` e raccoglie i risultati chiamando `poll` (es. da Tk.after).
+    # I lavori con la stessa `key` ancora in coda vengono accorpati: resta solo l'ultimo.
+    def __init__(self, db_path: str = "") -> None:
+        self.db_path = db_path
+        self._tasks: queue.SimpleQueue = queue.SimpleQueue()
+        self._results: queue.SimpleQueue = queue.SimpleQueue()
+        self._latest: dict[str, Task] = {}
+        self._lock = threading.Lock()
+        self._current: Task | None = None
+        self._con: sqlite3.Connection | None = None
+        self._con_path = ""
+        self._thread = threading.Thread(target=self._loop, name="gestione-collaudo-db", daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        fn: Callable[[sqlite3.Connection, Task], Any],
+        key: str | None = None,
+        on_done: Callable[[Any], None] | None = None,
+        on_error: Callable[[Exception], None] | None = None,
+        on_progress: Callable[[Any], None] | None = None,
+    ) -> Task:
+        task = Task(fn, key, on_done, on_error, on_progress, self._results)
+        if key is not None:
+            with self._lock:
+                self._latest[key] = task
+        self._tasks.put((self.db_path, task))
+        return task
+
+    def poll(self, budget: float = POLL_BUDGET) -> int:
+        # Esegue le callback dei risultati pronti sul thread chiamante, entro `budget` secondi.
+        deadline = time.perf_counter() + budget
+        n = 0
+        while True:
+            try:
+                task, callback, value = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if callback is not None and not (task.cancelled and callback is task.on_progress):
+                callback(value)
+            n += 1
+            if time.perf_counter() >= deadline:
+                break
+        return n
+
+    @property
+    def busy(self) -> bool:
+        return self._current is not None
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._current is not None:
+            self._current.cancel()
+        self._tasks.put(None)
+        self._thread.join(timeout)
+
+    def _loop(self) -> None:
+        while True:
+            item = self._tasks.get()
+            if item is None:
+                break
+            path, task = item
+            if task.key is not None:
+                with self._lock:
+                    if self._latest.get(task.key) is not task:
+                        continue  # superato da una richiesta piu' recente
+                    del self._latest[task.key]
+            if task.cancelled:
+                continue
+            self._current = task
+            try:
+                with profiling.span(f"worker.{task.key or task.fn.__qualname__}"):
+                    result = task.fn(self._connection(path), task)
+            except Exception as exc:  # noqa: BLE001  (TaskCancelled compreso)
+                self._results.put((task, task.on_error, exc))
+            else:
+                self._results.put((task, task.on_done, result))
+            finally:
+                self._current = None
+        if self._con is not None:
+            self._con.close()
+
+    def _connection(self, path: str) -> sqlite3.Connection:
+        if self._con is None or path != self._con_path:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+            self._con = db.connect(path)
+            self._con_path = path
+        return self._con